@@ -15,14 +15,17 @@ from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stre
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
 from utils.config import config
-from sandbox.sandbox import create_sandbox, delete_sandbox, get_or_start_sandbox
+from sandbox.sandbox import delete_sandbox, get_or_start_sandbox
+from sandbox.pool import get_sandbox_pool
 from services.llm import make_llm_api_call
 from agent.run_agent import run_agent_run_stream, update_agent_run_status, get_stream_context
+from agent.stop_signals import send_stop_signal
 from utils.constants import MODEL_NAME_ALIASES
 from flags.flags import is_enabled
 
-from .config_helper import extract_agent_config, build_unified_config, extract_tools_for_agent_run, get_mcp_configs
+from .config_helper import build_unified_config, extract_tools_for_agent_run, get_mcp_configs
 from .utils import check_for_active_project_agent_run
+from .config_resolver import get_agent_config_resolver
 
 # Initialize shared resources
 router = APIRouter()
@@ -173,8 +176,7 @@ async def cleanup():
 async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None):
     """Update database and publish stop signal to Redis."""
     logger.info(f"Stopping agent run: {agent_run_id}")
-    stop_redis_key = f"stop_signal:{agent_run_id}"
-    await redis.client.set(stop_redis_key, "STOP", ex=redis.REDIS_KEY_TTL)
+    await send_stop_signal(agent_run_id)
     
     final_status = "failed" if error_message else "stopped"
     client = await db.client
@@ -233,14 +235,13 @@ async def start_agent(
     client = await db.client
 
     await verify_thread_access(client, thread_id, user_id)
-    thread_result = await client.table('threads').select('project_id', 'account_id', 'agent_id', 'metadata').eq('thread_id', thread_id).execute()
-    if not thread_result.data:
+    run_context = await get_agent_config_resolver().resolve_run_context(thread_id, body.agent_id)
+    if not run_context:
         raise HTTPException(status_code=404, detail="Thread not found")
-    thread_data = thread_result.data[0]
-    project_id = thread_data.get('project_id')
-    account_id = thread_data.get('account_id')
-    thread_agent_id = thread_data.get('agent_id')
-    thread_metadata = thread_data.get('metadata', {})
+    project_id = run_context.project_id
+    account_id = run_context.account_id
+    thread_agent_id = run_context.thread_agent_id
+    thread_metadata = run_context.thread_metadata
 
     structlog.contextvars.bind_contextvars(
         project_id=project_id,
@@ -250,47 +251,22 @@ async def start_agent(
     )
     
     # Check if this is an agent builder thread
-    is_agent_builder = thread_metadata.get('is_agent_builder', False)
-    target_agent_id = thread_metadata.get('target_agent_id')
+    is_agent_builder = run_context.is_agent_builder
+    target_agent_id = run_context.target_agent_id
     
     if is_agent_builder:
         logger.info(f"Thread {thread_id} is in agent builder mode, target_agent_id: {target_agent_id}")
     
-    # Load agent configuration with version support
-    agent_config = None
-    effective_agent_id = body.agent_id or thread_agent_id  # Use provided agent_id or the one stored in thread
-    
-    if effective_agent_id:
-        # Get agent with current version
-        agent_result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('agent_id', effective_agent_id).eq('account_id', account_id).execute()
-        if not agent_result.data:
-            if body.agent_id:
-                raise HTTPException(status_code=404, detail="Agent not found or access denied")
-            else:
-                logger.warning(f"Stored agent_id {effective_agent_id} not found, falling back to default")
-                effective_agent_id = None
+    # Agent configuration with version support, falling back to the default agent
+    agent_config = run_context.agent_config
+    if body.agent_id and (not agent_config or agent_config['agent_id'] != body.agent_id):
+        raise HTTPException(status_code=404, detail="Agent not found or access denied")
+
+    if agent_config:
+        if agent_config.get('version_name'):
+            logger.info(f"Using agent {agent_config['name']} ({agent_config['agent_id']}) version {agent_config['version_name']}")
         else:
-            agent_data = agent_result.data[0]
-            version_data = agent_data.get('agent_versions')
-            agent_config = extract_agent_config(agent_data, version_data)
-            
-            if version_data:
-                logger.info(f"Using agent {agent_config['name']} ({effective_agent_id}) version {agent_config.get('version_name', 'v1')}")
-            else:
-                logger.info(f"Using agent {agent_config['name']} ({effective_agent_id}) - no version data")
-            source = "request" if body.agent_id else "thread"
-    
-    if not agent_config:
-        default_agent_result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('account_id', account_id).eq('is_default', True).execute()
-        if default_agent_result.data:
-            agent_data = default_agent_result.data[0]
-            version_data = agent_data.get('agent_versions')
-            agent_config = extract_agent_config(agent_data, version_data)
-            
-            if version_data:
-                logger.info(f"Using default agent: {agent_config['name']} ({agent_config['agent_id']}) version {agent_config.get('version_name', 'v1')}")
-            else:
-                logger.info(f"Using default agent: {agent_config['name']} ({agent_config['agent_id']}) - no version data")
+            logger.info(f"Using agent {agent_config['name']} ({agent_config['agent_id']}) - no version data")
     
     if body.agent_id and body.agent_id != thread_agent_id and agent_config:
         logger.info(f"Using agent {agent_config['agent_id']} for this agent run (thread remains agent-agnostic)")
@@ -309,13 +285,10 @@ async def start_agent(
         await stop_agent_run(active_run_id)
 
     try:
-        # Get project data to find sandbox ID
-        project_result = await client.table('projects').select('*').eq('project_id', project_id).execute()
-        if not project_result.data:
+        if not run_context.project_found:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        project_data = project_result.data[0]
-        sandbox_info = project_data.get('sandbox', {})
+        sandbox_info = run_context.sandbox
         if not sandbox_info.get('id'):
             raise HTTPException(status_code=404, detail="No sandbox found for this project")
             
@@ -544,46 +517,19 @@ async def stream_agent_run(
         # Get necessary data from database
         thread_id = agent_run_data['thread_id']
         
-        # Get thread data including project_id and metadata
-        thread_result = await client.table('threads').select('project_id', 'account_id', 'agent_id', 'metadata').eq('thread_id', thread_id).execute()
-        if not thread_result.data:
+        # Get thread, project and agent configuration
+        run_context = await get_agent_config_resolver().resolve_run_context(
+            thread_id, agent_run_data.get('agent_id'), use_default=False
+        )
+        if not run_context:
             logger.error(f"Thread {thread_id} not found for agent run {agent_run_id}")
             return
         
-        thread_data = thread_result.data[0]
-        project_id = thread_data.get('project_id')
-        account_id = thread_data.get('account_id')
-        thread_agent_id = thread_data.get('agent_id')
-        thread_metadata = thread_data.get('metadata', {})
-        
-        # Check if this is an agent builder thread
-        is_agent_builder = thread_metadata.get('is_agent_builder', False)
-        target_agent_id = thread_metadata.get('target_agent_id')
-        
-        # Get agent configuration
-        agent_config = None
-        effective_agent_id = agent_run_data.get('agent_id') or thread_agent_id
-        
-        if effective_agent_id:
-            agent_result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('agent_id', effective_agent_id).eq('account_id', account_id).execute()
-            if agent_result.data:
-                agent_data = agent_result.data[0]
-                if agent_data.get('agent_versions'):
-                    version_data = agent_data['agent_versions']
-                    agent_config = {
-                        'agent_id': agent_data['agent_id'],
-                        'name': agent_data['name'],
-                        'description': agent_data.get('description'),
-                        'system_prompt': version_data['system_prompt'],
-                        'configured_mcps': version_data.get('configured_mcps', []),
-                        'custom_mcps': version_data.get('custom_mcps', []),
-                        'agentpress_tools': version_data.get('agentpress_tools', {}),
-                        'is_default': agent_data.get('is_default', False),
-                        'current_version_id': agent_data.get('current_version_id'),
-                        'version_name': version_data.get('version_name', 'v1')
-                    }
-                else:
-                    agent_config = agent_data
+        project_id = run_context.project_id
+        account_id = run_context.account_id
+        is_agent_builder = run_context.is_agent_builder
+        target_agent_id = run_context.target_agent_id
+        agent_config = run_context.agent_config
         
         # Get streaming parameters from the agent run metadata
         metadata = agent_run_data.get('metadata', {})
@@ -610,14 +556,11 @@ async def stream_agent_run(
         
         # Ensure sandbox is running
         try:
-            # Get project data to find sandbox ID
-            project_result = await client.table('projects').select('*').eq('project_id', project_id).execute()
-            if not project_result.data:
+            if not run_context.project_found:
                 logger.error(f"Project {project_id} not found for agent run {agent_run_id}")
                 return
             
-            project_data = project_result.data[0]
-            sandbox_info = project_data.get('sandbox', {})
+            sandbox_info = run_context.sandbox
             if not sandbox_info.get('id'):
                 logger.error(f"No sandbox found for project {project_id} in agent run {agent_run_id}")
                 return
@@ -772,21 +715,9 @@ async def initiate_agent_with_files(
         # 2. Create Sandbox
         sandbox_id = None
         try:
-          sandbox_pass = str(uuid.uuid4())
-          sandbox = await create_sandbox(sandbox_pass, project_id)
-          sandbox_id = sandbox.id
-          logger.info(f"Created new sandbox {sandbox_id} for project {project_id}")
-          
-          # Get preview links
-          vnc_link = await sandbox.get_preview_link(6080)
-          website_link = await sandbox.get_preview_link(8080)
-          vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-          website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-          token = None
-          if hasattr(vnc_link, 'token'):
-              token = vnc_link.token
-          elif "token='" in str(vnc_link):
-              token = str(vnc_link).split("token='")[1].split("'")[0]
+          pooled_sandbox = await get_sandbox_pool().acquire(project_id)
+          sandbox_id = pooled_sandbox.id
+          logger.info(f"Got sandbox {sandbox_id} for project {project_id}")
         except Exception as e:
             logger.error(f"Error creating sandbox: {str(e)}")
             await client.table('projects').delete().eq('project_id', project_id).execute()
@@ -798,10 +729,7 @@ async def initiate_agent_with_files(
 
         # Update project with sandbox info
         update_result = await client.table('projects').update({
-            'sandbox': {
-                'id': sandbox_id, 'pass': sandbox_pass, 'vnc_preview': vnc_url,
-                'sandbox_url': website_url, 'token': token
-            }
+            'sandbox': pooled_sandbox.to_project_sandbox()
         }).eq('project_id', project_id).execute()
 
         if not update_result.data:
@@ -856,6 +784,11 @@ async def initiate_agent_with_files(
         if files:
             successful_uploads = []
             failed_uploads = []
+            try:
+                sandbox = await get_or_start_sandbox(sandbox_id)
+            except Exception as e:
+                logger.error(f"Error getting sandbox {sandbox_id} to upload files: {str(e)}")
+                sandbox = None
             for file in files:
                 if file.filename:
                     try:
@@ -1237,6 +1170,7 @@ async def create_agent(
         # If this is set as default, we need to unset other defaults first
         if agent_data.is_default:
             await client.table('agents').update({"is_default": False}).eq("account_id", user_id).eq("is_default", True).execute()
+            await get_agent_config_resolver().invalidate(account_id=user_id)
         
         # Build unified config
         unified_config = build_unified_config(
@@ -1572,6 +1506,9 @@ async def update_agent(
                 logger.error(f"Error updating agent {agent_id}: {str(e)}")
                 raise HTTPException(status_code=500, detail=f"Failed to update agent: {str(e)}")
         
+        # May have changed the account's default agent, so drop all of its cached configs
+        await get_agent_config_resolver().invalidate(agent_id, account_id=user_id)
+        
         # Fetch the updated agent data with version info
         updated_agent = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq("agent_id", agent_id).eq("account_id", user_id).maybe_single().execute()
         
@@ -1657,6 +1594,7 @@ async def delete_agent(agent_id: str, user_id: str = Depends(get_current_user_id
         
         # Delete the agent
         await client.table('agents').delete().eq('agent_id', agent_id).execute()
+        await get_agent_config_resolver().invalidate(agent_id)
         
         logger.info(f"Successfully deleted agent: {agent_id}")
         return {"message": "Agent deleted successfully"}
@@ -1807,6 +1745,7 @@ async def create_agent_version(
         "current_version_id": version['version_id'],
         "version_count": next_version_number
     }).eq("agent_id", agent_id).execute()
+    await get_agent_config_resolver().invalidate(agent_id)
     
     logger.info(f"Created version v{next_version_number} for agent {agent_id}")
     
@@ -1835,6 +1774,7 @@ async def activate_agent_version(
     await client.table('agents').update({
         "current_version_id": version_id
     }).eq("agent_id", agent_id).execute()
+    await get_agent_config_resolver().invalidate(agent_id)
     
     return {"message": "Version activated successfully"}
 
@@ -0,0 +1,229 @@
+"""
+Cached resolution of agent configs for agent runs.
+
+Agent configs are built with extract_agent_config and cached per
+(agent_id, current_version_id) in an LRU with a TTL. Writes to an agent or its
+versions call invalidate, which drops local entries and records the time of the
+invalidation in Redis so other processes drop theirs on the next lookup.
+"""
+
+import copy
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Tuple, List
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+from .config_helper import extract_agent_config
+
+INVALIDATION_KEY_PREFIX = "agent_config_invalidated"
+
+
+@dataclass
+class RunContext:
+    """Everything needed to start an agent run on a thread."""
+    thread_id: str
+    project_id: Optional[str]
+    account_id: Optional[str]
+    thread_agent_id: Optional[str]
+    thread_metadata: Dict[str, Any]
+    sandbox: Dict[str, Any]
+    project_found: bool
+    agent_config: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_agent_builder(self) -> bool:
+        return self.thread_metadata.get('is_agent_builder', False)
+
+    @property
+    def target_agent_id(self) -> Optional[str]:
+        return self.thread_metadata.get('target_agent_id')
+
+
+@dataclass
+class _Entry:
+    value: Any
+    loaded_at: float = field(default_factory=time.time)
+
+
+class AgentConfigResolver:
+    """Resolves thread -> project -> sandbox -> agent config with cached agent configs.
+
+    On a warm cache, resolving a run context takes one DB round trip (the thread joined
+    with its project) and one Redis round trip to check for invalidations.
+    """
+
+    def __init__(self, db: DBConnection, max_entries: int, ttl: int):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._configs: "OrderedDict[Tuple[str, Optional[str]], _Entry]" = OrderedDict()
+        self._current_versions: Dict[str, _Entry] = {}  # agent_id -> current_version_id
+        self._default_agents: Dict[str, _Entry] = {}  # account_id -> default agent_id
+
+    def _invalidation_key(self, kind: str, id: str) -> str:
+        return f"{INVALIDATION_KEY_PREFIX}:{kind}:{id}"
+
+    async def _invalidated_at(self, agent_id: Optional[str], account_id: Optional[str]) -> float:
+        """Latest time the agent or the account's agents were invalidated by any process."""
+        keys = []
+        if agent_id:
+            keys.append(self._invalidation_key('agent', agent_id))
+        if account_id:
+            keys.append(self._invalidation_key('account', account_id))
+        if not keys:
+            return 0.0
+        try:
+            redis_client = await redis.get_client()
+            values = await redis_client.mget(keys)
+        except Exception as e:
+            logger.warning(f"Failed to check agent config invalidations, relying on TTL: {str(e)}")
+            return 0.0
+        return max((float(value) for value in values if value), default=0.0)
+
+    def _is_fresh(self, entry: Optional[_Entry], invalidated_at: float) -> bool:
+        return entry is not None and time.time() - entry.loaded_at <= self.ttl and entry.loaded_at > invalidated_at
+
+    def _store_config(self, agent_config: Dict[str, Any]) -> None:
+        agent_id = agent_config['agent_id']
+        version_id = agent_config.get('current_version_id')
+        self._current_versions[agent_id] = _Entry(version_id)
+        self._configs[(agent_id, version_id)] = _Entry(agent_config)
+        self._configs.move_to_end((agent_id, version_id))
+        while len(self._configs) > self.max_entries:
+            (evicted_agent_id, _), _ = self._configs.popitem(last=False)
+            self._current_versions.pop(evicted_agent_id, None)
+
+    def _load_config(self, agent_data: Dict[str, Any]) -> Dict[str, Any]:
+        agent_config = extract_agent_config(agent_data, agent_data.get('agent_versions'))
+        self._store_config(agent_config)
+        return agent_config
+
+    async def get_agent_config(self, agent_id: str, account_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get the config of an agent at its current version.
+
+        Args:
+            agent_id: ID of the agent.
+            account_id: If given, only return the agent if it belongs to this account.
+
+        Returns:
+            A copy of the agent config, or None if the agent was not found.
+        """
+        invalidated_at = await self._invalidated_at(agent_id, account_id)
+        version = self._current_versions.get(agent_id)
+        if self._is_fresh(version, invalidated_at):
+            entry = self._configs.get((agent_id, version.value))
+            if self._is_fresh(entry, invalidated_at):
+                self._configs.move_to_end((agent_id, version.value))
+                if account_id and entry.value.get('account_id') != account_id:
+                    return None
+                return copy.deepcopy(entry.value)
+
+        client = await self.db.client
+        query = client.table('agents').select('*, agent_versions!current_version_id(*)').eq('agent_id', agent_id)
+        if account_id:
+            query = query.eq('account_id', account_id)
+        result = await query.execute()
+        if not result.data:
+            return None
+        return copy.deepcopy(self._load_config(result.data[0]))
+
+    async def get_default_agent_config(self, account_id: str) -> Optional[Dict[str, Any]]:
+        """Get the config of the default agent of an account, or None if it has none."""
+        invalidated_at = await self._invalidated_at(None, account_id)
+        default_agent = self._default_agents.get(account_id)
+        if self._is_fresh(default_agent, invalidated_at):
+            return await self.get_agent_config(default_agent.value, account_id)
+
+        client = await self.db.client
+        result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('account_id', account_id).eq('is_default', True).execute()
+        if not result.data:
+            return None
+        agent_config = self._load_config(result.data[0])
+        self._default_agents[account_id] = _Entry(agent_config['agent_id'])
+        return copy.deepcopy(agent_config)
+
+    async def resolve_run_context(self, thread_id: str, agent_id: Optional[str] = None, use_default: bool = True) -> Optional[RunContext]:
+        """Resolve the project, sandbox and agent config for a run on a thread.
+
+        Args:
+            thread_id: ID of the thread.
+            agent_id: Agent requested for the run. Defaults to the agent stored on the thread.
+            use_default: Fall back to the account's default agent if the agent is not found.
+
+        Returns:
+            The run context, or None if the thread was not found.
+        """
+        client = await self.db.client
+        thread_result = await client.table('threads').select(
+            'project_id, account_id, agent_id, metadata, projects(sandbox)'
+        ).eq('thread_id', thread_id).execute()
+        if not thread_result.data:
+            return None
+
+        thread_data = thread_result.data[0]
+        project_data = thread_data.get('projects')
+        context = RunContext(
+            thread_id=thread_id,
+            project_id=thread_data.get('project_id'),
+            account_id=thread_data.get('account_id'),
+            thread_agent_id=thread_data.get('agent_id'),
+            thread_metadata=thread_data.get('metadata') or {},
+            sandbox=(project_data or {}).get('sandbox') or {},
+            project_found=project_data is not None,
+        )
+
+        effective_agent_id = agent_id or context.thread_agent_id
+        if effective_agent_id:
+            context.agent_config = await self.get_agent_config(effective_agent_id, context.account_id)
+            if not context.agent_config:
+                logger.warning(f"Agent {effective_agent_id} not found for thread {thread_id}")
+        if not context.agent_config and use_default and context.account_id:
+            context.agent_config = await self.get_default_agent_config(context.account_id)
+        return context
+
+    async def invalidate(self, agent_id: Optional[str] = None, account_id: Optional[str] = None) -> None:
+        """Drop cached configs after an agent or its versions were written.
+
+        Pass account_id when the write may change which agent is the account's
+        default; this drops the configs of all agents of the account.
+        """
+        now = time.time()
+        if agent_id:
+            self._current_versions.pop(agent_id, None)
+            for key in [key for key in self._configs if key[0] == agent_id]:
+                del self._configs[key]
+        if account_id:
+            self._default_agents.pop(account_id, None)
+            for key in [key for key, entry in self._configs.items() if entry.value.get('account_id') == account_id]:
+                self._current_versions.pop(key[0], None)
+                del self._configs[key]
+
+        keys: List[str] = []
+        if agent_id:
+            keys.append(self._invalidation_key('agent', agent_id))
+        if account_id:
+            keys.append(self._invalidation_key('account', account_id))
+        try:
+            for key in keys:
+                await redis.set(key, str(now), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to publish agent config invalidation: {str(e)}")
+
+
+_resolver: Optional[AgentConfigResolver] = None
+
+
+def get_agent_config_resolver() -> AgentConfigResolver:
+    """Get the process-wide agent config resolver."""
+    global _resolver
+    if _resolver is None:
+        _resolver = AgentConfigResolver(
+            DBConnection(),
+            max_entries=config.AGENT_CONFIG_CACHE_MAX_ENTRIES,
+            ttl=config.AGENT_CONFIG_CACHE_TTL,
+        )
+    return _resolver
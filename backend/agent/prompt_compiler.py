@@ -0,0 +1,343 @@
+"""
+Cached system prompt compilation for agent runs.
+
+The system prompt of a run only depends on the agent version, the model family,
+the registered tools and the schemas of the MCP tools, so it is compiled once per
+combination of those and cached in memory and in Redis. Reusing the same compiled
+text keeps the system prompt byte-identical across runs and workers, which lets
+Anthropic prompt caching hit on it. Per-run context (e.g. knowledge base entries)
+must be appended after the compiled prompt.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
+
+from agent.prompt import get_system_prompt
+from agent.gemini_prompt import get_gemini_system_prompt
+from agent.agent_builder_prompt import get_agent_builder_prompt
+from agent.tools.mcp_tool_wrapper import MCPToolWrapper
+from agentpress.tool import SchemaType
+from agentpress.tool_registry import ToolRegistry
+from services import redis
+from utils.logger import logger
+
+PROMPT_CACHE_VERSION = 1  # Bump whenever the assembly below changes
+PROMPT_CACHE_TTL = 3600 * 24
+PROMPT_CACHE_MAX_ENTRIES = 256
+
+
+def extract_essential_sections(default_prompt: str) -> str:
+    """Extract essential sections from the default prompt to preserve critical functionality."""
+    essential_sections = []
+    
+    # Workflow management (TODO functionality)
+    workflow_section = """
+<workflow_management>
+  <mandatory_todo>
+    <rule>ALWAYS create TODO.md as first step for any task</rule>
+    <rule>Break complex tasks into actionable items with [ ] checkboxes</rule>
+    <rule>Update progress by marking [x] completed items</rule>
+    <rule>Work through TODO items systematically</rule>
+    <rule>Use 'complete' tool only when ALL tasks are marked [x]</rule>
+  </mandatory_todo>
+  
+  <reasoning_protocol>
+    <step_0>CREATE TODO: Always start by creating/updating TODO.md</step_0>
+    <step_1>UNDERSTAND: Analyze the user's request</step_1>
+    <step_2>PLAN: Break down into actionable steps in TODO.md</step_2>
+    <step_3>EXECUTE: Work through TODO items systematically</step_3>
+    <step_4>VERIFY: Confirm completion before finishing</step_4>
+  </reasoning_protocol>
+</workflow_management>
+"""
+    essential_sections.append(workflow_section)
+    
+    # Critical tool usage rules
+    tool_rules_section = """
+<tool_usage_critical>
+  <ask_tool>
+    <rule>NEVER use ask tool with empty content</rule>
+    <rule>Always provide meaningful text when using ask</rule>
+    <example>✅ CORRECT: <ask>I've completed the analysis. Would you like me to create a detailed report?</ask></example>
+    <example>❌ WRONG: <ask></ask></example>
+  </ask_tool>
+  
+  <str_replace_tool>
+    <rule>Include 3-5 lines of context before and after changes</rule>
+    <rule>Ensure unique identification of replacement target</rule>
+    <rule>For files >1000 lines, use incremental approach</rule>
+  </str_replace_tool>
+  
+  <large_file_strategy>
+    <rule>For files >1000 lines or 20+ items: create outline first</rule>
+    <rule>Build content incrementally using str_replace</rule>
+    <rule>Never attempt to create entire large documents in one call</rule>
+  </large_file_strategy>
+</tool_usage_critical>
+"""
+    essential_sections.append(tool_rules_section)
+    
+    # Response format requirements
+    response_format_section = """
+<response_templates>
+  <task_initiation>
+    <format>
+## 🎯 Understanding the Task
+[Brief summary of what user wants]
+
+## 📋 My Plan (TODO.md)
+[Create TODO.md with specific actionable items]
+
+## 🚀 Starting Execution
+[Begin with first tool]
+    </format>
+  </task_initiation>
+</response_templates>
+"""
+    essential_sections.append(response_format_section)
+    
+    return "\n".join(essential_sections)
+
+
+def get_prompt_family(model_name: str) -> str:
+    """Get the family of a model as far as the system prompt is concerned."""
+    model_lower = model_name.lower()
+    if "gemini-2.5-flash" in model_lower and "gemini-2.5-pro" not in model_lower:
+        return "gemini_flash"
+    if "anthropic" in model_lower:
+        return "anthropic"
+    return "default"
+
+
+@lru_cache(maxsize=1)
+def _get_sample_response() -> str:
+    sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
+    with open(sample_response_path, 'r') as file:
+        return file.read()
+
+
+def _get_mcp_schemas(mcp_wrapper_instance: Optional[MCPToolWrapper]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Get the OpenAPI schemas of the dynamic MCP tools, or an empty list if MCP is not initialized."""
+    if not mcp_wrapper_instance or not mcp_wrapper_instance._initialized:
+        return []
+    schemas = []
+    for method_name, schema_list in mcp_wrapper_instance.get_schemas().items():
+        if method_name == 'call_mcp_tool':
+            continue  # Skip the fallback method
+        for schema in schema_list:
+            if schema.schema_type == SchemaType.OPENAPI:
+                schemas.append((method_name, schema.schema))
+    return schemas
+
+
+def _build_mcp_info(mcp_schemas: List[Tuple[str, Dict[str, Any]]]) -> str:
+    mcp_info = "\n\n--- MCP Tools Available ---\n"
+    mcp_info += "You have access to external MCP (Model Context Protocol) server tools.\n"
+    mcp_info += "MCP tools can be called directly using their native function names in the standard function calling format:\n"
+    mcp_info += '<function_calls>\n'
+    mcp_info += '<invoke name="{tool_name}">\n'
+    mcp_info += '<parameter name="param1">value1</parameter>\n'
+    mcp_info += '<parameter name="param2">value2</parameter>\n'
+    mcp_info += '</invoke>\n'
+    mcp_info += '</function_calls>\n\n'
+    
+    # List available MCP tools
+    mcp_info += "Available MCP tools:\n"
+    try:
+        for method_name, schema in mcp_schemas:
+            func_info = schema.get('function', {})
+            description = func_info.get('description', 'No description available')
+            # Extract server name from description if available
+            server_match = description.find('(MCP Server: ')
+            if server_match != -1:
+                server_end = description.find(')', server_match)
+                server_info = description[server_match:server_end+1]
+            else:
+                server_info = ''
+            
+            mcp_info += f"- **{method_name}**: {description}\n"
+            
+            # Show parameter info
+            params = func_info.get('parameters', {})
+            props = params.get('properties', {})
+            if props:
+                mcp_info += f"  Parameters: {', '.join(props.keys())}\n"
+                
+    except Exception as e:
+        logger.error(f"Error listing MCP tools: {e}")
+        mcp_info += "- Error loading MCP tool list\n"
+    
+    # Add critical instructions for using search results
+    mcp_info += "\n🚨 CRITICAL MCP TOOL RESULT INSTRUCTIONS 🚨\n"
+    mcp_info += "When you use ANY MCP (Model Context Protocol) tools:\n"
+    mcp_info += "1. ALWAYS read and use the EXACT results returned by the MCP tool\n"
+    mcp_info += "2. For search tools: ONLY cite URLs, sources, and information from the actual search results\n"
+    mcp_info += "3. For any tool: Base your response entirely on the tool's output - do NOT add external information\n"
+    mcp_info += "4. DO NOT fabricate, invent, hallucinate, or make up any sources, URLs, or data\n"
+    mcp_info += "5. If you need more information, call the MCP tool again with different parameters\n"
+    mcp_info += "6. When writing reports/summaries: Reference ONLY the data from MCP tool results\n"
+    mcp_info += "7. If the MCP tool doesn't return enough information, explicitly state this limitation\n"
+    mcp_info += "8. Always double-check that every fact, URL, and reference comes from the MCP tool output\n"
+    mcp_info += "\nIMPORTANT: MCP tool results are your PRIMARY and ONLY source of truth for external data!\n"
+    mcp_info += "NEVER supplement MCP results with your training data or make assumptions beyond what the tools provide.\n"
+    return mcp_info
+
+
+class SystemPromptCompiler:
+    """Compiles and caches the system prompt of agent runs."""
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES, ttl: int = PROMPT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._prompts: "OrderedDict[str, str]" = OrderedDict()
+
+    def get_cache_key(
+        self,
+        model_name: str,
+        tool_registry: ToolRegistry,
+        agent_config: Optional[Dict[str, Any]] = None,
+        is_agent_builder: bool = False,
+        mcp_wrapper_instance: Optional[MCPToolWrapper] = None,
+        include_xml_examples: bool = True,
+    ) -> str:
+        """Get the digest of everything the compiled prompt depends on."""
+        agent_config = agent_config or {}
+        custom_system_prompt = (agent_config.get('system_prompt') or '').strip()
+        has_mcps = bool(agent_config.get('configured_mcps') or agent_config.get('custom_mcps'))
+        key_data = {
+            'version': PROMPT_CACHE_VERSION,
+            # The default prompts embed the current date
+            'date': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d'),
+            'family': get_prompt_family(model_name),
+            'agent_id': agent_config.get('agent_id'),
+            'agent_version_id': agent_config.get('current_version_id'),
+            # Agents can be edited without creating a new version
+            'custom_prompt': hashlib.sha256(custom_system_prompt.encode()).hexdigest() if custom_system_prompt else None,
+            'is_agent_builder': bool(is_agent_builder),
+            'tools': sorted(tool_registry.tools.keys()),
+            'mcp_schemas': _get_mcp_schemas(mcp_wrapper_instance) if has_mcps else [],
+            'xml_examples': include_xml_examples,
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    async def compile(
+        self,
+        model_name: str,
+        tool_registry: ToolRegistry,
+        agent_config: Optional[Dict[str, Any]] = None,
+        is_agent_builder: bool = False,
+        mcp_wrapper_instance: Optional[MCPToolWrapper] = None,
+        include_xml_examples: bool = True,
+    ) -> str:
+        """Get the compiled system prompt for a run, building it on a cache miss.
+
+        Args:
+            model_name: Model the run uses.
+            tool_registry: Registry with all tools of the run, including MCP tools.
+            agent_config: Config of the agent, if any.
+            is_agent_builder: Whether the run is an agent builder session.
+            mcp_wrapper_instance: The MCP tool wrapper, if MCP tools were registered.
+            include_xml_examples: Whether to append the XML tool calling examples.
+
+        Returns:
+            The system prompt text.
+        """
+        key = self.get_cache_key(model_name, tool_registry, agent_config, is_agent_builder, mcp_wrapper_instance, include_xml_examples)
+
+        prompt = self._prompts.get(key)
+        if prompt is not None:
+            self._prompts.move_to_end(key)
+            return prompt
+
+        redis_key = f"system_prompt:{key}"
+        try:
+            prompt = await redis.get(redis_key)
+        except Exception as e:
+            logger.warning(f"Failed to load compiled system prompt from Redis: {str(e)}")
+
+        if prompt is None:
+            prompt = self._build(model_name, tool_registry, agent_config, is_agent_builder, mcp_wrapper_instance, include_xml_examples)
+            try:
+                await redis.set(redis_key, prompt, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Failed to store compiled system prompt in Redis: {str(e)}")
+        else:
+            logger.debug(f"Loaded compiled system prompt {key[:12]} from Redis")
+
+        self._prompts[key] = prompt
+        while len(self._prompts) > self.max_entries:
+            self._prompts.popitem(last=False)
+        return prompt
+
+    def _build(
+        self,
+        model_name: str,
+        tool_registry: ToolRegistry,
+        agent_config: Optional[Dict[str, Any]],
+        is_agent_builder: bool,
+        mcp_wrapper_instance: Optional[MCPToolWrapper],
+        include_xml_examples: bool,
+    ) -> str:
+        prompt_family = get_prompt_family(model_name)
+
+        # First, get the default system prompt
+        if prompt_family == "gemini_flash":
+            default_system_content = get_gemini_system_prompt()
+        else:
+            # Use the original prompt - the LLM can only use tools that are registered
+            default_system_content = get_system_prompt()
+
+        # Add sample response for non-anthropic models
+        if prompt_family != "anthropic":
+            default_system_content = default_system_content + "\n\n <sample_assistant_response>" + _get_sample_response() + "</sample_assistant_response>"
+
+        # Handle custom agent system prompt
+        if agent_config and agent_config.get('system_prompt'):
+            custom_system_prompt = agent_config['system_prompt'].strip()
+
+            # Extract essential sections to preserve critical functionality
+            essential_sections = extract_essential_sections(default_system_content)
+
+            # Combine essential sections with custom prompt
+            system_content = f"""{essential_sections}
+
+--- CUSTOM AGENT INSTRUCTIONS ---
+{custom_system_prompt}
+
+--- CRITICAL REMINDERS ---
+🚨 ALWAYS follow workflow management rules above
+🚨 NEVER skip TODO creation step
+🚨 NEVER use ask tool with empty content
+"""
+            logger.info(f"Using hybrid prompt (essential + custom) for agent: {agent_config.get('name', 'Unknown')}")
+        elif is_agent_builder:
+            system_content = get_agent_builder_prompt()
+            logger.info("Using agent builder system prompt")
+        else:
+            # Use just the default system prompt
+            system_content = default_system_content
+            logger.info("Using default system prompt only")
+
+        if agent_config and (agent_config.get('configured_mcps') or agent_config.get('custom_mcps')) and mcp_wrapper_instance and mcp_wrapper_instance._initialized:
+            system_content += _build_mcp_info(_get_mcp_schemas(mcp_wrapper_instance))
+
+        if include_xml_examples:
+            system_content += tool_registry.get_xml_examples_prompt()
+
+        return system_content
+
+
+_compiler: Optional[SystemPromptCompiler] = None
+
+
+def get_system_prompt_compiler() -> SystemPromptCompiler:
+    """Get the process-wide system prompt compiler."""
+    global _compiler
+    if _compiler is None:
+        _compiler = SystemPromptCompiler()
+    return _compiler
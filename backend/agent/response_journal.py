@@ -0,0 +1,122 @@
+"""
+Bounded journal of the responses streamed by an agent run.
+
+Responses are compacted (consecutive content chunks of an assistant message are
+coalesced into one event) and appended in batches to the agent_run:{id}:responses
+Redis list, so a worker only keeps the current batch in memory no matter how long
+the run is. agent_runs.response_journal stores a pointer to the list and a summary.
+"""
+
+import json
+import time
+from typing import Dict, Any, List, Optional
+
+from services import redis
+from utils.logger import logger
+
+JOURNAL_TTL = 3600 * 24 * 7
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0  # Seconds between flushes while events are pending
+
+
+def get_response_journal_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:responses"
+
+
+def _parse_json(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+class ResponseJournal:
+    """Appends the responses of an agent run to a Redis list in compacted batches."""
+
+    def __init__(self, agent_run_id: str, batch_size: int = FLUSH_BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.agent_run_id = agent_run_id
+        self.key = get_response_journal_key(agent_run_id)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.response_count = 0
+        self.event_count = 0
+        self.last_status: Optional[str] = None
+        self._pending: List[str] = []
+        self._chunk: Optional[Dict[str, Any]] = None  # Content chunk being coalesced
+        self._chunk_parts: List[str] = []
+        self._chunk_run_id: Optional[str] = None
+        self._last_flush = time.monotonic()
+        self._failed = False
+
+    async def append(self, response: Dict[str, Any]) -> None:
+        """Add a response to the journal, flushing the pending batch when due."""
+        self.response_count += 1
+        if response.get('type') == 'status':
+            self.last_status = response.get('status') or self.last_status
+
+        metadata = _parse_json(response.get('metadata'))
+        if response.get('type') == 'assistant' and isinstance(metadata, dict) and metadata.get('stream_status') == 'chunk':
+            content = _parse_json(response.get('content'))
+            text = content.get('content', '') if isinstance(content, dict) else ''
+            if self._chunk is not None and metadata.get('thread_run_id') == self._chunk_run_id:
+                self._chunk_parts.append(text)
+            else:
+                self._close_chunk()
+                self._chunk = response
+                self._chunk_parts = [text]
+                self._chunk_run_id = metadata.get('thread_run_id')
+        else:
+            self._close_chunk()
+            self._add_event(response)
+
+        if len(self._pending) >= self.batch_size or (self._pending and time.monotonic() - self._last_flush >= self.flush_interval):
+            await self.flush()
+
+    def _close_chunk(self) -> None:
+        if self._chunk is None:
+            return
+        event = dict(self._chunk)
+        event['content'] = json.dumps({"role": "assistant", "content": "".join(self._chunk_parts)})
+        self._add_event(event)
+        self._chunk = None
+        self._chunk_parts = []
+        self._chunk_run_id = None
+
+    def _add_event(self, event: Dict[str, Any]) -> None:
+        self._pending.append(json.dumps(event, default=str))
+        self.event_count += 1
+
+    async def flush(self) -> None:
+        """Write pending events to the journal. Events are dropped if Redis is unavailable."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            redis_client = await redis.get_client()
+            await redis_client.rpush(self.key, *batch)
+            await redis_client.expire(self.key, JOURNAL_TTL)
+        except Exception as e:
+            self._failed = True
+            logger.error(f"Failed to write {len(batch)} events to response journal of agent run {self.agent_run_id}: {str(e)}")
+
+    async def close(self) -> Dict[str, Any]:
+        """Flush everything left, including a content chunk still being coalesced.
+
+        Returns:
+            The pointer and summary to store in agent_runs.response_journal.
+        """
+        self._close_chunk()
+        await self.flush()
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "response_count": self.response_count,
+            "event_count": self.event_count,
+            "last_status": self.last_status,
+            "complete": not self._failed,
+        }
@@ -9,10 +9,12 @@ from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any, AsyncIterable
 from services import redis
 from agent.run import run_agent
+from agent.stop_signals import get_stop_signal_listener
+from agent.response_journal import ResponseJournal
 from utils.logger import logger, structlog
 import uuid
 from services.supabase import DBConnection
-from services.langfuse import langfuse
+from services.tracing import trace_run
 from utils.retry import retry
 from typing import AsyncGenerator
 import json
@@ -94,7 +96,7 @@ async def run_agent_run_stream(
             "reasoning_effort": reasoning_effort,
             "stream": stream,
             "enable_context_manager": enable_context_manager,
-            "agent_config": agent_config,
+            "agent_id": agent_config.get("agent_id") if agent_config else None,
             "is_agent_builder": is_agent_builder,
             "target_agent_id": target_agent_id,
         }
@@ -107,42 +109,21 @@ async def run_agent_run_stream(
 
     client = await db.client
     start_time = datetime.now(timezone.utc)
-    all_responses = []  # Keep for DB updates
+    # Responses are journaled to Redis in compacted batches instead of kept in memory
+    response_journal = ResponseJournal(agent_run_id)
 
-    trace = langfuse.trace(
+    trace = trace_run(
         name="agent_run",
         id=agent_run_id,
         session_id=thread_id,
         metadata={"project_id": project_id, "instance_id": instance_id},
     )
 
-    stop_signal_received = False
-
-    stop_redis_key = f"stop_signal:{agent_run_id}"
-
-    async def check_for_stop_signal():
-        nonlocal stop_signal_received
-        try:
-            while not stop_signal_received:
-                message = await redis.client.get(stop_redis_key)
-                if message == "STOP":
-                    logger.info(
-                        f"Received STOP signal for agent run {agent_run_id} (Instance: {instance_id})"
-                    )
-                    stop_signal_received = True
-                    break
-                await asyncio.sleep(0.5)  # Short sleep to prevent tight loop
-        except asyncio.CancelledError:
-            logger.info(
-                f"Stop signal checker cancelled for {agent_run_id} (Instance: {instance_id})"
-            )
-        except Exception as e:
-            logger.error(
-                f"Error in stop signal checker for {agent_run_id}: {e}", exc_info=True
-            )
-            stop_signal_received = True  # Stop the run if the checker fails
-
-    asyncio.create_task(check_for_stop_signal())
+    # Stop signals are pushed by the process-wide listener instead of polled per run
+    stop_signal_listener = get_stop_signal_listener()
+    stop_event = stop_signal_listener.register(agent_run_id)
+    stop_wait_task = asyncio.create_task(stop_event.wait())
+    agent_gen = None
 
     try:
         # Initialize agent generator
@@ -163,9 +144,25 @@ async def run_agent_run_stream(
         final_status = "running"
         error_message = None
 
-        # Yield responses from the agent stream
-        async for response in agent_gen:
-            if stop_signal_received:
+        # Yield responses from the agent stream, racing each step against the stop signal
+        # so a stop interrupts in-flight LLM calls and tool executions
+        while True:
+            next_response = asyncio.ensure_future(agent_gen.__anext__())
+            await asyncio.wait(
+                {next_response, stop_wait_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if stop_event.is_set():
+                if not next_response.done():
+                    next_response.cancel()
+                    try:
+                        await next_response
+                    except (asyncio.CancelledError, StopAsyncIteration):
+                        pass
+                    except Exception as e:
+                        logger.warning(
+                            f"Error while cancelling agent run {agent_run_id}: {e}"
+                        )
                 logger.info(f"Agent run {agent_run_id} stopped by signal.")
                 final_status = "stopped"
                 trace.span(name="agent_run_stopped").end(
@@ -173,7 +170,12 @@ async def run_agent_run_stream(
                 )
                 break
 
-            all_responses.append(response)  # Keep for DB updates
+            try:
+                response = next_response.result()
+            except StopAsyncIteration:
+                break
+
+            await response_journal.append(response)
             if isinstance(response, dict):
                 yield f"data: {json.dumps(response)}\n\n"
             else:
@@ -198,7 +200,7 @@ async def run_agent_run_stream(
             final_status = "completed"
             duration = (datetime.now(timezone.utc) - start_time).total_seconds()
             logger.info(
-                f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {len(all_responses)})"
+                f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {response_journal.response_count})"
             )
             completion_message = {
                 "type": "status",
@@ -208,7 +210,7 @@ async def run_agent_run_stream(
             trace.span(name="agent_run_completed").end(
                 status_message="agent_run_completed"
             )
-            all_responses.append(completion_message)
+            await response_journal.append(completion_message)
             yield f"data: {json.dumps(completion_message)}\n\n"
 
         # Update DB status
@@ -217,7 +219,7 @@ async def run_agent_run_stream(
             agent_run_id,
             final_status,
             error=error_message,
-            responses=all_responses,
+            response_journal=await response_journal.close(),
         )
 
     except Exception as e:
@@ -234,7 +236,7 @@ async def run_agent_run_stream(
 
         # Add and yield error response
         error_response = {"type": "status", "status": "error", "message": error_message}
-        all_responses.append(error_response)
+        await response_journal.append(error_response)
         yield f"data: {json.dumps(error_response)}\n\n"
 
         # Update DB status
@@ -243,10 +245,23 @@ async def run_agent_run_stream(
             agent_run_id,
             "failed",
             error=f"{error_message}\n{traceback_str}",
-            responses=all_responses,
+            response_journal=await response_journal.close(),
         )
 
     finally:
+        try:
+            await response_journal.close()
+        except Exception as e:
+            logger.warning(f"Failed to flush response journal for {agent_run_id}: {e}")
+        trace.flush()
+        stop_wait_task.cancel()
+        stop_signal_listener.unregister(agent_run_id)
+        if agent_gen is not None:
+            try:
+                await agent_gen.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing agent generator for {agent_run_id}: {e}")
+
         instance_key = f"active_run:{instance_id}:{agent_run_id}"
         await redis.client.delete(instance_key)
         logger.info(
@@ -260,10 +275,14 @@ async def update_agent_run_status(
     status: str,
     error: Optional[str] = None,
     responses: Optional[List[Dict[Any, Any]]] = None,
+    response_journal: Optional[Dict[str, Any]] = None,
 ) -> bool:
     """
     Centralized function to update agent run status.
     Returns True if update was successful.
+
+    Runs store a pointer to their response journal and a summary of it in
+    response_journal; responses is only kept for callers that still pass a list.
     """
     try:
         update_data = {
@@ -278,6 +297,9 @@ async def update_agent_run_status(
             # Ensure responses are stored correctly as JSONB
             update_data["responses"] = responses
 
+        if response_journal:
+            update_data["response_journal"] = response_journal
+
         # Retry up to 3 times
         for retry in range(3):
             try:
@@ -289,23 +311,10 @@ async def update_agent_run_status(
                 )
 
                 if hasattr(update_result, "data") and update_result.data:
+                    # The update returns the updated row, so no separate verification query is needed
                     logger.info(
-                        f"Successfully updated agent run {agent_run_id} status to '{status}' (retry {retry})"
+                        f"Successfully updated agent run {agent_run_id} status to '{update_result.data[0].get('status')}' (retry {retry})"
                     )
-
-                    # Verify the update
-                    verify_result = (
-                        await client.table("agent_runs")
-                        .select("status", "completed_at")
-                        .eq("id", agent_run_id)
-                        .execute()
-                    )
-                    if verify_result.data:
-                        actual_status = verify_result.data[0].get("status")
-                        completed_at = verify_result.data[0].get("completed_at")
-                        logger.info(
-                            f"Verified agent run update: status={actual_status}, completed_at={completed_at}"
-                        )
                     return True
                 else:
                     logger.warning(
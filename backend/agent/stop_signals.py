@@ -0,0 +1,110 @@
+"""
+Push-based stop signals for agent runs.
+
+Stopping a run sets the stop_signal:{agent_run_id} key and publishes the run ID on
+STOP_SIGNAL_CHANNEL. Each process keeps a single subscriber that sets the
+asyncio.Event of the matching local run, so runs no longer poll Redis themselves.
+The keys of all local runs are still checked with one MGET every
+FALLBACK_POLL_INTERVAL seconds, to catch stops published while the subscriber
+was reconnecting.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from services import redis
+from utils.logger import logger
+
+STOP_SIGNAL_CHANNEL = "agent_run_stop_signals"
+FALLBACK_POLL_INTERVAL = 5.0
+RECONNECT_DELAY = 1.0
+
+
+def get_stop_signal_key(agent_run_id: str) -> str:
+    return f"stop_signal:{agent_run_id}"
+
+
+async def send_stop_signal(agent_run_id: str):
+    """Signal an agent run to stop, wherever it is running."""
+    await redis.set(get_stop_signal_key(agent_run_id), "STOP", ex=redis.REDIS_KEY_TTL)
+    await redis.publish(STOP_SIGNAL_CHANNEL, agent_run_id)
+
+
+class StopSignalListener:
+    """Fans stop signals out to the agent runs of this process through asyncio Events."""
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, agent_run_id: str) -> asyncio.Event:
+        """Get the event that is set when the given agent run is asked to stop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        event = self._events.get(agent_run_id)
+        if event is None:
+            event = self._events[agent_run_id] = asyncio.Event()
+        return event
+
+    def unregister(self, agent_run_id: str):
+        self._events.pop(agent_run_id, None)
+
+    def _signal(self, agent_run_id: str):
+        event = self._events.get(agent_run_id)
+        if event and not event.is_set():
+            logger.info(f"Received STOP signal for agent run {agent_run_id}")
+            event.set()
+
+    async def _poll_stop_keys(self):
+        """Check the stop keys of all local runs in a single round trip."""
+        agent_run_ids = list(self._events.keys())
+        if not agent_run_ids:
+            return
+        redis_client = await redis.get_client()
+        values = await redis_client.mget([get_stop_signal_key(agent_run_id) for agent_run_id in agent_run_ids])
+        for agent_run_id, value in zip(agent_run_ids, values):
+            if value == "STOP":
+                self._signal(agent_run_id)
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(STOP_SIGNAL_CHANNEL)
+                logger.debug(f"Subscribed to {STOP_SIGNAL_CHANNEL}")
+
+                # Catch up on stops published before (re)subscribing
+                await self._poll_stop_keys()
+                next_poll = loop.time() + FALLBACK_POLL_INTERVAL
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=FALLBACK_POLL_INTERVAL)
+                    if message and message.get("type") == "message":
+                        self._signal(message["data"])
+                    if loop.time() >= next_poll:
+                        await self._poll_stop_keys()
+                        next_poll = loop.time() + FALLBACK_POLL_INTERVAL
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in stop signal listener, reconnecting: {e}", exc_info=True)
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+
+_listener: Optional[StopSignalListener] = None
+
+
+def get_stop_signal_listener() -> StopSignalListener:
+    """Get the stop signal listener of this process."""
+    global _listener
+    if _listener is None:
+        _listener = StopSignalListener()
+    return _listener
@@ -1,10 +1,8 @@
 import json
 import asyncio
 from typing import Dict, Any, List
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
+from mcp_service.schema_cache import get_mcp_schema_cache
+from mcp_service.session_pool import MCPServerSpec, get_mcp_session_pool
 from utils.logger import logger
 from .mcp_connection_manager import MCPConnectionManager
 
@@ -15,15 +13,15 @@ class CustomMCPHandler:
         self.custom_tools: Dict[str, Dict[str, Any]] = {}
     
     async def initialize_custom_mcps(self, custom_configs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-        for config in custom_configs:
-            try:
-                await self._initialize_single_custom_mcp(config)
-            except Exception as e:
-                logger.error(f"Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
-                continue
-        
+        await asyncio.gather(*(self.initialize_custom_mcp(config) for config in custom_configs))
         return self.custom_tools
     
+    async def initialize_custom_mcp(self, config: Dict[str, Any]):
+        try:
+            await self._initialize_single_custom_mcp(config)
+        except Exception as e:
+            logger.error(f"Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
+    
     async def _initialize_single_custom_mcp(self, config: Dict[str, Any]):
         custom_type = config.get('customType', 'sse')
         server_config = config.get('config', {})
@@ -59,10 +57,8 @@ class CustomMCPHandler:
         
         logger.info(f"Initializing Pipedream MCP for {app_slug} (user: {external_user_id}, oauth_app_id: {oauth_app_id})")
         
-        try:
+        async def list_tools() -> List[Dict[str, Any]]:
             from pipedream.client import get_pipedream_client
-            from mcp import ClientSession
-            from mcp.client.streamable_http import streamablehttp_client
             
             client = get_pipedream_client()
             access_token = await client._obtain_access_token()
@@ -84,13 +80,22 @@ class CustomMCPHandler:
 
             url = "https://remote.mcp.pipedream.net"
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
+            tools = await get_mcp_session_pool().list_tools(MCPServerSpec(transport='http', url=url, headers=headers))
+            return [
+                {"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema}
+                for tool in tools
+            ]
+        
+        try:
+            # The access token changes, so the cache is keyed on what determines the tools
+            tools_info = await get_mcp_schema_cache().get_tools({
+                "custom_type": "pipedream",
+                "app_slug": app_slug,
+                "external_user_id": external_user_id,
+                "oauth_app_id": oauth_app_id,
+            }, list_tools)
+            
+            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'pipedream', server_config)
                     
         except Exception as e:
             logger.error(f"Pipedream MCP {server_name}: Connection failed - {str(e)}")
@@ -170,28 +175,6 @@ class CustomMCPHandler:
             logger.error(f"Failed to resolve profile {profile_id}: {str(e)}")
             return None
     
-    def _register_custom_tools(self, tools, server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
-        tools_registered = 0
-        
-        for tool in tools:
-            tool_name_from_server = tool.name
-            if not enabled_tools or tool_name_from_server in enabled_tools:
-                tool_name = f"custom_{server_name.replace(' ', '_').lower()}_{tool_name_from_server}"
-                self.custom_tools[tool_name] = {
-                    'name': tool_name,
-                    'description': tool.description,
-                    'parameters': tool.inputSchema,
-                    'server': server_name,
-                    'original_name': tool_name_from_server,
-                    'is_custom': True,
-                    'custom_type': custom_type,
-                    'custom_config': server_config
-                }
-                tools_registered += 1
-                logger.debug(f"Registered custom tool: {tool_name}")
-        
-        logger.info(f"Successfully initialized custom MCP {server_name} with {tools_registered} tools")
-    
     def _register_custom_tools_from_info(self, tools_info: List[Dict[str, Any]], server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
         tools_registered = 0
         
@@ -0,0 +1,179 @@
+"""
+Async client the data providers call RapidAPI through.
+
+All providers share one pooled HTTP client with timeouts. Failed requests (transport
+errors, 429 and 5xx) are retried with exponential backoff and jitter. Each RapidAPI
+host gets its own token bucket of config.RAPID_API_RATE_LIMIT requests per second.
+
+Successful responses are cached in Redis under rapid_api:{host}:{method}:{route}:{hash
+of the payload}, for the cache_ttl of the endpoint or config.RAPID_API_CACHE_TTL.
+An endpoint with a cache_ttl of 0 is never cached.
+
+config.RAPID_API_BASE_URL sends all requests to another server, e.g. a local mock of
+RapidAPI (python -m tests.fakes rapidapi <port>), keeping the path of the provider.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 30
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+MAX_RETRY_AFTER = 10
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 1
+                self.updated = time.monotonic()
+            self.tokens -= 1
+
+
+class RapidApiClient:
+    """Calls RapidAPI endpoints with pooling, retries, rate limits and caching.
+
+    Args:
+        api_key: RapidAPI key.
+        rate_limit: Requests per second per RapidAPI host.
+        cache_ttl: Seconds responses are cached for endpoints without a cache_ttl of their own.
+        base_url: Server to send requests to instead of the provider's host.
+    """
+
+    def __init__(self, api_key: str, rate_limit: float, cache_ttl: int, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.rate_limit = rate_limit
+        self.cache_ttl = cache_ttl
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT))
+        return self._client
+
+    async def call(self, url: str, method: str, payload: Optional[Dict[str, Any]] = None,
+                   cache_ttl: Optional[int] = None) -> Any:
+        """Call a RapidAPI endpoint.
+
+        Args:
+            url: Full URL of the endpoint on its RapidAPI host.
+            method: 'GET' sends the payload as query parameters, 'POST' as JSON.
+            payload: Parameters of the call.
+            cache_ttl: Seconds to cache the response for, None for the default.
+
+        Returns:
+            The JSON response of the API.
+        """
+        parts = urlsplit(url)
+        host = parts.netloc
+        ttl = self.cache_ttl if cache_ttl is None else cache_ttl
+        cache_key = self._cache_key(host, parts.path, method, payload) if ttl > 0 else None
+
+        if cache_key:
+            cached = await self._load(cache_key)
+            if cached is not None:
+                logger.debug(f"Serving {method} {url} from cache")
+                return cached
+
+        if self.base_url:
+            url = f"{self.base_url}{parts.path}"
+        headers = {
+            "x-rapidapi-key": self.api_key,
+            "x-rapidapi-host": host,
+            "Content-Type": "application/json"
+        }
+
+        response = await self._request(host, method, url, payload, headers)
+        result = response.json()
+        if cache_key and response.is_success:
+            await self._store(cache_key, result, ttl)
+        return result
+
+    async def _request(self, host: str, method: str, url: str, payload: Optional[Dict[str, Any]],
+                       headers: Dict[str, str]) -> httpx.Response:
+        bucket = self._buckets.setdefault(host, _TokenBucket(self.rate_limit))
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                if method == 'GET':
+                    response = await self._get_client().get(url, params=payload, headers=headers)
+                elif method == 'POST':
+                    response = await self._get_client().post(url, json=payload, headers=headers)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+            except httpx.TransportError as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                error = str(e) or type(e).__name__
+            if attempt == MAX_ATTEMPTS:
+                return response
+
+            delay = BACKOFF_BASE * 2 ** (attempt - 1) + random.uniform(0, BACKOFF_BASE)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(int(retry_after), MAX_RETRY_AFTER))
+            logger.warning(f"RapidAPI call {method} {url} failed (attempt {attempt}/{MAX_ATTEMPTS}): {error}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _cache_key(self, host: str, route: str, method: str, payload: Optional[Dict[str, Any]]) -> str:
+        payload_hash = hashlib.sha256(json.dumps(payload or {}, sort_keys=True, default=str).encode()).hexdigest()
+        return f"rapid_api:{host}:{method}:{route}:{payload_hash}"
+
+    async def _load(self, key: str) -> Any:
+        try:
+            cached = await redis.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read cached RapidAPI response: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _store(self, key: str, result: Any, ttl: int) -> None:
+        try:
+            await redis.set(key, json.dumps(result, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache RapidAPI response: {str(e)}")
+
+
+_client: Optional[RapidApiClient] = None
+
+
+def get_rapid_api_client() -> RapidApiClient:
+    """Get the process-wide RapidAPI client."""
+    global _client
+    if _client is None:
+        _client = RapidApiClient(
+            api_key=config.RAPID_API_KEY,
+            rate_limit=config.RAPID_API_RATE_LIMIT,
+            cache_ttl=config.RAPID_API_CACHE_TTL,
+            base_url=config.RAPID_API_BASE_URL,
+        )
+    return _client
@@ -1,6 +1,13 @@
 import os
 import requests
-from typing import Dict, Any, Optional, TypedDict, Literal
+from typing import Dict, Any, Optional, TypedDict, Literal, NotRequired
+
+from agent.tools.data_providers.RapidApiClient import get_rapid_api_client
+
+REQUEST_TIMEOUT = 30
+# cache_ttl of endpoints whose data goes stale sooner than config.RAPID_API_CACHE_TTL
+LIVE_DATA_CACHE_TTL = 0  # Quotes and indicators, never cached
+FEED_CACHE_TTL = 120  # Social profiles and feeds, news
 
 
 class EndpointSchema(TypedDict):
@@ -9,6 +16,7 @@ class EndpointSchema(TypedDict):
     name: str
     description: str
     payload: Dict[str, Any]
+    cache_ttl: NotRequired[int]  # Seconds responses are cached, 0 to never cache
 
 
 class RapidDataProviderBase:
@@ -53,9 +61,41 @@ class RapidDataProviderBase:
         method = endpoint.get('method', 'GET').upper()
         
         if method == 'GET':
-            response = requests.get(url, params=payload, headers=headers)
+            response = requests.get(url, params=payload, headers=headers, timeout=REQUEST_TIMEOUT)
         elif method == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
+            response = requests.post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
         else:
             raise ValueError(f"Unsupported HTTP method: {method}")
         return response.json()
+
+    async def call_endpoint_async(
+            self,
+            route: str,
+            payload: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Call an API endpoint without blocking the event loop.
+        
+        Goes through the shared RapidAPI client, which pools connections, retries,
+        rate limits per provider and caches responses.
+        
+        Args:
+            route (str): The key of the endpoint to call
+            payload (dict, optional): Query parameters for GET requests, JSON payload for POST requests
+            
+        Returns:
+            dict: The JSON response from the API
+        """
+        if route.startswith("/"):
+            route = route[1:]
+
+        endpoint = self.endpoints.get(route)
+        if not endpoint:
+            raise ValueError(f"Endpoint {route} not found")
+        
+        return await get_rapid_api_client().call(
+            f"{self.base_url}{endpoint['route']}",
+            endpoint.get('method', 'GET').upper(),
+            payload,
+            cache_ttl=endpoint.get('cache_ttl'),
+        )
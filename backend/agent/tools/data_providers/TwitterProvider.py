@@ -1,6 +1,6 @@
 from typing import Dict
 
-from agent.tools.data_providers.RapidDataProviderBase import RapidDataProviderBase, EndpointSchema
+from agent.tools.data_providers.RapidDataProviderBase import RapidDataProviderBase, EndpointSchema, FEED_CACHE_TTL
 
 
 class TwitterProvider(RapidDataProviderBase):
@@ -9,6 +9,7 @@ class TwitterProvider(RapidDataProviderBase):
             "user_info": {
                 "route": "/screenname.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Twitter User Info",
                 "description": "Get information about a Twitter user by screenname or user ID.",
                 "payload": {
@@ -19,6 +20,7 @@ class TwitterProvider(RapidDataProviderBase):
             "timeline": {
                 "route": "/timeline.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "User Timeline",
                 "description": "Get tweets from a user's timeline.",
                 "payload": {
@@ -30,6 +32,7 @@ class TwitterProvider(RapidDataProviderBase):
             "following": {
                 "route": "/following.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "User Following",
                 "description": "Get users that a specific user follows.",
                 "payload": {
@@ -41,6 +44,7 @@ class TwitterProvider(RapidDataProviderBase):
             "followers": {
                 "route": "/followers.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "User Followers",
                 "description": "Get followers of a specific user.",
                 "payload": {
@@ -51,6 +55,7 @@ class TwitterProvider(RapidDataProviderBase):
             "search": {
                 "route": "/search.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Twitter Search",
                 "description": "Search for tweets with a specific query.",
                 "payload": {
@@ -62,6 +67,7 @@ class TwitterProvider(RapidDataProviderBase):
             "replies": {
                 "route": "/replies.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "User Replies",
                 "description": "Get replies made by a user.",
                 "payload": {
@@ -72,6 +78,7 @@ class TwitterProvider(RapidDataProviderBase):
             "check_retweet": {
                 "route": "/checkretweet.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Check Retweet",
                 "description": "Check if a user has retweeted a specific tweet.",
                 "payload": {
@@ -82,6 +89,7 @@ class TwitterProvider(RapidDataProviderBase):
             "tweet": {
                 "route": "/tweet.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Get Tweet",
                 "description": "Get details of a specific tweet by ID.",
                 "payload": {
@@ -91,6 +99,7 @@ class TwitterProvider(RapidDataProviderBase):
             "tweet_thread": {
                 "route": "/tweet_thread.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Get Tweet Thread",
                 "description": "Get a thread of tweets starting from a specific tweet ID.",
                 "payload": {
@@ -101,6 +110,7 @@ class TwitterProvider(RapidDataProviderBase):
             "retweets": {
                 "route": "/retweets.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Get Retweets",
                 "description": "Get users who retweeted a specific tweet.",
                 "payload": {
@@ -111,6 +121,7 @@ class TwitterProvider(RapidDataProviderBase):
             "latest_replies": {
                 "route": "/latest_replies.php",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Get Latest Replies",
                 "description": "Get the latest replies to a specific tweet.",
                 "payload": {
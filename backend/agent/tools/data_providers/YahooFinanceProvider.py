@@ -1,6 +1,6 @@
 from typing import Dict
 
-from agent.tools.data_providers.RapidDataProviderBase import RapidDataProviderBase, EndpointSchema
+from agent.tools.data_providers.RapidDataProviderBase import RapidDataProviderBase, EndpointSchema, FEED_CACHE_TTL, LIVE_DATA_CACHE_TTL
 
 
 class YahooFinanceProvider(RapidDataProviderBase):
@@ -9,6 +9,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_tickers": {
                 "route": "/v2/markets/tickers",
                 "method": "GET",
+                "cache_ttl": LIVE_DATA_CACHE_TTL,
                 "name": "Yahoo Finance Tickers",
                 "description": "Get financial tickers from Yahoo Finance with various filters and parameters.",
                 "payload": {
@@ -28,6 +29,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_news": {
                 "route": "/v2/markets/news",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Yahoo Finance News",
                 "description": "Get news related to specific tickers from Yahoo Finance",
                 "payload": {
@@ -38,6 +40,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_stock_module": {
                 "route": "/v1/markets/stock/modules",
                 "method": "GET",
+                "cache_ttl": LIVE_DATA_CACHE_TTL,
                 "name": "Yahoo Finance Stock Module",
                 "description": "Get detailed information about a specific stock module",
                 "payload": {
@@ -48,6 +51,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_sma": {
                 "route": "/v1/markets/indicators/sma",
                 "method": "GET",
+                "cache_ttl": LIVE_DATA_CACHE_TTL,
                 "name": "Yahoo Finance SMA Indicator",
                 "description": "Get Simple Moving Average (SMA) indicator data for a stock",
                 "payload": {
@@ -61,6 +65,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_rsi": {
                 "route": "/v1/markets/indicators/rsi",
                 "method": "GET",
+                "cache_ttl": LIVE_DATA_CACHE_TTL,
                 "name": "Yahoo Finance RSI Indicator",
                 "description": "Get Relative Strength Index (RSI) indicator data for a stock",
                 "payload": {
@@ -83,6 +88,7 @@ class YahooFinanceProvider(RapidDataProviderBase):
             "get_insider_trades": {
                 "route": "/v1/markets/insider-trades",
                 "method": "GET",
+                "cache_ttl": FEED_CACHE_TTL,
                 "name": "Yahoo Finance Insider Trades",
                 "description": "Get recent insider trading activity",
                 "payload": {}
@@ -3,11 +3,14 @@ from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema, ToolSc
 from mcp_service.client import MCPManager
 from utils.logger import logger
 import inspect
+import asyncio
 from .mcp_connection_manager import MCPConnectionManager
 from .custom_mcp_handler import CustomMCPHandler
 from .dynamic_tool_builder import DynamicToolBuilder
 from .mcp_tool_executor import MCPToolExecutor
 
+MCP_DISCOVERY_DEADLINE = 20  # Seconds all MCP servers of a run get to list their tools
+
 
 class MCPToolWrapper(Tool):
     def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None):
@@ -35,20 +38,29 @@ class MCPToolWrapper(Tool):
         standard_configs = [cfg for cfg in self.mcp_configs if not cfg.get('isCustom', False)]
         custom_configs = [cfg for cfg in self.mcp_configs if cfg.get('isCustom', False)]
         
-        if standard_configs:
-            await self._initialize_standard_servers(standard_configs)
+        # All servers are discovered at once; servers not done by the deadline are left out of the run
+        tasks = {}
+        for config in standard_configs:
+            tasks[asyncio.create_task(self._initialize_standard_server(config))] = config['qualifiedName']
+        for config in custom_configs:
+            tasks[asyncio.create_task(self.custom_handler.initialize_custom_mcp(config))] = config.get('name', 'Unknown')
+        if not tasks:
+            return
         
-        if custom_configs:
-            await self.custom_handler.initialize_custom_mcps(custom_configs)
+        _, pending = await asyncio.wait(tasks, timeout=MCP_DISCOVERY_DEADLINE)
+        for task in pending:
+            logger.warning(f"MCP server {tasks[task]} was not discovered within {MCP_DISCOVERY_DEADLINE}s, skipping it")
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
             
-    async def _initialize_standard_servers(self, standard_configs: List[Dict[str, Any]]):
-        for config in standard_configs:
-            try:
-                logger.info(f"Attempting to connect to MCP server: {config['qualifiedName']}")
-                await self.mcp_manager.connect_server(config)
-                logger.info(f"Successfully connected to MCP server: {config['qualifiedName']}")
-            except Exception as e:
-                logger.error(f"Failed to connect to MCP server {config['qualifiedName']}: {e}")
+    async def _initialize_standard_server(self, config: Dict[str, Any]):
+        try:
+            logger.info(f"Attempting to connect to MCP server: {config['qualifiedName']}")
+            await self.mcp_manager.connect_server(config)
+            logger.info(f"Successfully connected to MCP server: {config['qualifiedName']}")
+        except Exception as e:
+            logger.error(f"Failed to connect to MCP server {config['qualifiedName']}: {e}")
     
     async def _create_dynamic_tools(self):
         try:
@@ -1,14 +1,31 @@
+import asyncio
 import traceback
-import json
 import base64
 import io
+from typing import Optional
+
+import httpx
 from PIL import Image
 
 from agentpress.tool import ToolResult, openapi_schema, xml_schema
 from agentpress.thread_manager import ThreadManager
 from sandbox.tool_base import SandboxToolsBase
 from utils.logger import logger
-from utils.s3_upload_utils import upload_base64_image
+from utils.s3_upload_utils import upload_base64_image, upload_image_bytes, create_image_upload_url
+
+BROWSER_API_PORT = 8003
+BROWSER_ACTION_TIMEOUT = 30
+MAX_SCREENSHOT_BYTES = 10 * 1024 * 1024
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Get the client shared by all browser tools, so connections to the sandboxes are reused."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(BROWSER_ACTION_TIMEOUT))
+    return _http_client
 
 
 class SandboxBrowserTool(SandboxToolsBase):
@@ -17,6 +34,8 @@ class SandboxBrowserTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self.thread_id = thread_id
+        self._browser_api_url: Optional[str] = None
+        self._browser_api_headers: dict = {}
 
     def _validate_base64_image(self, base64_string: str, max_size_mb: int = 10) -> tuple[bool, str]:
         """
@@ -103,9 +122,71 @@ class SandboxBrowserTool(SandboxToolsBase):
             logger.error(f"Unexpected error during base64 image validation: {e}")
             return False, f"Validation error: {str(e)}"
 
+    async def _get_browser_api(self) -> tuple[str, dict]:
+        """Get the preview URL of the sandbox browser API and the headers to reach it."""
+        if self._browser_api_url is None:
+            await self._ensure_sandbox()
+            preview_link = await self.sandbox.get_preview_link(BROWSER_API_PORT)
+            self._browser_api_url = (preview_link.url if hasattr(preview_link, 'url') else str(preview_link)).rstrip('/')
+            token = getattr(preview_link, 'token', None)
+            self._browser_api_headers = {"X-Daytona-Preview-Token": token} if token else {}
+        return self._browser_api_url, self._browser_api_headers
+
+    async def _store_screenshot(self, result: dict) -> None:
+        """Make sure the screenshot of a result is in storage and only its URL is left in the result."""
+        screenshot_base64 = result.pop("screenshot_base64", None)
+        if result.get("image_url"):
+            # The sandbox uploaded it itself
+            return
+
+        try:
+            if screenshot_base64:
+                # Sandboxes that predate direct uploads send the image inline
+                is_valid, validation_message = self._validate_base64_image(screenshot_base64)
+                if not is_valid:
+                    logger.warning(f"Screenshot validation failed: {validation_message}")
+                    result["image_validation_error"] = validation_message
+                    return
+                result["image_url"] = await upload_base64_image(screenshot_base64)
+            elif result.get("screenshot_hash"):
+                # The sandbox could not upload it, fetch the raw bytes and upload them here
+                base_url, headers = await self._get_browser_api()
+                response = await _get_http_client().get(f"{base_url}/api/automation/screenshot/{result['screenshot_hash']}", headers=headers)
+                response.raise_for_status()
+                if len(response.content) > MAX_SCREENSHOT_BYTES:
+                    result["image_validation_error"] = f"Image size ({len(response.content)} bytes) exceeds limit ({MAX_SCREENSHOT_BYTES} bytes)"
+                    return
+                result["image_url"] = await upload_image_bytes(response.content, "image/jpeg")
+            else:
+                return
+            logger.debug(f"Uploaded screenshot to {result['image_url']}")
+        except Exception as e:
+            logger.error(f"Failed to process screenshot: {e}")
+            result["image_upload_error"] = str(e)
+
+    async def _fetch_ocr_text(self, result: dict) -> None:
+        """Fill in the OCR text of a result whose sandbox had not finished it yet."""
+        if result.get("ocr_text") or not result.get("screenshot_hash"):
+            return
+        try:
+            base_url, headers = await self._get_browser_api()
+            response = await _get_http_client().post(
+                f"{base_url}/api/automation/ocr", json={"screenshot_hash": result["screenshot_hash"]}, headers=headers
+            )
+            response.raise_for_status()
+            ocr_text = response.json().get("ocr_text")
+            if ocr_text:
+                result["ocr_text"] = ocr_text
+        except Exception as e:
+            logger.warning(f"Failed to fetch OCR text of screenshot {result['screenshot_hash']}: {e}")
+
     async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST") -> ToolResult:
         """Execute a browser automation action through the API
         
+        The sandbox gets a signed upload URL with the request and uploads the screenshot
+        straight to storage, so only its URL comes back. OCR text the sandbox has not
+        finished yet is fetched by screenshot hash while the screenshot is stored.
+        
         Args:
             endpoint (str): The API endpoint to call
             params (dict, optional): Parameters to send. Defaults to None.
@@ -115,110 +196,87 @@ class SandboxBrowserTool(SandboxToolsBase):
             ToolResult: Result of the execution
         """
         try:
-            # Ensure sandbox is initialized
-            await self._ensure_sandbox()
+            base_url, headers = await self._get_browser_api()
+            url = f"{base_url}/api/automation/{endpoint}"
+
+            headers = dict(headers)
+            try:
+                upload_url, public_url = await create_image_upload_url("image/jpeg")
+                headers["X-Screenshot-Upload-Url"] = upload_url
+                headers["X-Screenshot-Public-Url"] = public_url
+            except Exception as e:
+                logger.warning(f"Failed to create screenshot upload URL, the screenshot will be fetched instead: {e}")
             
-            # Build the curl command
-            url = f"http://localhost:8003/api/automation/{endpoint}"
+            logger.debug(f"Executing browser action: {method} {url}")
             
-            if method == "GET" and params:
-                query_params = "&".join([f"{k}={v}" for k, v in params.items()])
-                url = f"{url}?{query_params}"
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
+            client = _get_http_client()
+            if method == "GET":
+                response = await client.get(url, params=params, headers=headers)
             else:
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-                if params:
-                    json_data = json.dumps(params)
-                    curl_cmd += f" -d '{json_data}'"
-            
-            logger.debug("\033[95mExecuting curl command:\033[0m")
-            logger.debug(f"{curl_cmd}")
+                response = await client.request(method, url, json=params, headers=headers)
             
-            response = await self.sandbox.process.exec(curl_cmd, timeout=30)
-            
-            if response.exit_code == 0:
-                try:
-                    result = json.loads(response.result)
-
-                    if not "content" in result:
-                        result["content"] = ""
-                    
-                    if not "role" in result:
-                        result["role"] = "assistant"
+            try:
+                result = response.json()
+            except ValueError as e:
+                logger.error(f"Failed to parse response JSON: {response.status_code} {response.text[:500]} {e}")
+                return self.fail_response(f"Failed to parse response JSON: {response.status_code} {response.text[:500]} {e}")
 
-                    logger.info("Browser automation request completed successfully")
+            if not "content" in result:
+                result["content"] = ""
+            
+            if not "role" in result:
+                result["role"] = "assistant"
 
-                    if "screenshot_base64" in result:
-                        try:
-                            # Comprehensive validation of the base64 image data
-                            screenshot_data = result["screenshot_base64"]
-                            is_valid, validation_message = self._validate_base64_image(screenshot_data)
-                            
-                            if is_valid:
-                                logger.debug(f"Screenshot validation passed: {validation_message}")
-                                image_url = await upload_base64_image(screenshot_data)
-                                result["image_url"] = image_url
-                                logger.debug(f"Uploaded screenshot to {image_url}")
-                            else:
-                                logger.warning(f"Screenshot validation failed: {validation_message}")
-                                result["image_validation_error"] = validation_message
-                                
-                            # Remove base64 data from result to keep it clean
-                            del result["screenshot_base64"]
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to process screenshot: {e}")
-                            result["image_upload_error"] = str(e)
+            logger.info("Browser automation request completed successfully")
 
-                    added_message = await self.thread_manager.add_message(
-                        thread_id=self.thread_id,
-                        type="browser_state",
-                        content=result,
-                        is_llm_message=False
-                    )
+            await asyncio.gather(self._store_screenshot(result), self._fetch_ocr_text(result))
 
-                    success_response = {}
+            added_message = await self.thread_manager.add_message(
+                thread_id=self.thread_id,
+                type="browser_state",
+                content=result,
+                is_llm_message=False
+            )
+            if added_message and 'message_id' in added_message:
+                self.thread_manager.latest_browser_state = {
+                    'message_id': added_message['message_id'],
+                    'content': result,
+                }
 
-                    if result.get("success"):
-                        success_response["success"] = result["success"]
-                        success_response["message"] = result.get("message", "Browser action completed successfully")
-                    else:
-                        success_response["success"] = False
-                        success_response["message"] = result.get("message", "Browser action failed")
+            success_response = {}
 
-                    if added_message and 'message_id' in added_message:
-                        success_response['message_id'] = added_message['message_id']
-                    if result.get("url"):
-                        success_response["url"] = result["url"]
-                    if result.get("title"):
-                        success_response["title"] = result["title"]
-                    if result.get("element_count"):
-                        success_response["elements_found"] = result["element_count"]
-                    if result.get("pixels_below"):
-                        success_response["scrollable_content"] = result["pixels_below"] > 0
-                    if result.get("ocr_text"):
-                        success_response["ocr_text"] = result["ocr_text"]
-                    if result.get("image_url"):
-                        success_response["image_url"] = result["image_url"]
+            if result.get("success"):
+                success_response["success"] = result["success"]
+                success_response["message"] = result.get("message", "Browser action completed successfully")
+            else:
+                success_response["success"] = False
+                success_response["message"] = result.get("message", "Browser action failed")
 
-                    if success_response.get("success"):
-                        return self.success_response(success_response)
-                    else:
-                        return self.fail_response(success_response)
+            if added_message and 'message_id' in added_message:
+                success_response['message_id'] = added_message['message_id']
+            if result.get("url"):
+                success_response["url"] = result["url"]
+            if result.get("title"):
+                success_response["title"] = result["title"]
+            if result.get("element_count"):
+                success_response["elements_found"] = result["element_count"]
+            if result.get("pixels_below"):
+                success_response["scrollable_content"] = result["pixels_below"] > 0
+            if result.get("ocr_text"):
+                success_response["ocr_text"] = result["ocr_text"]
+            if result.get("image_url"):
+                success_response["image_url"] = result["image_url"]
 
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse response JSON: {response.result} {e}")
-                    return self.fail_response(f"Failed to parse response JSON: {response.result} {e}")
+            if success_response.get("success"):
+                return self.success_response(success_response)
             else:
-                logger.error(f"Browser automation request failed 2: {response}")
-                return self.fail_response(f"Browser automation request failed 2: {response}")
+                return self.fail_response(success_response)
 
         except Exception as e:
             logger.error(f"Error executing browser action: {e}")
             logger.debug(traceback.format_exc())
             return self.fail_response(f"Error executing browser action: {e}")
 
-
     @openapi_schema({
         "type": "function",
         "function": {
@@ -3,6 +3,8 @@ from sandbox.tool_base import SandboxToolsBase
 from utils.files_utils import should_exclude_file, clean_path
 from agentpress.thread_manager import ThreadManager
 from utils.logger import logger
+from sandbox.workspace_snapshot import WorkspaceSnapshotter, WorkspaceFile
+from typing import AsyncIterator, Optional
 import os
 import json
 
@@ -13,6 +15,7 @@ class SandboxFilesTool(SandboxToolsBase):
         super().__init__(project_id, thread_manager)
         self.SNIPPET_LINES = 4  # Number of context lines to show around edits
         self.workspace_path = "/workspace"  # Ensure we're always operating in /workspace
+        self._snapshotter: Optional[WorkspaceSnapshotter] = None
 
     def clean_path(self, path: str) -> str:
         """Clean and normalize a path to be relative to /workspace"""
@@ -30,39 +33,26 @@ class SandboxFilesTool(SandboxToolsBase):
         except Exception:
             return False
 
-    async def get_workspace_state(self) -> dict:
-        """Get the current workspace state by reading all files"""
-        files_state = {}
-        try:
-            # Ensure sandbox is initialized
-            await self._ensure_sandbox()
-            
-            files = await self.sandbox.fs.list_files(self.workspace_path)
-            for file_info in files:
-                rel_path = file_info.name
-                
-                # Skip excluded files and directories
-                if self._should_exclude_file(rel_path) or file_info.is_dir:
-                    continue
+    async def _get_snapshotter(self) -> WorkspaceSnapshotter:
+        """Get the snapshotter of the workspace, which remembers what earlier snapshots fetched"""
+        await self._ensure_sandbox()
+        if self._snapshotter is None or self._snapshotter.sandbox is not self.sandbox:
+            self._snapshotter = WorkspaceSnapshotter(self.sandbox, self.workspace_path, self._should_exclude_file)
+        return self._snapshotter
 
-                try:
-                    full_path = f"{self.workspace_path}/{rel_path}"
-                    content = (await self.sandbox.fs.download_file(full_path)).decode()
-                    files_state[rel_path] = {
-                        "content": content,
-                        "is_dir": file_info.is_dir,
-                        "size": file_info.size,
-                        "modified": file_info.mod_time
-                    }
-                except Exception as e:
-                    print(f"Error reading file {rel_path}: {e}")
-                except UnicodeDecodeError:
-                    print(f"Skipping binary file: {rel_path}")
+    async def iter_workspace_files(self) -> AsyncIterator[WorkspaceFile]:
+        """Stream the files of the workspace, only downloading those changed since the last snapshot"""
+        snapshotter = await self._get_snapshotter()
+        async for file in snapshotter.iter_files():
+            yield file
 
-            return files_state
-        
+    async def get_workspace_state(self) -> dict:
+        """Get the current workspace state by reading all text files"""
+        try:
+            snapshotter = await self._get_snapshotter()
+            return await snapshotter.snapshot()
         except Exception as e:
-            print(f"Error getting workspace state: {str(e)}")
+            logger.error(f"Error getting workspace state: {str(e)}")
             return {}
 
 
@@ -3,6 +3,7 @@ import httpx
 from typing import Optional, Dict, Any, List
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
 from agentpress.thread_manager import ThreadManager
+from agent.config_resolver import get_agent_config_resolver
 
 class UpdateAgentTool(Tool):
     """Tool for updating agent configuration.
@@ -161,6 +162,7 @@ class UpdateAgentTool(Tool):
                 return self.fail_response("No fields provided to update")
                 
             result = await client.table('agents').update(update_data).eq('agent_id', self.agent_id).execute()
+            await get_agent_config_resolver().invalidate(self.agent_id)
             
             if not result.data:
                 return self.fail_response("Failed to update agent")
@@ -661,6 +663,7 @@ class UpdateAgentTool(Tool):
             update_result = await client.table('agents').update({
                 'configured_mcps': current_mcps
             }).eq('agent_id', self.agent_id).execute()
+            await get_agent_config_resolver().invalidate(self.agent_id)
             
             if not update_result.data:
                 return self.fail_response("Failed to save MCP configuration")
@@ -1,10 +1,12 @@
-from tavily import AsyncTavilyClient
-import httpx
 from dotenv import load_dotenv
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
 from utils.config import config
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
+from services.scraper import get_scraper
+from services.web_search import get_web_search
+from typing import List, Optional, Union
+from urllib.parse import urlparse
 import json
 import os
 import datetime
@@ -30,8 +32,9 @@ class SandboxWebSearchTool(SandboxToolsBase):
         if not self.firecrawl_api_key:
             raise ValueError("FIRECRAWL_API_KEY not found in configuration")
 
-        # Tavily asynchronous search client
-        self.tavily_client = AsyncTavilyClient(api_key=self.tavily_api_key)
+        # Cached Tavily search shared by all runs of the process
+        self.web_search_client = get_web_search()
+        self._account_id: Optional[str] = None
 
     @openapi_schema({
         "type": "function",
@@ -106,7 +109,7 @@ class SandboxWebSearchTool(SandboxToolsBase):
 
             # Execute the search with Tavily
             logging.info(f"Executing web search for query: '{query}' with {num_results} results")
-            search_response = await self.tavily_client.search(
+            search_response = await self.web_search_client.search(
                 query=query,
                 max_results=num_results,
                 include_images=True,
@@ -210,26 +213,9 @@ class SandboxWebSearchTool(SandboxToolsBase):
             
             logging.info(f"Processing {len(url_list)} URLs: {url_list}")
             
-            # Process each URL and collect results
-            results = []
-            for url in url_list:
-                try:
-                    # Add protocol if missing
-                    if not (url.startswith('http://') or url.startswith('https://')):
-                        url = 'https://' + url
-                        logging.info(f"Added https:// protocol to URL: {url}")
-                    
-                    # Scrape this URL
-                    result = await self._scrape_single_url(url)
-                    results.append(result)
-                    
-                except Exception as e:
-                    logging.error(f"Error processing URL {url}: {str(e)}")
-                    results.append({
-                        "url": url,
-                        "success": False,
-                        "error": str(e)
-                    })
+            # Scrape all URLs concurrently, then write the results to the sandbox in one batch
+            pages = await get_scraper().scrape_many(url_list, account_id=await self._get_account_id())
+            results = await self._save_scrape_results(url_list, pages)
             
             # Summarize results
             successful = sum(1 for r in results if r.get("success", False))
@@ -264,117 +250,86 @@ class SandboxWebSearchTool(SandboxToolsBase):
             logging.error(f"Error in scrape_webpage: {error_message}")
             return self.fail_response(f"Error processing scrape request: {error_message[:200]}")
     
-    async def _scrape_single_url(self, url: str) -> dict:
+    async def _get_account_id(self) -> Optional[str]:
+        """
+        Account the project belongs to, scrapes are cached per account.
+        """
+        if self._account_id is None:
+            try:
+                client = await self.thread_manager.db.client
+                project = await client.table('projects').select('account_id').eq('project_id', self.project_id).execute()
+                if project.data:
+                    self._account_id = project.data[0].get('account_id')
+            except Exception as e:
+                logging.warning(f"Failed to get account of project {self.project_id}, scrapes won't be cached: {str(e)}")
+        return self._account_id
+
+    async def _save_scrape_results(self, urls: List[str], pages: List[Union[dict, Exception]]) -> List[dict]:
         """
-        Helper function to scrape a single URL and return the result information.
+        Save scraped pages to /workspace/scrape and return the result information of each URL.
         """
-        logging.info(f"Scraping single URL: {url}")
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        scrape_dir = f"{self.workspace_path}/scrape"
         
-        try:
-            # ---------- Firecrawl scrape endpoint ----------
-            logging.info(f"Sending request to Firecrawl for URL: {url}")
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
+        results = []
+        files = []
+        used_filenames = set()
+        for url, page in zip(urls, pages):
+            if isinstance(page, Exception):
+                logging.error(f"Error scraping URL '{url}': {str(page)}")
+                results.append({
                     "url": url,
-                    "formats": ["markdown"]
-                }
-                
-                # Use longer timeout and retry logic for more reliability
-                max_retries = 3
-                timeout_seconds = 120
-                retry_count = 0
-                
-                while retry_count < max_retries:
-                    try:
-                        logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
-                        response = await client.post(
-                            f"{self.firecrawl_url}/v1/scrape",
-                            json=payload,
-                            headers=headers,
-                            timeout=timeout_seconds,
-                        )
-                        response.raise_for_status()
-                        data = response.json()
-                        logging.info(f"Successfully received response from Firecrawl for {url}")
-                        break
-                    except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
-                        retry_count += 1
-                        logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
-                        if retry_count >= max_retries:
-                            raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
-                        # Exponential backoff
-                        logging.info(f"Waiting {2 ** retry_count}s before retry")
-                        await asyncio.sleep(2 ** retry_count)
-                    except Exception as e:
-                        # Don't retry on non-timeout errors
-                        logging.error(f"Error during scraping: {str(e)}")
-                        raise e
-
-            # Format the response
-            title = data.get("data", {}).get("metadata", {}).get("title", "")
-            markdown_content = data.get("data", {}).get("markdown", "")
-            logging.info(f"Extracted content from {url}: title='{title}', content length={len(markdown_content)}")
-            
-            formatted_result = {
-                "title": title,
-                "url": url,
-                "text": markdown_content
-            }
-            
-            # Add metadata if available
-            if "metadata" in data.get("data", {}):
-                formatted_result["metadata"] = data["data"]["metadata"]
-                logging.info(f"Added metadata: {data['data']['metadata'].keys()}")
+                    "success": False,
+                    "error": str(page)
+                })
+                continue
             
             # Create a simple filename from the URL domain and date
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Extract domain from URL for the filename
-            from urllib.parse import urlparse
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc.replace("www.", "")
-            
-            # Clean up domain for filename
+            domain = urlparse(page["url"]).netloc.replace("www.", "")
             domain = "".join([c if c.isalnum() else "_" for c in domain])
             safe_filename = f"{timestamp}_{domain}.json"
-            
-            logging.info(f"Generated filename: {safe_filename}")
-            
-            # Save results to a file in the /workspace/scrape directory
-            scrape_dir = f"{self.workspace_path}/scrape"
-            await self.sandbox.fs.create_folder(scrape_dir, "755")
+            suffix = 1
+            while safe_filename in used_filenames:
+                suffix += 1
+                safe_filename = f"{timestamp}_{domain}_{suffix}.json"
+            used_filenames.add(safe_filename)
             
             results_file_path = f"{scrape_dir}/{safe_filename}"
-            json_content = json.dumps(formatted_result, ensure_ascii=False, indent=2)
-            logging.info(f"Saving content to file: {results_file_path}, size: {len(json_content)} bytes")
-            
-            await self.sandbox.fs.upload_file(
-                json_content.encode(),
-                results_file_path,
-            )
-            
-            return {
-                "url": url,
+            files.append((json.dumps(page, ensure_ascii=False, indent=2).encode(), results_file_path))
+            results.append({
+                "url": page["url"],
                 "success": True,
-                "title": title,
+                "title": page["title"],
                 "file_path": results_file_path,
-                "content_length": len(markdown_content)
-            }
+                "content_length": len(page["text"])
+            })
         
-        except Exception as e:
-            error_message = str(e)
-            logging.error(f"Error scraping URL '{url}': {error_message}")
-            
-            # Create an error result
-            return {
-                "url": url,
-                "success": False,
-                "error": error_message
-            }
+        if files:
+            try:
+                await self.sandbox.fs.create_folder(scrape_dir, "755")
+                await self._upload_files(files)
+                logging.info(f"Saved {len(files)} scrape results to {scrape_dir}")
+            except Exception as e:
+                logging.error(f"Error saving scrape results: {str(e)}")
+                for result in results:
+                    if result["success"]:
+                        result.update(success=False, error=f"Failed to save result: {str(e)}")
+                        result.pop("file_path")
+        return results
+
+    async def _upload_files(self, files: List[tuple]) -> None:
+        """
+        Upload (content, path) pairs to the sandbox, in a single request where the SDK supports it.
+        """
+        if hasattr(self.sandbox.fs, "upload_files"):
+            try:
+                from daytona_sdk import FileUpload
+            except ImportError:
+                FileUpload = None
+            if FileUpload is not None:
+                await self.sandbox.fs.upload_files([FileUpload(source=content, destination=path) for content, path in files])
+                return
+        await asyncio.gather(*(self.sandbox.fs.upload_file(content, path) for content, path in files))
 
 if __name__ == "__main__":
     async def test_web_search():
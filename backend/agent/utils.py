@@ -1,17 +1,8 @@
-import json
 from typing import Optional
 from utils.logger import logger
 from services import redis
 from agent.run_agent import update_agent_run_status
-
-
-async def _cleanup_redis_response_list(agent_run_id: str):
-    try:
-        response_list_key = f"agent_run:{agent_run_id}:responses"
-        await redis.delete(response_list_key)
-        logger.debug(f"Cleaned up Redis response list for agent run {agent_run_id}")
-    except Exception as e:
-        logger.warning(f"Failed to clean up Redis response list for {agent_run_id}: {str(e)}")
+from agent.stop_signals import send_stop_signal
 
 
 async def check_for_active_project_agent_run(client, project_id: str):
@@ -30,22 +21,20 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    all_responses = []
-    try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
-        logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
-    except Exception as e:
-        logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
-
+    # The worker running the agent records the summary of its response journal when it
+    # stops; the journal itself stays in Redis until it expires
     update_success = await update_agent_run_status(
-        client, agent_run_id, final_status, error=error_message, responses=all_responses
+        client, agent_run_id, final_status, error=error_message
     )
 
     if not update_success:
         logger.error(f"Failed to update database status for stopped/failed run {agent_run_id}")
 
+    try:
+        await send_stop_signal(agent_run_id)
+    except Exception as e:
+        logger.error(f"Failed to send stop signal for agent run {agent_run_id}: {str(e)}")
+
     global_control_channel = f"agent_run:{agent_run_id}:control"
     try:
         await redis.publish(global_control_channel, "STOP")
@@ -70,8 +59,6 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
             else:
                  logger.warning(f"Unexpected key format found: {key}")
 
-        await _cleanup_redis_response_list(agent_run_id)
-
     except Exception as e:
         logger.error(f"Failed to find or signal active instances for {agent_run_id}: {str(e)}")
 
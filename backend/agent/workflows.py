@@ -18,13 +18,14 @@ from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stre
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
 from utils.config import config
-from sandbox.sandbox import create_sandbox, delete_sandbox, get_or_start_sandbox
+from sandbox.sandbox import delete_sandbox, get_or_start_sandbox
+from sandbox.pool import get_sandbox_pool
 from services.llm import make_llm_api_call
 from agent.run_agent import get_stream_context, run_agent_run_stream
 from utils.constants import MODEL_NAME_ALIASES
 from flags.flags import is_enabled
 from .utils import check_for_active_project_agent_run, stop_agent_run as _stop_agent_run
-from .config_helper import extract_agent_config
+from .config_resolver import get_agent_config_resolver
 
 router = APIRouter()
 db = None
@@ -448,16 +449,13 @@ async def execute_agent_workflow(
                 'order': step_data['step_order']
             })
     
-    agent_result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('agent_id', agent_id).execute()
-    if not agent_result.data:
+    agent_config = await get_agent_config_resolver().get_agent_config(agent_id)
+    if not agent_config:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    agent_data = agent_result.data[0]
-    account_id = agent_data['account_id']
+    account_id = agent_config['account_id']
     
-    version_data = agent_data.get('agent_versions')
-    agent_config = extract_agent_config(agent_data, version_data)
-    if version_data:
+    if agent_config.get('version_name'):
         logger.info(f"Using agent {agent_config['name']} ({agent_id}) version {agent_config.get('version_name', 'v1')} for workflow")
     else:
         logger.info(f"Using agent {agent_config['name']} ({agent_id}) - no version data for workflow")
@@ -545,21 +543,9 @@ async def execute_agent_workflow(
             # 2. Create Sandbox
             sandbox_id = None
             try:
-                from sandbox.sandbox import create_sandbox
-                sandbox_pass = str(uuid.uuid4())
-                sandbox = await create_sandbox(sandbox_pass, project_id)
-                sandbox_id = sandbox.id
-                logger.info(f"Created new sandbox {sandbox_id} for project {project_id}")
-
-                vnc_link = await sandbox.get_preview_link(6080)
-                website_link = await sandbox.get_preview_link(8080)
-                vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-                website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-                token = None
-                if hasattr(vnc_link, 'token'):
-                    token = vnc_link.token
-                elif "token='" in str(vnc_link):
-                    token = str(vnc_link).split("token='")[1].split("'")[0]
+                pooled_sandbox = await get_sandbox_pool().acquire(project_id)
+                sandbox_id = pooled_sandbox.id
+                logger.info(f"Got sandbox {sandbox_id} for project {project_id}")
             except Exception as e:
                 logger.error(f"Error creating sandbox: {str(e)}")
                 await client.table('projects').delete().eq('project_id', project_id).execute()
@@ -572,13 +558,7 @@ async def execute_agent_workflow(
                 raise Exception("Failed to create sandbox")
 
             update_result = await client.table('projects').update({
-                'sandbox': {
-                    'id': sandbox_id, 
-                    'pass': sandbox_pass, 
-                    'vnc_preview': vnc_url,
-                    'sandbox_url': website_url, 
-                    'token': token
-                }
+                'sandbox': pooled_sandbox.to_project_sandbox()
             }).eq('project_id', project_id).execute()
 
             if not update_result.data:
@@ -805,20 +785,13 @@ async def trigger_workflow_webhook(
                 content={"error": "Workflow is not active"}
             )
         
-        agent_result = await client.table('agents').select('*, agent_versions!current_version_id(*)').eq('agent_id', agent_id).execute()
-        if not agent_result.data:
+        agent_config = await get_agent_config_resolver().get_agent_config(agent_id)
+        if not agent_config:
             return JSONResponse(
                 status_code=404,
                 content={"error": "Agent not found"}
             )
         
-        agent_data = agent_result.data[0]
-        account_id = agent_data['account_id']
-        
-        version_data = agent_data.get('agent_versions')
-        agent_config = extract_agent_config(agent_data, version_data)
-        agent_config['account_id'] = account_id  # Ensure account_id is in the config
-        
         from triggers.integration import WorkflowTriggerExecutor
         from triggers.core import TriggerResult, TriggerEvent, TriggerType
 
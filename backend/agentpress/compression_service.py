@@ -0,0 +1,195 @@
+"""
+Context compression off the event loop.
+
+Counting tokens and compressing a thread of 100k+ tokens is CPU bound and would stall
+every other stream of the worker. The compression service runs it in a pool of
+config.CONTEXT_COMPRESSION_WORKERS processes, each warming up the tokenizers of the
+common model families when it starts. If the pool is disabled or broke, losing the
+work, it runs in this process on a thread instead. A call that is still unfinished
+after config.CONTEXT_COMPRESSION_TIMEOUT is not run a second time. Its messages are
+reduced without a tokenizer instead: messages are dropped from the middle of the
+thread until their token count, estimated from their length, fits the model.
+
+Metrics tell how long calls waited for a worker, how long workers spent on them and
+how often the fallback was used.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple
+
+from agentpress.context_manager import ContextManager
+from utils.config import config
+from utils.logger import logger
+
+# One model per tokenizer family, tokenized once when a worker starts
+WARMUP_MODELS = ('gpt-4o', 'gpt-4', 'claude-3-5-sonnet-latest')
+CHARS_PER_TOKEN = 4  # For the token count estimate of messages that timed out
+
+_worker_context_manager: Optional[ContextManager] = None
+
+
+@dataclass
+class CompressionResult:
+    """Compressed messages and the token counts before and after compression."""
+    messages: List[Dict[str, Any]]
+    token_count: int
+    compressed_token_count: int
+
+
+def _compress(context_manager: ContextManager, messages: List[Dict[str, Any]], llm_model: str) -> CompressionResult:
+    token_count = context_manager.count_tokens(messages, llm_model)
+    compressed = context_manager.compress_messages(messages, llm_model)
+    return CompressionResult(compressed, token_count, context_manager.count_tokens(compressed, llm_model))
+
+
+def _estimate_token_count(messages: List[Dict[str, Any]]) -> int:
+    return len(json.dumps(messages, ensure_ascii=False, default=str)) // CHARS_PER_TOKEN
+
+
+def _omit_by_estimate(context_manager: ContextManager, messages: List[Dict[str, Any]], llm_model: str) -> CompressionResult:
+    """Drop messages from the middle of the thread until their estimated token count fits the model.
+
+    The system message and the latest message are always kept.
+    """
+    result = context_manager.remove_meta_messages(messages)
+    max_tokens = context_manager.get_model_max_tokens(llm_model)
+    system_message = result[:1] if result and result[0].get('role') == 'system' else []
+    conversation = result[len(system_message):]
+    token_counts = [_estimate_token_count([message]) for message in conversation]
+    token_count = _estimate_token_count(system_message) + sum(token_counts)
+
+    compressed_token_count = token_count
+    while compressed_token_count > max_tokens and len(conversation) > 1:
+        middle = (len(conversation) - 1) // 2
+        del conversation[middle]
+        compressed_token_count -= token_counts.pop(middle)
+
+    compressed = context_manager.middle_out_messages(system_message + conversation)
+    if len(compressed) < len(system_message) + len(conversation):
+        compressed_token_count = _estimate_token_count(compressed)
+    return CompressionResult(compressed, token_count, compressed_token_count)
+
+
+def _init_worker() -> None:
+    from litellm.utils import token_counter
+
+    global _worker_context_manager
+    _worker_context_manager = ContextManager()
+    for model in WARMUP_MODELS:
+        try:
+            token_counter(model=model, messages=[{"role": "user", "content": "warmup"}])
+        except Exception:
+            pass
+
+
+def _compress_in_worker(messages: List[Dict[str, Any]], llm_model: str) -> Tuple[CompressionResult, float, float]:
+    started = time.time()
+    result = _compress(_worker_context_manager, messages, llm_model)
+    return result, started, time.time()
+
+
+@dataclass
+class CompressionMetrics:
+    """Counters of the compressions of this process."""
+    calls: int = 0
+    pool_calls: int = 0
+    fallbacks: int = 0
+    timeouts: int = 0  # Calls whose messages were reduced by estimate instead
+    queued_seconds: float = 0.0  # Waiting for a worker, including sending the messages
+    worker_seconds: float = 0.0  # Compressing in a worker
+    fallback_seconds: float = 0.0  # Compressing on a thread of this process
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        stats["avg_queued_ms"] = round(self.queued_seconds / self.pool_calls * 1000, 1) if self.pool_calls else 0.0
+        stats["avg_worker_ms"] = round(self.worker_seconds / self.pool_calls * 1000, 1) if self.pool_calls else 0.0
+        return stats
+
+
+class CompressionService:
+    """Counts and compresses messages in a process pool.
+
+    Args:
+        workers: Processes in the pool. 0 compresses on a thread of this process.
+        timeout: Seconds to wait for a worker before giving up on compressing.
+    """
+
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self.metrics = CompressionMetrics()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._context_manager = ContextManager()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # Spawned workers don't inherit the event loop and connections of this process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._pool
+
+    async def compress(self, messages: List[Dict[str, Any]], llm_model: str) -> CompressionResult:
+        """Count the tokens of messages and compress them to fit the context window of the model."""
+        self.metrics.calls += 1
+        pool = self._get_pool()
+        if pool is not None:
+            submitted = time.time()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(pool, _compress_in_worker, messages, llm_model)
+                result, started, finished = await asyncio.wait_for(future, self.timeout)
+                self.metrics.pool_calls += 1
+                self.metrics.queued_seconds += max(0.0, started - submitted)
+                self.metrics.worker_seconds += finished - started
+                return result
+            except asyncio.TimeoutError:
+                # Compressing again here would only add to the load that made the pool slow
+                self.metrics.timeouts += 1
+                result = _omit_by_estimate(self._context_manager, messages, llm_model)
+                logger.error(f"Context compression took longer than {self.timeout}s in the worker pool, "
+                             f"omitted messages instead: ~{result.token_count} -> ~{result.compressed_token_count} tokens "
+                             f"({len(messages)} -> {len(result.messages)} messages)")
+                return result
+            except BrokenProcessPool as e:
+                logger.error(f"Context compression pool broke, restarting it: {str(e)}")
+                if self._pool is pool:
+                    self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            except Exception as e:
+                logger.warning(f"Context compression failed in the worker pool, compressing in process: {str(e)}")
+
+        self.metrics.fallbacks += 1
+        started = time.time()
+        try:
+            return await asyncio.to_thread(_compress, self._context_manager, messages, llm_model)
+        finally:
+            self.metrics.fallback_seconds += time.time() - started
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_service: Optional[CompressionService] = None
+
+
+def get_compression_service() -> CompressionService:
+    """Get the process-wide compression service."""
+    global _service
+    if _service is None:
+        _service = CompressionService(
+            workers=config.CONTEXT_COMPRESSION_WORKERS,
+            timeout=config.CONTEXT_COMPRESSION_TIMEOUT,
+        )
+    return _service
@@ -6,6 +6,8 @@ reaching the context window limitations of LLM models.
 """
 
 import json
+import hashlib
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Union
 
 from litellm.utils import token_counter
@@ -13,6 +15,64 @@ from services.supabase import DBConnection
 from utils.logger import logger
 
 DEFAULT_TOKEN_THRESHOLD = 120000
+TOKEN_CACHE_MAX_ENTRIES = 50000
+
+# Substrings identifying models that share a tokenizer, most specific first
+MODEL_FAMILIES = ('claude', 'gpt-4o', 'gpt-4.1', 'gpt', 'gemini', 'deepseek', 'llama', 'grok')
+
+
+def get_model_family(model: str) -> str:
+    """Get the tokenizer family of a model, so e.g. Bedrock and OpenRouter variants share counts."""
+    model_lower = model.lower()
+    for family in MODEL_FAMILIES:
+        if family in model_lower:
+            return family
+    return model_lower
+
+
+class MessageTokenCounter:
+    """Counts message tokens, caching the count of each message by content hash and model family.
+
+    List totals are the sum of the per-message counts, so recounting a list only
+    tokenizes messages whose content changed since they were last counted. The sum
+    slightly overestimates token_counter over the whole list, which adds its reply
+    priming tokens once rather than per message.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+
+    def _message_hash(self, msg: Dict[str, Any]) -> str:
+        content = msg.get('content')
+        if isinstance(content, str) and msg.keys() <= {'role', 'content', 'message_id'}:
+            key = f"{msg.get('role')}\0{content}"
+        else:
+            key = json.dumps({k: v for k, v in msg.items() if k != 'message_id'}, sort_keys=True, default=str)
+        return hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+    def count_message(self, msg: Dict[str, Any], model: str) -> int:
+        """Count the tokens of a single message."""
+        cache_key = (get_model_family(model), self._message_hash(msg))
+        count = self._counts.get(cache_key)
+        if count is not None:
+            self._counts.move_to_end(cache_key)
+            return count
+
+        count = token_counter(model=model, messages=[msg])
+        self._counts[cache_key] = count
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return count
+
+    def count_messages(self, messages: List[Dict[str, Any]], model: str) -> int:
+        """Count the tokens of a list of messages."""
+        return sum(self.count_message(msg, model) for msg in messages)
+
+
+# Shared across ContextManager instances so counts survive across runs
+_message_token_counter = MessageTokenCounter()
+
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
@@ -25,6 +85,11 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self.message_token_counter = _message_token_counter
+
+    def count_tokens(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Count the tokens of a list of messages using the per-message token cache."""
+        return self.message_token_counter.count_messages(messages, llm_model)
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -94,7 +159,7 @@ class ContextManager:
   
     def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -102,7 +167,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.message_token_counter.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent ToolResult message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -116,7 +181,7 @@ class ContextManager:
 
     def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -124,7 +189,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.message_token_counter.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent User message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -138,7 +203,7 @@ class ContextManager:
 
     def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
         
         if uncompressed_total_token_count > max_tokens_value:
@@ -146,7 +211,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.message_token_counter.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent Assistant message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -186,6 +251,19 @@ class ContextManager:
                 result.append(msg)
         return result
 
+    def get_model_max_tokens(self, llm_model: str) -> int:
+        """Tokens of messages that leave room for the response in the context window of the model."""
+        if 'sonnet' in llm_model.lower():
+            return 200 * 1000 - 64000 - 28000
+        elif 'gpt' in llm_model.lower():
+            return 128 * 1000 - 28000
+        elif 'gemini' in llm_model.lower():
+            return 1000 * 1000 - 300000
+        elif 'deepseek' in llm_model.lower():
+            return 128 * 1000 - 28000
+        else:
+            return 41 * 1000 - 10000
+
     def compress_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int] = 41000, token_threshold: int = 4096, max_iterations: int = 5) -> List[Dict[str, Any]]:
         """Compress the messages.
         
@@ -197,27 +275,18 @@ class ContextManager:
             max_iterations: Maximum number of compression iterations
         """
         # Set model-specific token limits
-        if 'sonnet' in llm_model.lower():
-            max_tokens = 200 * 1000 - 64000 - 28000
-        elif 'gpt' in llm_model.lower():
-            max_tokens = 128 * 1000 - 28000
-        elif 'gemini' in llm_model.lower():
-            max_tokens = 1000 * 1000 - 300000
-        elif 'deepseek' in llm_model.lower():
-            max_tokens = 128 * 1000 - 28000
-        else:
-            max_tokens = 41 * 1000 - 10000
+        max_tokens = self.get_model_max_tokens(llm_model)
 
         result = messages
         result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        uncompressed_total_token_count = self.count_tokens(result, llm_model)
 
         result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = self.count_tokens(result, llm_model)
 
         logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
@@ -255,16 +324,20 @@ class ContextManager:
         result = messages
         result = self.remove_meta_messages(result)
 
-        # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        # Count each message once; totals are then updated as messages are dropped
+        message_token_counts = [self.message_token_counter.count_message(msg, llm_model) for msg in result]
+        initial_token_count = sum(message_token_counts)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
+        # Early exit if no compression needed
         if initial_token_count <= max_allowed_tokens:
             return result
 
         # Separate system message (assumed to be first) from conversation messages
         system_message = messages[0] if messages and messages[0].get('role') == 'system' else None
         conversation_messages = result[1:] if system_message else result
+        conversation_token_counts = message_token_counts[1:] if system_message else message_token_counts
+        system_token_count = message_token_counts[0] if system_message else 0
         
         safety_limit = 500
         current_token_count = initial_token_count
@@ -282,22 +355,23 @@ class ContextManager:
                 middle_start = len(conversation_messages) // 2 - (removal_batch_size // 2)
                 middle_end = middle_start + removal_batch_size
                 conversation_messages = conversation_messages[:middle_start] + conversation_messages[middle_end:]
+                conversation_token_counts = conversation_token_counts[:middle_start] + conversation_token_counts[middle_end:]
             else:
                 # Remove from earlier messages, preserving recent context
                 messages_to_remove = min(removal_batch_size, len(conversation_messages) // 2)
                 if messages_to_remove > 0:
                     conversation_messages = conversation_messages[messages_to_remove:]
+                    conversation_token_counts = conversation_token_counts[messages_to_remove:]
                 else:
                     # Can't remove any more messages
                     break
 
-            # Recalculate token count
-            messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            # Update the token count from the cached per-message counts
+            current_token_count = system_token_count + sum(conversation_token_counts)
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = current_token_count
         
         logger.info(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
@@ -0,0 +1,241 @@
+"""
+Per-thread cache of LLM messages for AgentPress.
+
+Keeps the LLM messages of recently used threads in process, with an optional
+Redis tier shared across workers, so ThreadManager.get_llm_messages only has to
+fetch the rows created since the last sync instead of the whole thread.
+
+After each delta sync the cache is checked against the thread's version in the DB,
+its count of LLM messages and their latest updated_at. Rows deleted, edited or
+flipped to non-LLM elsewhere, or committed late with an earlier created_at, change
+the version and the thread is reloaded.
+
+Messages are kept as JSON strings and parsed on every read, so callers always get
+fresh objects they can mutate (context compression and prompt caching both do).
+"""
+
+import bisect
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+
+def _parse_created_at(created_at: str) -> datetime:
+    return datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+
+
+def _latest(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    if not first or not second:
+        return first or second
+    return first if _parse_created_at(first) >= _parse_created_at(second) else second
+
+
+@dataclass
+class CachedMessage:
+    """A single LLM message row as stored in the cache."""
+    message_id: str
+    created_at: datetime
+    content: str  # JSON-serialized message content
+
+
+@dataclass
+class CachedThread:
+    """Ordered LLM messages of a thread and the point up to which they were synced with the DB."""
+    messages: List[CachedMessage] = field(default_factory=list)
+    message_ids: Set[str] = field(default_factory=set)
+    synced_at: Optional[str] = None  # created_at of the newest row returned by the DB
+    updated_at: Optional[str] = None  # Latest updated_at of the rows returned by the DB
+    loaded_at: float = field(default_factory=time.time)
+    size: int = 0
+    persisted: int = 0  # Number of leading messages already written to Redis
+
+    def add(self, message: CachedMessage) -> bool:
+        """Insert a message in created_at order. Returns False if it was already cached."""
+        if message.message_id in self.message_ids:
+            return False
+        if not self.messages or message.created_at >= self.messages[-1].created_at:
+            self.messages.append(message)
+        else:
+            index = bisect.bisect_right([m.created_at for m in self.messages], message.created_at)
+            self.messages.insert(index, message)
+            if index < self.persisted:
+                self.persisted = 0
+        self.message_ids.add(message.message_id)
+        self.size += len(message.content)
+        return True
+
+
+class ThreadMessageCache:
+    """LRU cache of LLM messages per thread, bounded by the total size of cached content.
+
+    Entries (in memory and in Redis) are reloaded from scratch once they are older than
+    ttl, or when is_current() finds that the thread changed in the DB.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, use_redis: bool = False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self._threads: "OrderedDict[str, CachedThread]" = OrderedDict()
+        self._size = 0
+
+    def _redis_key(self, thread_id: str) -> str:
+        return f"thread_messages:{thread_id}"
+
+    async def get(self, thread_id: str) -> Optional[CachedThread]:
+        """Get the cached messages of a thread from memory, falling back to Redis."""
+        cached = self._threads.get(thread_id)
+        if cached and time.time() - cached.loaded_at > self.ttl:
+            self._drop(thread_id)
+            cached = None
+
+        if cached:
+            self._threads.move_to_end(thread_id)
+            return cached
+
+        if not self.use_redis:
+            return None
+
+        try:
+            redis_client = await redis.get_client()
+            key = self._redis_key(thread_id)
+            meta = await redis_client.hgetall(f"{key}:meta")
+            if not meta or time.time() - float(meta.get('loaded_at', 0)) > self.ttl:
+                return None
+            rows = await redis_client.lrange(key, 0, -1)
+        except Exception as e:
+            logger.warning(f"Failed to load cached messages for thread {thread_id} from Redis: {str(e)}")
+            return None
+
+        cached = CachedThread(synced_at=meta.get('synced_at') or None, updated_at=meta.get('updated_at') or None,
+                              loaded_at=float(meta['loaded_at']))
+        for row in rows:
+            data = json.loads(row)
+            cached.add(CachedMessage(data['message_id'], _parse_created_at(data['created_at']), data['content']))
+        cached.persisted = len(cached.messages)
+        self._store(thread_id, cached)
+        return cached
+
+    async def sync(self, thread_id: str, cached: Optional[CachedThread], rows: List[Dict[str, Any]]) -> CachedThread:
+        """Merge rows fetched from the DB (ordered by created_at) into the cached thread."""
+        is_full_load = cached is None
+        if cached is None:
+            cached = CachedThread()
+        self._drop(thread_id)
+
+        for row in rows:
+            content = row['content'] if isinstance(row['content'], str) else json.dumps(row['content'])
+            cached.add(CachedMessage(row['message_id'], _parse_created_at(row['created_at']), content))
+            cached.updated_at = _latest(cached.updated_at, row.get('updated_at'))
+        if rows:
+            cached.synced_at = rows[-1]['created_at']
+
+        self._store(thread_id, cached)
+
+        if self.use_redis and (is_full_load or cached.persisted < len(cached.messages)):
+            await self._sync_redis(thread_id, cached)
+        return cached
+
+    def append(self, thread_id: str, row: Dict[str, Any]) -> None:
+        """Add a message row that was just written, if the thread is cached in process."""
+        cached = self._threads.get(thread_id)
+        if not cached or 'created_at' not in row:
+            return
+        content = row['content'] if isinstance(row['content'], str) else json.dumps(row['content'])
+        if cached.add(CachedMessage(row['message_id'], _parse_created_at(row['created_at']), content)):
+            cached.updated_at = _latest(cached.updated_at, row.get('updated_at'))
+            self._size += len(content)
+            self._evict()
+
+    @staticmethod
+    def is_current(cached: CachedThread, message_count: int, updated_at: Optional[str]) -> bool:
+        """Whether a synced thread matches the version of the thread in the DB.
+
+        Args:
+            cached: The thread after syncing the rows created since the previous sync.
+            message_count: Number of LLM messages of the thread in the DB.
+            updated_at: Latest updated_at of those messages, None if there are none.
+        """
+        if len(cached.messages) != message_count:
+            return False
+        if updated_at is None:
+            return True
+        # Rows written since the sync may be newer than the DB version read after it, never older
+        return cached.updated_at is not None and _parse_created_at(updated_at) <= _parse_created_at(cached.updated_at)
+
+    async def invalidate(self, thread_id: str) -> None:
+        """Drop the cached messages of a thread, e.g. after messages were deleted or summarized."""
+        self._drop(thread_id)
+        if not self.use_redis:
+            return
+        try:
+            key = self._redis_key(thread_id)
+            await redis.delete(key)
+            await redis.delete(f"{key}:meta")
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached messages for thread {thread_id} in Redis: {str(e)}")
+
+    def _store(self, thread_id: str, cached: CachedThread) -> None:
+        self._threads[thread_id] = cached
+        self._threads.move_to_end(thread_id)
+        self._size += cached.size
+        self._evict()
+
+    def _drop(self, thread_id: str) -> None:
+        cached = self._threads.pop(thread_id, None)
+        if cached:
+            self._size -= cached.size
+
+    def _evict(self) -> None:
+        # Always keep the most recently used thread, even if it alone exceeds the cap
+        while self._size > self.max_bytes and len(self._threads) > 1:
+            thread_id, cached = self._threads.popitem(last=False)
+            self._size -= cached.size
+            logger.debug(f"Evicted cached messages for thread {thread_id} ({cached.size} bytes)")
+
+    async def _sync_redis(self, thread_id: str, cached: CachedThread) -> None:
+        """Write messages not yet in Redis through to it, rewriting the list if order changed."""
+        key = self._redis_key(thread_id)
+        rewrite = cached.persisted == 0
+        to_write = cached.messages[cached.persisted:]
+        try:
+            redis_client = await redis.get_client()
+            if rewrite:
+                await redis_client.delete(key)
+            if to_write:
+                await redis_client.rpush(key, *[
+                    json.dumps({'message_id': m.message_id, 'created_at': m.created_at.isoformat(), 'content': m.content})
+                    for m in to_write
+                ])
+            await redis_client.hset(f"{key}:meta", mapping={
+                'synced_at': cached.synced_at or '',
+                'updated_at': cached.updated_at or '',
+                'loaded_at': cached.loaded_at
+            })
+            await redis_client.expire(key, self.ttl)
+            await redis_client.expire(f"{key}:meta", self.ttl)
+            cached.persisted = len(cached.messages)
+        except Exception as e:
+            logger.warning(f"Failed to write cached messages for thread {thread_id} to Redis: {str(e)}")
+
+
+_message_cache: Optional[ThreadMessageCache] = None
+
+
+def get_message_cache() -> ThreadMessageCache:
+    """Get the process-wide thread message cache."""
+    global _message_cache
+    if _message_cache is None:
+        _message_cache = ThreadMessageCache(
+            max_bytes=config.THREAD_MESSAGE_CACHE_MAX_BYTES,
+            ttl=config.THREAD_MESSAGE_CACHE_TTL,
+            use_redis=config.THREAD_MESSAGE_CACHE_REDIS,
+        )
+    return _message_cache
@@ -0,0 +1,96 @@
+"""
+Write-behind persistence of status messages for AgentPress.
+
+Status rows (tool started/completed, thread_run_start, ...) are not read back by the
+LLM, so ThreadManager.add_message hands them to a MessageWriter instead of awaiting
+one insert per row on the streaming path. The writer gives out message IDs and
+timestamps client-side, so callers can yield the row right away, and writes queued
+rows in bulk inserts.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from services.supabase import DBConnection
+from utils.logger import logger
+
+FLUSH_INTERVAL = 0.5  # Seconds a queued row may wait before being written
+MAX_BATCH_SIZE = 50
+
+
+class MessageWriter:
+    """Queues message rows and writes them to the messages table in batches.
+
+    Rows are flushed FLUSH_INTERVAL seconds after the first row is queued, as soon
+    as MAX_BATCH_SIZE rows are queued, or synchronously through flush().
+    """
+
+    def __init__(self, db: DBConnection, flush_interval: float = FLUSH_INTERVAL, max_batch_size: int = MAX_BATCH_SIZE):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._queue: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    def enqueue(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a row for insertion and return it as it will be stored.
+
+        Args:
+            data: Row to insert, without message_id or timestamps.
+
+        Returns:
+            The row including its client-side message_id, created_at and updated_at.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        row = {
+            'message_id': str(uuid.uuid4()),
+            **data,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self._queue.append(row)
+
+        if len(self._queue) >= self.max_batch_size:
+            self._spawn(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = self._spawn(self._flush_later())
+        return dict(row)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # Keep a reference until the flush is done, so it is not garbage collected mid-flight
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._flush_done)
+        return task
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background flush of queued messages failed: {str(task.exception())}")
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write all queued rows. Batches are written in the order they were queued."""
+        async with self._lock:
+            if not self._queue:
+                return
+            batch, self._queue = self._queue, []
+            client = await self.db.client
+            try:
+                await client.table('messages').insert(batch).execute()
+                logger.debug(f"Flushed {len(batch)} queued messages")
+            except Exception as e:
+                # Don't let a single bad row drop the whole batch
+                logger.warning(f"Bulk insert of {len(batch)} queued messages failed, inserting one by one: {str(e)}")
+                for row in batch:
+                    try:
+                        await client.table('messages').insert(row).execute()
+                    except Exception as row_e:
+                        logger.error(f"Failed to write queued message {row['message_id']} to thread {row.get('thread_id')}: {str(row_e)}")
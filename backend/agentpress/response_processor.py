@@ -18,9 +18,8 @@ from dataclasses import dataclass
 from utils.logger import logger
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
-from agentpress.xml_tool_parser import XMLToolParser
-from langfuse.client import StatefulTraceClient
-from services.langfuse import langfuse
+from agentpress.xml_tool_parser import XMLToolParser, StreamingXMLChunkScanner
+from services.tracing import RunTrace, trace_run
 from agentpress.utils.json_helpers import (
     ensure_dict, ensure_list, safe_json_parse, 
     to_json_string, format_for_yield
@@ -33,6 +32,9 @@ XmlAddingStrategy = Literal["user_message", "assistant_message", "inline_edit"]
 # Type alias for tool execution strategy
 ToolExecutionStrategy = Literal["sequential", "parallel"]
 
+# Characters of a malformed XML chunk included in error logs
+MAX_LOGGED_CHUNK = 500
+
 @dataclass
 class ToolExecutionContext:
     """Context for a tool execution including call details, result, and display info."""
@@ -86,7 +88,7 @@ class ProcessorConfig:
 class ResponseProcessor:
     """Processes LLM responses, extracting and executing tool calls."""
     
-    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
+    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable, trace: Optional[RunTrace] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
         """Initialize the ResponseProcessor.
         
         Args:
@@ -97,7 +99,7 @@ class ResponseProcessor:
         """
         self.tool_registry = tool_registry
         self.add_message = add_message_callback
-        self.trace = trace or langfuse.trace(name="anonymous:response_processor")
+        self.trace = trace or trace_run(name="anonymous:response_processor")
         # Initialize the XML parser with backwards compatibility
         self.xml_parser = XMLToolParser(strict_mode=False)
         self.is_agent_builder = is_agent_builder
@@ -161,7 +163,7 @@ class ResponseProcessor:
         """
         accumulated_content = ""
         tool_calls_buffer = {}
-        current_xml_content = ""
+        xml_scanner = StreamingXMLChunkScanner(self.tool_registry.get_xml_tag_matcher())
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
@@ -173,6 +175,7 @@ class ResponseProcessor:
         has_printed_thinking_prefix = False # Flag for printing thinking prefix only once
         agent_should_terminate = False # Flag to track if a terminating tool has been executed
         complete_native_tool_calls = [] # Initialize early for use in assistant_response_end
+        stream_cancelled = False # Set when the run is stopped while the stream is being processed
 
         # Collect metadata for reconstructing LiteLLM response object
         streaming_metadata = {
@@ -254,7 +257,6 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -274,9 +276,8 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
+                            xml_chunks = xml_scanner.feed(chunk_content)
                             for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -558,9 +559,7 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
-                    xml_chunks_buffer.extend(xml_chunks)
+                    # The scanner emitted every complete block during streaming
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
                     xml_chunks_to_process = xml_chunks_buffer[:remaining_limit] # Ensure limit is respected
@@ -810,6 +809,16 @@ class ResponseProcessor:
             self.trace.event(name="re_raising_error_to_stop_further_processing", level="ERROR", status_message=(f"Re-raising error to stop further processing: {str(e)}"))
             raise # Use bare 'raise' to preserve the original exception with its traceback
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # The run was stopped mid-stream: don't leave streamed tool executions running
+            logger.info(f"Stream processing cancelled, cancelling {len(pending_tool_executions)} pending tool executions")
+            self.trace.event(name="stream_processing_cancelled", level="WARNING", status_message=(f"Stream processing cancelled with {len(pending_tool_executions)} pending tool executions"))
+            for execution in pending_tool_executions:
+                if not execution["task"].done():
+                    execution["task"].cancel()
+            stream_cancelled = True
+            raise
+
         finally:
             # Save and Yield the final thread_run_end status
             try:
@@ -818,7 +827,8 @@ class ResponseProcessor:
                     thread_id=thread_id, type="status", content=end_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
                 )
-                if end_msg_obj: yield format_for_yield(end_msg_obj)
+                # Yielding while cancelled would swallow the cancellation
+                if end_msg_obj and not stream_cancelled: yield format_for_yield(end_msg_obj)
             except Exception as final_e:
                 logger.error(f"Error in finally block: {str(final_e)}", exc_info=True)
                 self.trace.event(name="error_in_finally_block", level="ERROR", status_message=(f"Error in finally block: {str(final_e)}"))
@@ -1094,96 +1104,9 @@ class ResponseProcessor:
             return None
 
     def _extract_xml_chunks(self, content: str) -> List[str]:
-        """Extract complete XML chunks using start and end pattern matching."""
-        chunks = []
-        pos = 0
-        
-        try:
-            # First, look for new format <function_calls> blocks
-            start_pattern = '<function_calls>'
-            end_pattern = '</function_calls>'
-            
-            while pos < len(content):
-                # Find the next function_calls block
-                start_pos = content.find(start_pattern, pos)
-                if start_pos == -1:
-                    break
-                
-                # Find the matching end tag
-                end_pos = content.find(end_pattern, start_pos)
-                if end_pos == -1:
-                    break
-                
-                # Extract the complete block including tags
-                chunk_end = end_pos + len(end_pattern)
-                chunk = content[start_pos:chunk_end]
-                chunks.append(chunk)
-                
-                # Move position past this chunk
-                pos = chunk_end
-            
-            # If no new format found, fall back to old format for backwards compatibility
-            if not chunks:
-                pos = 0
-                while pos < len(content):
-                    # Find the next tool tag
-                    next_tag_start = -1
-                    current_tag = None
-                    
-                    # Find the earliest occurrence of any registered tag
-                    for tag_name in self.tool_registry.xml_tools.keys():
-                        start_pattern = f'<{tag_name}'
-                        tag_pos = content.find(start_pattern, pos)
-                        
-                        if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
-                            next_tag_start = tag_pos
-                            current_tag = tag_name
-                    
-                    if next_tag_start == -1 or not current_tag:
-                        break
-                    
-                    # Find the matching end tag
-                    end_pattern = f'</{current_tag}>'
-                    tag_stack = []
-                    chunk_start = next_tag_start
-                    current_pos = next_tag_start
-                    
-                    while current_pos < len(content):
-                        # Look for next start or end tag of the same type
-                        next_start = content.find(f'<{current_tag}', current_pos + 1)
-                        next_end = content.find(end_pattern, current_pos)
-                        
-                        if next_end == -1:  # No closing tag found
-                            break
-                        
-                        if next_start != -1 and next_start < next_end:
-                            # Found nested start tag
-                            tag_stack.append(next_start)
-                            current_pos = next_start + 1
-                        else:
-                            # Found end tag
-                            if not tag_stack:  # This is our matching end tag
-                                chunk_end = next_end + len(end_pattern)
-                                chunk = content[chunk_start:chunk_end]
-                                chunks.append(chunk)
-                                pos = chunk_end
-                                break
-                            else:
-                                # Pop nested tag
-                                tag_stack.pop()
-                                current_pos = next_end + 1
-                    
-                    if current_pos >= len(content):  # Reached end without finding closing tag
-                        break
-                    
-                    pos = max(pos + 1, current_pos)
-        
-        except Exception as e:
-            logger.error(f"Error extracting XML chunks: {e}")
-            logger.error(f"Content was: {content}")
-            self.trace.event(name="error_extracting_xml_chunks", level="ERROR", status_message=(f"Error extracting XML chunks: {e}"), metadata={"content": content})
-        
-        return chunks
+        """Extract complete XML chunks (<function_calls> blocks and legacy tool tags) in a single pass."""
+        scanner = StreamingXMLChunkScanner(self.tool_registry.get_xml_tag_matcher())
+        return scanner.feed(content)
 
     def _parse_xml_tool_call(self, xml_chunk: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
         """Parse XML chunk into tool call format and return parsing details.
@@ -1200,7 +1123,7 @@ class ResponseProcessor:
                 parsed_calls = self.xml_parser.parse_content(xml_chunk)
                 
                 if not parsed_calls:
-                    logger.error(f"No tool calls found in XML chunk: {xml_chunk}")
+                    logger.error(f"No tool calls found in XML chunk: {xml_chunk[:MAX_LOGGED_CHUNK]}", chunk_length=len(xml_chunk))
                     return None
                 
                 # Take the first tool call (should only be one per chunk)
@@ -1224,7 +1147,7 @@ class ResponseProcessor:
             # Extract tag name and validate
             tag_match = re.match(r'<([^\s>]+)', xml_chunk)
             if not tag_match:
-                logger.error(f"No tag found in XML chunk: {xml_chunk}")
+                logger.error(f"No tag found in XML chunk: {xml_chunk[:MAX_LOGGED_CHUNK]}", chunk_length=len(xml_chunk))
                 self.trace.event(name="no_tag_found_in_xml_chunk", level="ERROR", status_message=(f"No tag found in XML chunk: {xml_chunk}"))
                 return None
             
@@ -16,16 +16,19 @@ from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.compression_service import get_compression_service
+from agentpress.message_cache import get_message_cache
+from agentpress.message_writer import MessageWriter
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
 )
 from services.supabase import DBConnection
+from services.billing import record_usage
 from utils.logger import logger
-from langfuse.client import StatefulGenerationClient, StatefulTraceClient
-from services.langfuse import langfuse
+from langfuse.client import StatefulGenerationClient
+from services.tracing import RunTrace, trace_run
 import datetime
-from litellm.utils import token_counter
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
@@ -38,7 +41,7 @@ class ThreadManager:
     XML-based tool execution patterns.
     """
 
-    def __init__(self, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
+    def __init__(self, trace: Optional[RunTrace] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
         """Initialize ThreadManager.
 
         Args:
@@ -54,7 +57,7 @@ class ThreadManager:
         self.target_agent_id = target_agent_id
         self.agent_config = agent_config
         if not self.trace:
-            self.trace = langfuse.trace(name="anonymous:thread_manager")
+            self.trace = trace_run(name="anonymous:thread_manager")
         self.response_processor = ResponseProcessor(
             tool_registry=self.tool_registry,
             add_message_callback=self.add_message,
@@ -64,6 +67,11 @@ class ThreadManager:
             agent_config=self.agent_config
         )
         self.context_manager = ContextManager()
+        self.message_cache = get_message_cache()
+        self.message_writer = MessageWriter(self.db)
+        # Latest browser_state message written in this run, kept so the agent loop
+        # doesn't have to download the screenshot it just produced
+        self.latest_browser_state: Optional[Dict[str, Any]] = None
 
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
@@ -81,6 +89,10 @@ class ThreadManager:
     ):
         """Add a message to the thread in the database.
 
+        Non-LLM status messages are written behind: they get a client-side ID, are
+        queued on the message writer and flushed in batches. The queue is flushed
+        synchronously when a run ends or reports an error.
+
         Args:
             thread_id: The ID of the thread to add the message to.
             type: The type of the message (e.g., 'text', 'image_url', 'tool_call', 'tool', 'user', 'assistant').
@@ -111,12 +123,27 @@ class ThreadManager:
         if agent_version_id:
             data_to_insert['agent_version_id'] = agent_version_id
 
+        if type == 'status' and not is_llm_message:
+            message = self.message_writer.enqueue(data_to_insert)
+            status_type = content.get('status_type') if isinstance(content, dict) else None
+            if status_type in ('thread_run_end', 'error'):
+                await self.message_writer.flush()
+            return message
+
         try:
             # Insert the message and get the inserted row data including the id
             result = await client.table('messages').insert(data_to_insert).execute()
             logger.info(f"Successfully added message to thread {thread_id}")
 
+            if type == 'assistant_response_end':
+                try:
+                    await record_usage(client, thread_id, content)
+                except Exception as e:
+                    logger.error(f"Failed to record usage for thread {thread_id}: {str(e)}")
+
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
+                if is_llm_message:
+                    self.message_cache.append(thread_id, result.data[0])
                 return result.data[0]
             else:
                 logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
@@ -128,8 +155,9 @@ class ThreadManager:
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
-        This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        Messages are served from the thread message cache; only rows created since
+        the last sync are fetched from the database. The thread is reloaded whole if
+        its count of LLM messages or their latest update no longer match the cache.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -141,48 +169,32 @@ class ThreadManager:
         client = await self.db.client
 
         try:
-            # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Fetch messages in batches of 1000 to avoid overloading the database
-            all_messages = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_messages.extend(result.data)
-                
-                # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # Use all_messages instead of result.data in the rest of the method
-            result_data = all_messages
-
-            # Parse the returned data which might be stringified JSON
-            if not result_data:
-                return []
-
-            # Return properly parsed JSON objects
+            cached = await self.message_cache.get(thread_id)
+            synced_at = cached.synced_at if cached else None
+
+            new_rows = await self._fetch_llm_message_rows(client, thread_id, synced_at)
+            cached = await self.message_cache.sync(thread_id, cached, new_rows)
+            logger.debug(f"Fetched {len(new_rows)} new messages for thread {thread_id} ({len(cached.messages)} cached)")
+
+            if synced_at:
+                version = await client.table('messages').select('updated_at', count='exact').eq('thread_id', thread_id).eq('is_llm_message', True).order('updated_at', desc=True).limit(1).execute()
+                updated_at = version.data[0]['updated_at'] if version.data else None
+                if not self.message_cache.is_current(cached, version.count or 0, updated_at):
+                    logger.info(f"Messages of thread {thread_id} changed outside this process, reloading them")
+                    await self.message_cache.invalidate(thread_id)
+                    rows = await self._fetch_llm_message_rows(client, thread_id, None)
+                    cached = await self.message_cache.sync(thread_id, None, rows)
+
+            # Return freshly parsed JSON objects
             messages = []
-            for item in result_data:
-                if isinstance(item['content'], str):
-                    try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item['content']}")
-                else:
-                    content = item['content']
-                    content['message_id'] = item['message_id']
-                    messages.append(content)
+            for item in cached.messages:
+                try:
+                    parsed_item = json.loads(item.content)
+                except json.JSONDecodeError:
+                    logger.error(f"Failed to parse message: {item.content}")
+                    continue
+                parsed_item['message_id'] = item.message_id
+                messages.append(parsed_item)
 
             return messages
 
@@ -190,6 +202,40 @@ class ThreadManager:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
             return []
 
+    async def _fetch_llm_message_rows(self, client, thread_id: str, synced_at: Optional[str]) -> List[Dict[str, Any]]:
+        """Fetch the LLM message rows of a thread created at or after synced_at, all of them if None."""
+        # Fetch in batches of 1000 to avoid overloading the database
+        rows = []
+        batch_size = 1000
+        offset = 0
+
+        while True:
+            query = client.table('messages').select('message_id, content, created_at, updated_at').eq('thread_id', thread_id).eq('is_llm_message', True)
+            if synced_at:
+                # Rows sharing the synced timestamp are deduplicated by the cache
+                query = query.gte('created_at', synced_at)
+            result = await query.order('created_at').range(offset, offset + batch_size - 1).execute()
+
+            if not result.data or len(result.data) == 0:
+                break
+
+            rows.extend(result.data)
+
+            # If we got fewer than batch_size records, we've reached the end
+            if len(result.data) < batch_size:
+                break
+
+            offset += batch_size
+        return rows
+
+    async def flush_messages(self):
+        """Write all status messages still queued on the message writer."""
+        await self.message_writer.flush()
+
+    async def invalidate_message_cache(self, thread_id: str):
+        """Drop cached LLM messages of a thread after its messages were deleted or summarized."""
+        await self.message_cache.invalidate(thread_id)
+
     async def run_thread(
         self,
         thread_id: str,
@@ -254,29 +300,8 @@ class ThreadManager:
 
         # Add XML examples to system prompt if requested, do this only ONCE before the loop
         if include_xml_examples and config.xml_tool_calling:
-            xml_examples = self.tool_registry.get_xml_examples()
-            if xml_examples:
-                examples_content = """
---- XML TOOL CALLING ---
-
-In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
-Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
-String and scalar parameters should be specified as attributes, while content goes between tags.
-Note that spaces for string values are not stripped. The output is parsed with regular expressions.
-
-Here are the XML tools available with examples:
-"""
-                for tag_name, example in xml_examples.items():
-                    examples_content += f"<{tag_name}> Example: {example}\\n"
-
-                # # Save examples content to a file
-                # try:
-                #     with open('xml_examples.txt', 'w') as f:
-                #         f.write(examples_content)
-                #     logger.debug("Saved XML examples to xml_examples.txt")
-                # except Exception as e:
-                #     logger.error(f"Failed to save XML examples to file: {e}")
-
+            examples_content = self.tool_registry.get_xml_examples_prompt()
+            if examples_content:
                 system_content = working_system_prompt.get('content')
 
                 if isinstance(system_content, str):
@@ -308,18 +333,7 @@ Here are the XML tools available with examples:
                 # 1. Get messages from thread for LLM call
                 messages = await self.get_llm_messages(thread_id)
 
-                # 2. Check token count before proceeding
-                token_count = 0
-                try:
-                    # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
-                    token_threshold = self.context_manager.token_threshold
-                    logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
-
-                except Exception as e:
-                    logger.error(f"Error counting tokens or summarizing: {str(e)}")
-
-                # 3. Prepare messages for LLM call + add temporary message if it exists
+                # 2. Prepare messages for LLM call + add temporary message if it exists
                 # Use the working_system_prompt which may contain the XML examples
                 prepared_messages = [working_system_prompt]
 
@@ -342,13 +356,17 @@ Here are the XML tools available with examples:
                         prepared_messages.append(temp_msg)
                         logger.debug("Added temporary message to the end of prepared messages")
 
-                # 4. Prepare tools for LLM call
+                # 3. Prepare tools for LLM call
                 openapi_tool_schemas = None
                 if config.native_tool_calling:
                     openapi_tool_schemas = self.tool_registry.get_openapi_schemas()
                     logger.debug(f"Retrieved {len(openapi_tool_schemas) if openapi_tool_schemas else 0} OpenAPI tool schemas")
 
-                prepared_messages = self.context_manager.compress_messages(prepared_messages, llm_model)
+                # 4. Count tokens and compress off the event loop
+                compression = await get_compression_service().compress(prepared_messages, llm_model)
+                prepared_messages = compression.messages
+                token_threshold = self.context_manager.token_threshold
+                logger.info(f"Thread {thread_id} token count: {compression.token_count}/{token_threshold} ({(compression.token_count/token_threshold)*100:.1f}%), {compression.compressed_token_count} after compression")
 
                 # 5. Make LLM API call
                 logger.debug("Making LLM API call")
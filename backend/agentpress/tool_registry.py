@@ -1,5 +1,6 @@
 from typing import Dict, Type, Any, List, Optional, Callable
 from agentpress.tool import Tool, SchemaType
+from agentpress.xml_tool_parser import XMLTagMatcher
 from utils.logger import logger
 
 
@@ -19,12 +20,14 @@ class ToolRegistry:
         get_xml_tool: Get a tool by XML tag name
         get_openapi_schemas: Get OpenAPI schemas for function calling
         get_xml_examples: Get examples of XML tool usage
+        get_xml_tag_matcher: Get a matcher over all XML tool tags
     """
     
     def __init__(self):
         """Initialize a new ToolRegistry instance."""
         self.tools = {}
         self.xml_tools = {}
+        self._xml_tag_matcher: Optional[XMLTagMatcher] = None
         logger.debug("Initialized new ToolRegistry instance")
     
     def register_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
@@ -66,6 +69,7 @@ class ToolRegistry:
                             "schema": schema
                         }
                         registered_xml += 1
+                        self._xml_tag_matcher = None
                         logger.debug(f"Registered XML tag {schema.xml_schema.tag_name} -> {func_name} from {tool_class.__name__}")
         
         logger.debug(f"Tool registration complete for {tool_class.__name__}: {registered_openapi} OpenAPI functions, {registered_xml} XML tags")
@@ -150,3 +154,40 @@ class ToolRegistry:
                 examples[schema.xml_schema.tag_name] = schema.xml_schema.example
         logger.debug(f"Retrieved {len(examples)} XML examples")
         return examples
+
+    def get_xml_examples_prompt(self) -> str:
+        """Get the system prompt section describing XML tool calling with all examples.
+
+        Returns:
+            The prompt section, or an empty string if no XML tool has an example
+        """
+        xml_examples = self.get_xml_examples()
+        if not xml_examples:
+            return ""
+
+        examples_content = """
+--- XML TOOL CALLING ---
+
+In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
+Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
+String and scalar parameters should be specified as attributes, while content goes between tags.
+Note that spaces for string values are not stripped. The output is parsed with regular expressions.
+
+Here are the XML tools available with examples:
+"""
+        for tag_name, example in xml_examples.items():
+            examples_content += f"<{tag_name}> Example: {example}\\n"
+        return examples_content
+
+    def get_xml_tag_matcher(self) -> XMLTagMatcher:
+        """Get a matcher over the <function_calls> tag and all registered XML tags.
+        
+        The matcher is built once and rebuilt only after new XML tags are registered.
+        
+        Returns:
+            XMLTagMatcher for use by StreamingXMLChunkScanner
+        """
+        if self._xml_tag_matcher is None:
+            self._xml_tag_matcher = XMLTagMatcher(['function_calls', *self.xml_tools.keys()])
+            logger.debug(f"Built XML tag matcher for {len(self.xml_tools)} XML tags")
+        return self._xml_tag_matcher
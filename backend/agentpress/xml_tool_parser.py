@@ -284,6 +284,179 @@ class XMLToolParser:
         return True, None
 
 
+class XMLTagMatcher:
+    """
+    Trie over XML tag names, used to match every registered tag in a single pass.
+    
+    A tag only matches when its name is followed by whitespace or '>', so a
+    tag never matches as a prefix of a longer name (e.g. <ask> vs <asking>).
+    """
+    
+    _END = None
+    BOUNDARY_CHARS = frozenset(' \t\r\n>')
+    
+    def __init__(self, tag_names: List[str]):
+        self._root: Dict[Any, Any] = {}
+        for tag_name in tag_names:
+            node = self._root
+            for char in tag_name:
+                node = node.setdefault(char, {})
+            node[self._END] = tag_name
+    
+    def match(self, text: str, pos: int) -> Tuple[Optional[str], bool]:
+        """
+        Match a tag name starting at text[pos] (right after the '<').
+        
+        Returns:
+            Tuple of (tag_name, decided). tag_name is None when no tag matches.
+            decided is False when text ends before a match can be ruled in or out.
+        """
+        node = self._root
+        i = pos
+        while True:
+            if self._END in node:
+                if i >= len(text):
+                    return None, False
+                if text[i] in self.BOUNDARY_CHARS:
+                    return node[self._END], True
+            if i >= len(text):
+                return None, False
+            node = node.get(text[i])
+            if node is None:
+                return None, True
+            i += 1
+
+
+class StreamingXMLChunkScanner:
+    """
+    Resumable scanner that extracts complete XML tool call blocks from streamed content.
+    
+    Content is fed delta by delta. The scanner keeps its cursor and nesting depth
+    between deltas, so each character is scanned once, and returns every
+    <function_calls> or legacy tool block as soon as its closing tag arrives.
+    Consumed content is dropped from the buffer.
+    
+    A <function_calls> block takes priority over an open legacy block: a legacy tag
+    mentioned in prose (e.g. "use the <ask> tool") is never closed, and is dropped
+    when a <function_calls> tag follows it.
+    """
+    
+    FUNCTION_CALLS_OPEN = '<function_calls'
+    
+    def __init__(self, matcher: XMLTagMatcher):
+        self.matcher = matcher
+        self._buffer = ""
+        self._pos = 0
+        self._tag: Optional[str] = None
+        self._block_start = 0
+        self._depth = 0
+    
+    def feed(self, text: str) -> List[str]:
+        """Append a content delta and return the XML blocks completed by it."""
+        # Concatenate on a local with a single reference so CPython extends in place
+        buffer = self._buffer
+        self._buffer = ""
+        buffer += text
+        
+        chunks = []
+        while True:
+            if self._tag is None:
+                if not self._find_block_start(buffer):
+                    break
+            else:
+                chunk = self._find_block_end(buffer)
+                if chunk is None:
+                    if self._tag is None:
+                        # The open legacy block was dropped for a <function_calls> block
+                        continue
+                    break
+                chunks.append(chunk)
+                buffer = buffer[self._pos:]
+                self._pos = 0
+        
+        if self._tag is None and self._pos:
+            buffer = buffer[self._pos:]
+            self._pos = 0
+        self._buffer = buffer
+        return chunks
+    
+    def _find_block_start(self, buffer: str) -> bool:
+        """Advance to the next opening tool tag. Returns False if more content is needed."""
+        while True:
+            lt_pos = buffer.find('<', self._pos)
+            if lt_pos == -1:
+                self._pos = len(buffer)
+                return False
+            
+            tag_name, decided = self.matcher.match(buffer, lt_pos + 1)
+            if not decided:
+                self._pos = lt_pos
+                return False
+            if tag_name is None:
+                self._pos = lt_pos + 1
+                continue
+            
+            self._tag = tag_name
+            self._block_start = lt_pos
+            self._depth = 1
+            self._pos = lt_pos + 1 + len(tag_name)
+            return True
+    
+    def _find_block_end(self, buffer: str) -> Optional[str]:
+        """Advance to the matching closing tag of the open block and return the block, if complete.
+        
+        Returns None with no block open when a legacy block is dropped for a <function_calls> tag.
+        """
+        open_pattern = f'<{self._tag}'
+        end_pattern = f'</{self._tag}>'
+        # function_calls blocks end at their first closing tag; legacy tags may nest
+        # and give way to a function_calls block
+        is_legacy = self._tag != 'function_calls'
+        # Tail kept when no closing tag is found, long enough to hold the start of any tag searched for
+        keep = max(len(end_pattern), len(self.FUNCTION_CALLS_OPEN) + 1) if is_legacy else len(end_pattern)
+        
+        while True:
+            end_pos = buffer.find(end_pattern, self._pos)
+            
+            if is_legacy:
+                search_limit = end_pos if end_pos != -1 else len(buffer)
+                calls_pos = buffer.find(self.FUNCTION_CALLS_OPEN, self._pos, search_limit)
+                nested_pos = buffer.find(open_pattern, self._pos, search_limit)
+                if calls_pos != -1 and (nested_pos == -1 or calls_pos < nested_pos):
+                    after_name = calls_pos + len(self.FUNCTION_CALLS_OPEN)
+                    if after_name >= len(buffer):
+                        self._pos = calls_pos
+                        return None
+                    if buffer[after_name] in self.matcher.BOUNDARY_CHARS:
+                        self._tag = None
+                        self._depth = 0
+                        self._pos = calls_pos
+                        return None
+                    self._pos = after_name
+                    continue
+                if nested_pos != -1:
+                    after_name = nested_pos + len(open_pattern)
+                    if after_name >= len(buffer):
+                        self._pos = nested_pos
+                        return None
+                    if buffer[after_name] in self.matcher.BOUNDARY_CHARS:
+                        self._depth += 1
+                    self._pos = after_name
+                    continue
+            
+            if end_pos == -1:
+                # Keep the tail that could still hold the start of the closing tag
+                self._pos = max(self._pos, len(buffer) - keep + 1)
+                return None
+            
+            self._pos = end_pos + len(end_pattern)
+            self._depth -= 1
+            if self._depth == 0:
+                chunk = buffer[self._block_start:self._pos]
+                self._tag = None
+                return chunk
+
+
 # Convenience function for quick parsing
 def parse_xml_tool_calls(content: str, strict_mode: bool = False) -> List[XMLToolCall]:
     """
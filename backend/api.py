@@ -20,6 +20,7 @@ import uuid
 from agent import api as agent_api
 from agent import workflows as workflows_api
 from sandbox import api as sandbox_api
+from sandbox.pool import get_sandbox_pool
 from services import billing as billing_api
 from flags import api as feature_flags_api
 from services import transcription as transcription_api
@@ -27,6 +28,10 @@ import sys
 from services import email_api
 from triggers import api as triggers_api
 from triggers import unified_oauth_api
+from triggers.event_queue import get_trigger_event_queue
+from mcp_service.session_pool import get_mcp_session_pool
+from services.web_search import get_web_search
+from agentpress.compression_service import get_compression_service
 
 import os
 import json
@@ -80,8 +85,19 @@ async def lifespan(app: FastAPI):
         # Initialize pipedream API
         pipedream_api.initialize(db)
         
+        # Keep warm sandboxes ready for new projects
+        get_sandbox_pool().start()
+        
+        # Run queued trigger executions
+        get_trigger_event_queue(db).start()
+        
         yield
         
+        await get_trigger_event_queue().stop()
+        await get_sandbox_pool().stop()
+        await get_mcp_session_pool().close_all()
+        get_compression_service().shutdown()
+        
         # Clean up agent resources
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
@@ -197,6 +213,20 @@ async def health_check():
         "instance_id": instance_id
     }
 
+@api_router.get("/metrics/web-search")
+async def web_search_metrics():
+    return {
+        "instance_id": instance_id,
+        **get_web_search().metrics.to_dict()
+    }
+
+@api_router.get("/metrics/context-compression")
+async def context_compression_metrics():
+    return {
+        "instance_id": instance_id,
+        **get_compression_service().metrics.to_dict()
+    }
+
 app.include_router(api_router, prefix="/api")
 
 
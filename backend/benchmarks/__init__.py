@@ -0,0 +1,8 @@
+"""
+Micro-benchmarks of hot paths, run from the backend directory, e.g.
+python -m benchmarks.billing_usage. They use the fakes of tests.fakes and need no services.
+"""
+
+from tests.fakes import set_test_settings
+
+set_test_settings()
@@ -0,0 +1,51 @@
+"""
+Monthly usage check: full rescan of the usage logs against the usage ledger.
+
+Serves a synthetic month of 1k to 1M usage log entries from memory and Redis from a
+FakeRedis, so the numbers show the cost of the code paths, not of the DB or network.
+
+    python -m benchmarks.billing_usage
+"""
+
+import asyncio
+import time
+
+from services import billing, redis
+from tests.fakes import FakeRedis
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+LEDGER_READS = 1000
+
+
+def synthetic_usage_logs(total: int):
+    async def get_usage_logs(client, user_id, page=0, items_per_page=1000):
+        start = page * items_per_page
+        count = max(0, min(items_per_page, total - start))
+        logs = [{"estimated_cost": 0.001}] * count
+        return {"logs": logs, "has_more": start + count < total}
+    return get_usage_logs
+
+
+async def main() -> None:
+    redis.client = FakeRedis()
+    redis._initialized = True
+    print(f"{'entries':>10} {'rescan ms':>12} {'ledger read ms':>15}")
+    for size in SIZES:
+        billing.get_usage_logs = synthetic_usage_logs(size)
+        user_id = f"bench-{size}"
+
+        started = time.perf_counter()
+        await billing.calculate_monthly_usage(None, user_id)
+        rescan_ms = (time.perf_counter() - started) * 1000
+
+        await billing.get_monthly_usage(None, user_id)  # Builds the ledger
+        started = time.perf_counter()
+        for _ in range(LEDGER_READS):
+            await billing.get_monthly_usage(None, user_id)
+        read_ms = (time.perf_counter() - started) * 1000 / LEDGER_READS
+
+        print(f"{size:>10} {rescan_ms:>12.2f} {read_ms:>15.4f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+Logging overhead on the thread of the streaming loop: the former logger, which added
+callsite parameters and rendered and wrote every event in place, against utils.logger,
+which samples, timestamps and enqueues events for its writer thread.
+
+Replays CHUNKS chunks, each logging a filtered debug event and an info event, once with
+a message that is not sampled and once with the sampled "XML tool call limit reached"
+message. Output goes to /dev/null, the production settings (JSON, INFO) are used.
+
+    python -m benchmarks.logging_overhead
+"""
+
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("ENV_MODE", "production")
+
+import structlog  # noqa: E402
+
+from utils.logger import log_writer, logger  # noqa: E402
+
+CHUNKS = 5000
+MESSAGES = {
+    "unsampled": "Processing content chunk",
+    "sampled": "XML tool call limit reached - not yielding more content chunks",
+}
+
+
+def former_logger(output):
+    """The logger configuration before events were written on a background thread."""
+    return structlog.wrap_logger(
+        structlog.PrintLogger(output),
+        processors=[
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.dict_tracebacks,
+            structlog.processors.CallsiteParameterAdder(
+                {
+                    structlog.processors.CallsiteParameter.FILENAME,
+                    structlog.processors.CallsiteParameter.FUNC_NAME,
+                    structlog.processors.CallsiteParameter.LINENO,
+                }
+            ),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.JSONRenderer(),
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+    )
+
+
+def replay(log, message: str) -> float:
+    started = time.perf_counter()
+    for index in range(CHUNKS):
+        log.debug(f"Chunk {index} received")
+        log.info(message, chunk_index=index, thread_id="thread-1")
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            results = []
+            for name, message in MESSAGES.items():
+                results.append((f"former, {name}", replay(former_logger(devnull), message)))
+                results.append((f"queued, {name}", replay(logger, message)))
+            log_writer.flush(timeout=30)
+        finally:
+            sys.stdout = stdout
+
+    print(f"{CHUNKS} chunks, a debug and an info event each")
+    for name, elapsed in results:
+        print(f"{name:>20}: {elapsed * 1000:8.1f} ms total, {elapsed / CHUNKS * 1e6:6.2f} us/chunk")
+    print(f"Events dropped by the full queue: {log_writer.dropped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Token counting of a synthetic 2,000-message thread, as done before every LLM call.
+
+Compares litellm's token_counter over the whole thread with the per-message cache of
+MessageTokenCounter, cold and after one new message. Then runs the path runs actually
+take since counting moved to the compression service: each call goes to one of the
+spawned workers, which has its own cache and is cold until it has seen the thread once.
+
+    python -m benchmarks.token_counting
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List
+
+from litellm.utils import token_counter
+
+from agentpress.compression_service import CompressionService
+from agentpress.context_manager import MessageTokenCounter
+
+MODEL = "gpt-4o"
+THREAD_SIZE = 2000
+ITERATIONS = 10
+WORKERS = 2
+
+
+def synthetic_thread(size: int) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    words = ["agent", "file", "search", "result", "the", "tool", "output", "error", "page", "data"]
+    roles = ["user", "assistant", "user"]
+    return [
+        {"role": roles[i % 3], "content": " ".join(rng.choice(words) for _ in range(rng.randint(20, 400))),
+         "message_id": str(i)}
+        for i in range(size)
+    ]
+
+
+def timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+async def run_workers(thread: List[Dict[str, Any]]) -> None:
+    service = CompressionService(workers=WORKERS, timeout=600)
+    try:
+        for i in range(ITERATIONS):
+            thread = thread + [{"role": "user", "content": f"next step {i}"}]
+            started = time.perf_counter()
+            await service.compress(thread, MODEL)
+            print(f"  worker call {i + 1:>2}: {(time.perf_counter() - started) * 1000:8.1f} ms")
+        print(f"  metrics: {service.metrics.to_dict()}")
+    finally:
+        service.shutdown()
+
+
+def main() -> None:
+    thread = synthetic_thread(THREAD_SIZE)
+    print(f"{THREAD_SIZE} messages, model {MODEL}")
+    print(f"token_counter, whole thread: {timed(lambda: token_counter(model=MODEL, messages=thread)):8.1f} ms")
+
+    counter = MessageTokenCounter()
+    print(f"MessageTokenCounter, cold:   {timed(counter.count_messages, thread, MODEL):8.1f} ms")
+    grown = thread + [{"role": "user", "content": "one more message"}]
+    print(f"MessageTokenCounter, warm:   {timed(counter.count_messages, grown, MODEL):8.1f} ms")
+
+    print(f"CompressionService with {WORKERS} workers, thread growing by one message per call:")
+    asyncio.run(run_workers(thread))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Tracing overhead on the thread of a run: sending every event to the Langfuse trace as it
+happens, as runs did before RunTrace, against RunTrace, which samples, truncates and
+buffers events and sends them in batches from a worker thread.
+
+Replays a run of EVENTS events, mostly routine chunk and tool events with a few errors,
+some carrying large tool outputs. The fake trace serializes what it is sent, like the
+Langfuse client.
+
+    python -m benchmarks.tracing_overhead
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List
+
+from services.tracing import RunTrace
+from tests.fakes import FakeLangfuseTrace
+
+EVENTS = 5000
+LARGE_OUTPUT = "line of tool output\n" * 5000  # ~100KB
+
+
+def run_events() -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    events = []
+    for index in range(EVENTS):
+        roll = rng.random()
+        if roll < 0.01:
+            events.append({"name": "tool_error", "level": "ERROR", "status_message": f"Tool {index} failed"})
+        elif roll < 0.05:
+            events.append({"name": "tool_result", "level": "DEFAULT", "metadata": {"output": LARGE_OUTPUT}})
+        else:
+            events.append({"name": "content_chunk", "level": "DEBUG", "metadata": {"index": index}})
+    return events
+
+
+async def replay(trace, events: List[Dict[str, Any]]) -> float:
+    started = time.perf_counter()
+    for event in events:
+        trace.event(**event)
+    if isinstance(trace, RunTrace):
+        trace.flush()
+    return time.perf_counter() - started
+
+
+async def main() -> None:
+    events = run_events()
+    direct = FakeLangfuseTrace()
+    direct_seconds = await replay(direct, events)
+
+    buffered = FakeLangfuseTrace()
+    trace = RunTrace(buffered)
+    buffered_seconds = await replay(trace, events)
+    await asyncio.sleep(0.5)  # Let the worker thread send the batches
+
+    print(f"{EVENTS} events")
+    for name, elapsed, sent in (("direct", direct_seconds, len(direct.events)),
+                                ("RunTrace", buffered_seconds, len(buffered.events))):
+        print(f"{name:>9}: {elapsed * 1000:8.1f} ms on the caller, {elapsed / EVENTS * 1e6:6.2f} us/event, {sent} events sent")
+    print(f"RunTrace overhead as reported in its summary: {trace.overhead_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+XML tool call extraction in the streaming loop: the incremental StreamingXMLChunkScanner
+against the former path, which rescanned the accumulated content after every delta.
+
+Replays a 200KB response with a <function_calls> block every ~4KB, in deltas of about
+5 tokens (20 characters).
+
+    python -m benchmarks.xml_chunk_scanner
+"""
+
+import random
+import time
+from typing import List
+
+from agentpress.xml_tool_parser import StreamingXMLChunkScanner, XMLTagMatcher
+
+RESPONSE_SIZE = 200 * 1024
+DELTA_SIZE = 20
+TAG_NAMES = [
+    "ask", "complete", "web-browser-takeover", "create-file", "str-replace", "full-file-rewrite",
+    "delete-file", "execute-command", "check-command-output", "terminate-command", "list-commands",
+    "web-search", "scrape-webpage", "browser-navigate-to", "browser-click-element", "browser-input-text",
+    "see-image", "expose-port", "execute-data-provider-call", "get-data-provider-endpoints",
+    "update-agent", "search-mcp-servers", "configure-mcp-server",
+]
+BLOCK = (
+    '<function_calls>\n<invoke name="create_file">\n<parameter name="file_path">src/app.py</parameter>\n'
+    '<parameter name="file_contents">print("hello")</parameter>\n</invoke>\n</function_calls>'
+)
+
+
+def synthetic_response() -> str:
+    rng = random.Random(0)
+    words = ["the", "agent", "will", "now", "create", "a", "file", "with", "<b>", "code", "and", "tests", "x<y"]
+    parts, size = [], 0
+    while size < RESPONSE_SIZE:
+        text = " ".join(rng.choice(words) for _ in range(800)) + "\n"
+        parts.extend([text, BLOCK, "\n"])
+        size += len(text) + len(BLOCK) + 1
+    return "".join(parts)
+
+
+def legacy_extract_xml_chunks(content: str, tag_names: List[str]) -> List[str]:
+    """The extraction the streaming loop ran on the accumulated content before the scanner."""
+    chunks = []
+    pos = 0
+    while pos < len(content):
+        start_pos = content.find('<function_calls>', pos)
+        if start_pos == -1:
+            break
+        end_pos = content.find('</function_calls>', start_pos)
+        if end_pos == -1:
+            break
+        chunk_end = end_pos + len('</function_calls>')
+        chunks.append(content[start_pos:chunk_end])
+        pos = chunk_end
+    if not chunks:
+        # Legacy tool tags, checked whenever no <function_calls> block is complete
+        for tag_name in tag_names:
+            content.find(f'<{tag_name}', 0)
+    return chunks
+
+
+def run_legacy(deltas: List[str]) -> int:
+    found = 0
+    current_xml_content = ""
+    for delta in deltas:
+        current_xml_content += delta
+        for chunk in legacy_extract_xml_chunks(current_xml_content, TAG_NAMES):
+            current_xml_content = current_xml_content.replace(chunk, "", 1)
+            found += 1
+    return found
+
+
+def run_scanner(deltas: List[str]) -> int:
+    scanner = StreamingXMLChunkScanner(XMLTagMatcher(["function_calls", *TAG_NAMES]))
+    return sum(len(scanner.feed(delta)) for delta in deltas)
+
+
+def main() -> None:
+    response = synthetic_response()
+    deltas = [response[i:i + DELTA_SIZE] for i in range(0, len(response), DELTA_SIZE)]
+    print(f"{len(response)} characters in {len(deltas)} deltas")
+    for name, run in (("legacy rescan", run_legacy), ("streaming scanner", run_scanner)):
+        started = time.perf_counter()
+        found = run(deltas)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>18}: {elapsed * 1000:8.1f} ms total, {elapsed / len(deltas) * 1e6:6.2f} us/delta, {found} blocks")
+
+
+if __name__ == "__main__":
+    main()
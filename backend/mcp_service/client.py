@@ -5,17 +5,6 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 
 from mcp import ClientSession
-try:
-    from mcp.client.streamable_http import streamablehttp_client
-except ImportError:
-    try:
-        from mcp.client import streamablehttp_client
-    except ImportError:
-        raise ImportError(
-            "Could not import streamablehttp_client. "
-            "Make sure you have installed mcp with: pip install 'mcp[cli]'"
-        )
-
 try:
     from mcp.types import Tool, CallToolResult as ToolResult
 except ImportError:
@@ -29,6 +18,8 @@ except ImportError:
 
 from utils.logger import logger
 from .mcp_providers import MCPProviderFactory, SmitheryProvider, PipedreamProvider
+from .schema_cache import get_mcp_schema_cache
+from .session_pool import MCPServerSpec, get_mcp_session_pool
 import os
 
 SMITHERY_API_KEY = os.getenv("SMITHERY_API_KEY")
@@ -64,7 +55,7 @@ class MCPManager:
             
         logger.info(f"Connecting to MCP server: {qualified_name} via {provider_type}")
         
-        try:
+        async def list_tools() -> List[Dict[str, Any]]:
             provider = MCPProviderFactory.create_provider(provider_type)
             url = provider.get_server_url(qualified_name, mcp_config.get("config", {}))
             
@@ -75,13 +66,23 @@ class MCPManager:
             else:
                 headers = provider.get_headers(qualified_name, mcp_config.get("config", {}), external_user_id)
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    logger.info(f"MCP session initialized for {qualified_name} via {provider_type}")
-                    
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+            tools = await get_mcp_session_pool().list_tools(MCPServerSpec(transport='http', url=url, headers=headers))
+            return [
+                {"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema}
+                for tool in tools
+            ]
+        
+        try:
+            tools_info = await get_mcp_schema_cache().get_tools({
+                "provider": provider_type,
+                "qualified_name": qualified_name,
+                "config": mcp_config.get("config", {}),
+                "external_user_id": external_user_id,
+            }, list_tools)
+            tools = [
+                Tool(name=info["name"], description=info["description"], inputSchema=info["input_schema"])
+                for info in tools_info
+            ]
             
             logger.info(f"Available tools from {qualified_name}: {[t.name for t in tools]}")
             
@@ -173,38 +174,37 @@ class MCPManager:
             else:
                 headers = provider.get_headers(qualified_name, conn.config, external_user_id)
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    if hasattr(result, 'content'):
-                        content = result.content
-                        if isinstance(content, list):
-                            text_parts = []
-                            for item in content:
-                                if hasattr(item, 'text'):
-                                    text_parts.append(item.text)
-                                elif hasattr(item, 'content'):
-                                    text_parts.append(str(item.content))
-                                else:
-                                    text_parts.append(str(item))
-                            content_str = "\n".join(text_parts)
-                        elif hasattr(content, 'text'):
-                            content_str = content.text
-                        elif hasattr(content, 'content'):
-                            content_str = str(content.content)
+            result = await get_mcp_session_pool().call_tool(
+                MCPServerSpec(transport='http', url=url, headers=headers), original_tool_name, arguments
+            )
+            if hasattr(result, 'content'):
+                content = result.content
+                if isinstance(content, list):
+                    text_parts = []
+                    for item in content:
+                        if hasattr(item, 'text'):
+                            text_parts.append(item.text)
+                        elif hasattr(item, 'content'):
+                            text_parts.append(str(item.content))
                         else:
-                            content_str = str(content)
-                        
-                        is_error = getattr(result, 'isError', False)
-                    else:
-                        content_str = str(result)
-                        is_error = False
-                        
-                return {
-                        "content": content_str,
-                        "isError": is_error
-                }
+                            text_parts.append(str(item))
+                    content_str = "\n".join(text_parts)
+                elif hasattr(content, 'text'):
+                    content_str = content.text
+                elif hasattr(content, 'content'):
+                    content_str = str(content.content)
+                else:
+                    content_str = str(content)
+                
+                is_error = getattr(result, 'isError', False)
+            else:
+                content_str = str(result)
+                is_error = False
+                
+            return {
+                "content": content_str,
+                "isError": is_error
+            }
                 
         except Exception as e:
             logger.error(f"Error executing MCP tool {tool_name}: {str(e)}")
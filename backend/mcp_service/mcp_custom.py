@@ -3,6 +3,7 @@ import sys
 import json
 import asyncio
 import subprocess
+from dataclasses import asdict
 from typing import Dict, Any
 from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException # type: ignore
@@ -10,6 +11,8 @@ from utils.logger import logger
 from mcp import ClientSession
 from mcp.client.sse import sse_client # type: ignore
 from mcp.client.streamable_http import streamablehttp_client # type: ignore
+from .schema_cache import get_mcp_schema_cache
+from .session_pool import MCPServerSpec
 
 async def connect_streamable_http_server(url):
     async with streamablehttp_client(url) as (
@@ -120,6 +123,13 @@ async def discover_custom_tools(request_type: str, config: Dict[str, Any]):
     else:
         raise HTTPException(status_code=400, detail="Invalid server type. Must be 'http' or 'sse'")
     
+    # Discovering a server refreshes the schemas agent runs use for it
+    spec = MCPServerSpec(transport=request_type, url=config['url'], headers=config.get('headers', {}) if request_type == 'sse' else {})
+    await get_mcp_schema_cache().store(asdict(spec), [
+        {"name": tool["name"], "description": tool["description"], "input_schema": tool["inputSchema"]}
+        for tool in tools
+    ])
+    
     response_data = {"tools": tools, "count": len(tools)}
     
     if server_name:
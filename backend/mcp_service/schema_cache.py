@@ -0,0 +1,108 @@
+"""
+Cross-run cache of MCP tool schemas.
+
+The tools a server lists are cached in Redis under mcp_schemas:{hash of the server
+config}, so agent runs don't list the tools of every server again. A run uses cached
+tools right away; if they are older than the refresh interval, they are listed again
+in the background for the next run.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REFRESH_AFTER = 300  # Seconds after which cached tools are refreshed in the background
+
+ToolsInfo = List[Dict[str, Any]]
+
+
+def get_schema_cache_key(server_config: Dict[str, Any]) -> str:
+    """Cache key of a server config. The config includes credentials, so it is only stored hashed."""
+    config_hash = hashlib.sha256(json.dumps(server_config, sort_keys=True, default=str).encode()).hexdigest()
+    return f"mcp_schemas:{config_hash}"
+
+
+class MCPSchemaCache:
+    """Caches the tools listed by MCP servers.
+
+    Tools are stored as dicts with name, description and input_schema.
+    """
+
+    def __init__(self, ttl: int, refresh_after: int = REFRESH_AFTER):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get_tools(self, server_config: Dict[str, Any], list_tools: Callable[[], Awaitable[ToolsInfo]]) -> ToolsInfo:
+        """Get the tools of a server, listing them only if they are not cached.
+
+        Args:
+            server_config: Everything that determines which tools the server lists.
+            list_tools: Lists the tools of the server.
+        """
+        key = get_schema_cache_key(server_config)
+        cached = await self._load(key)
+        if cached is None:
+            return await self._refresh(key, list_tools)
+
+        if time.time() - cached.get('fetched_at', 0) > self.refresh_after and key not in self._refreshing:
+            task = asyncio.create_task(self._refresh(key, list_tools))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda task: self._refresh_done(key, task))
+        return cached['tools']
+
+    async def refresh(self, server_config: Dict[str, Any], list_tools: Callable[[], Awaitable[ToolsInfo]]) -> ToolsInfo:
+        """List the tools of a server and replace the cached ones."""
+        return await self._refresh(get_schema_cache_key(server_config), list_tools)
+
+    async def store(self, server_config: Dict[str, Any], tools: ToolsInfo) -> None:
+        """Replace the cached tools of a server with tools listed elsewhere."""
+        await self._store(get_schema_cache_key(server_config), tools)
+
+    async def invalidate(self, server_config: Dict[str, Any]) -> None:
+        """Drop the cached tools of a server, e.g. after it was reconfigured."""
+        try:
+            await redis.delete(get_schema_cache_key(server_config))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached MCP schemas: {str(e)}")
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await redis.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read cached MCP schemas: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _refresh(self, key: str, list_tools: Callable[[], Awaitable[ToolsInfo]]) -> ToolsInfo:
+        tools = await list_tools()
+        await self._store(key, tools)
+        return tools
+
+    async def _store(self, key: str, tools: ToolsInfo) -> None:
+        try:
+            await redis.set(key, json.dumps({"tools": tools, "fetched_at": time.time()}, default=str), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache MCP schemas: {str(e)}")
+
+    def _refresh_done(self, key: str, task: asyncio.Task) -> None:
+        self._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background refresh of MCP schemas failed, keeping cached schemas: {str(task.exception())}")
+
+
+_cache: Optional[MCPSchemaCache] = None
+
+
+def get_mcp_schema_cache() -> MCPSchemaCache:
+    """Get the process-wide MCP schema cache."""
+    global _cache
+    if _cache is None:
+        _cache = MCPSchemaCache(ttl=config.MCP_SCHEMA_CACHE_TTL)
+    return _cache
@@ -0,0 +1,280 @@
+"""
+Pool of initialized MCP client sessions.
+
+Opening an MCP session costs a connection (TLS for remote servers, a process for stdio
+servers) and an initialize round trip. The pool keeps initialized sessions per server,
+keyed by transport, address and a hash of the credentials, and reuses them across tool
+calls and agent runs of the process.
+
+Each session is owned by a task that enters the transport and session contexts and
+keeps them open until the session is closed, since the MCP transports must be exited
+by the task that entered them. Sessions idle for a while are pinged before reuse;
+sessions idle past the idle TTL are closed. A call that fails on a broken session is
+retried once on a new one.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, AsyncIterator
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+
+from utils.config import config
+from utils.logger import logger
+
+CONNECT_TIMEOUT = 15
+CALL_TIMEOUT = 30
+PING_AFTER_IDLE = 30  # Seconds idle after which a session is pinged before reuse
+PING_TIMEOUT = 5
+REAP_INTERVAL = 30
+CLOSE_TIMEOUT = 5
+
+
+@dataclass
+class MCPServerSpec:
+    """How to reach an MCP server.
+
+    transport is 'sse', 'http' (streamable HTTP) or 'stdio'.
+    """
+    transport: str
+    url: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    command: Optional[str] = None
+    args: List[str] = field(default_factory=list)
+    env: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        # Credentials only go into the key hashed
+        credentials = json.dumps({"headers": self.headers, "env": self.env}, sort_keys=True)
+        credentials_hash = hashlib.sha256(credentials.encode()).hexdigest()[:16]
+        address = self.url if self.transport != 'stdio' else " ".join([self.command or ""] + list(self.args))
+        return f"{self.transport}:{address}:{credentials_hash}"
+
+
+class PooledSession:
+    """An initialized session kept open by its own task."""
+
+    def __init__(self, spec: MCPServerSpec):
+        self.spec = spec
+        self.session: Optional[ClientSession] = None
+        self.last_used = time.monotonic()
+        self.uses = 0
+        self._ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._closing.is_set()
+
+    async def start(self, timeout: float = CONNECT_TIMEOUT) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _run(self) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await self._open_transport(stack)
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                self.session = session
+                self._ready.set_result(None)
+                await self._closing.wait()
+        except BaseException as e:
+            if not self._ready.done():
+                self._ready.set_exception(e if isinstance(e, Exception) else ConnectionError(str(e)))
+            elif not self._closing.is_set():
+                logger.warning(f"MCP session {self.spec.key} closed unexpectedly: {str(e)}")
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._closing.set()
+
+    async def _open_transport(self, stack: AsyncExitStack):
+        spec = self.spec
+        if spec.transport == 'sse':
+            try:
+                return await stack.enter_async_context(sse_client(spec.url, headers=spec.headers))
+            except TypeError as e:
+                if "unexpected keyword argument" not in str(e):
+                    raise
+                return await stack.enter_async_context(sse_client(spec.url))
+        if spec.transport == 'http':
+            read, write, _ = await stack.enter_async_context(streamablehttp_client(spec.url, headers=spec.headers or None))
+            return read, write
+        if spec.transport == 'stdio':
+            server_params = StdioServerParameters(command=spec.command, args=spec.args, env=spec.env)
+            return await stack.enter_async_context(stdio_client(server_params))
+        raise ValueError(f"Unsupported MCP transport: {spec.transport}")
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, CLOSE_TIMEOUT)
+            except BaseException:
+                self._task.cancel()
+        if not self._ready.done():
+            self._ready.cancel()
+
+
+class _ServerSessions:
+    def __init__(self, max_sessions: int):
+        self.idle: List[PooledSession] = []
+        self.slots = asyncio.Semaphore(max_sessions)
+        self.users = 0  # Callers holding or waiting for a session
+
+
+class MCPSessionPool:
+    """Hands out initialized MCP sessions, one caller per session at a time.
+
+    Args:
+        max_sessions_per_server: Sessions open at the same time per server key.
+            Callers wait for a session once the limit is reached.
+        idle_ttl: Seconds an unused session is kept open.
+    """
+
+    def __init__(self, max_sessions_per_server: int, idle_ttl: int):
+        self.max_sessions_per_server = max_sessions_per_server
+        self.idle_ttl = idle_ttl
+        self._servers: Dict[str, _ServerSessions] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _get_server(self, key: str) -> _ServerSessions:
+        if key not in self._servers:
+            self._servers[key] = _ServerSessions(self.max_sessions_per_server)
+        return self._servers[key]
+
+    @asynccontextmanager
+    async def session(self, spec: MCPServerSpec, connect_timeout: float = CONNECT_TIMEOUT) -> AsyncIterator[ClientSession]:
+        """Check out an initialized session of a server.
+
+        The session goes back to the pool unless the body raised, in which case it is closed.
+        """
+        async with self._pooled_session(spec, connect_timeout) as pooled:
+            yield pooled.session
+
+    @asynccontextmanager
+    async def _pooled_session(self, spec: MCPServerSpec, connect_timeout: float) -> AsyncIterator[PooledSession]:
+        self._start_reaper()
+        server = self._get_server(spec.key)
+        server.users += 1
+        try:
+            async with server.slots:
+                pooled = await self._checkout(server, spec, connect_timeout)
+                pooled.uses += 1
+                try:
+                    yield pooled
+                except BaseException:
+                    await pooled.close()
+                    raise
+                pooled.last_used = time.monotonic()
+                if pooled.alive:
+                    server.idle.append(pooled)
+        finally:
+            server.users -= 1
+
+    async def _checkout(self, server: _ServerSessions, spec: MCPServerSpec, connect_timeout: float) -> PooledSession:
+        while server.idle:
+            pooled = server.idle.pop()
+            if not pooled.alive:
+                continue
+            if time.monotonic() - pooled.last_used > PING_AFTER_IDLE and not await pooled.ping():
+                logger.info(f"Dropping unresponsive MCP session {spec.key}")
+                await pooled.close()
+                continue
+            return pooled
+
+        pooled = PooledSession(spec)
+        await pooled.start(connect_timeout)
+        logger.debug(f"Opened MCP session {spec.key}")
+        return pooled
+
+    async def call_tool(self, spec: MCPServerSpec, tool_name: str, arguments: Dict[str, Any], timeout: float = CALL_TIMEOUT):
+        """Call a tool on a pooled session.
+
+        A call that fails on a reused session is retried once, since the server may
+        have dropped the connection while the session sat in the pool.
+        """
+        while True:
+            reused = False
+            try:
+                async with self._pooled_session(spec, CONNECT_TIMEOUT) as pooled:
+                    reused = pooled.uses > 1
+                    return await asyncio.wait_for(pooled.session.call_tool(tool_name, arguments), timeout)
+            except (McpError, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                if not reused:
+                    raise
+                logger.warning(f"MCP call {tool_name} failed on a reused session of {spec.key}, retrying on a new session: {str(e)}")
+
+    async def list_tools(self, spec: MCPServerSpec, timeout: float = CONNECT_TIMEOUT) -> List[Any]:
+        """List the tools of a server."""
+        async with asyncio.timeout(timeout):
+            async with self.session(spec, connect_timeout=timeout) as session:
+                tools_result = await session.list_tools()
+        return tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            now = time.monotonic()
+            for key, server in list(self._servers.items()):
+                expired = [pooled for pooled in server.idle if not pooled.alive or now - pooled.last_used > self.idle_ttl]
+                for pooled in expired:
+                    server.idle.remove(pooled)
+                    await pooled.close()
+                if expired:
+                    logger.debug(f"Closed {len(expired)} idle MCP sessions of {key}")
+                if not server.idle and not server.users:
+                    del self._servers[key]
+
+    async def close_all(self) -> None:
+        """Close every idle session and stop reaping."""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        for server in self._servers.values():
+            idle, server.idle = server.idle, []
+            for pooled in idle:
+                await pooled.close()
+        self._servers.clear()
+
+
+_pool: Optional[MCPSessionPool] = None
+
+
+def get_mcp_session_pool() -> MCPSessionPool:
+    """Get the process-wide MCP session pool."""
+    global _pool
+    if _pool is None:
+        _pool = MCPSessionPool(
+            max_sessions_per_server=config.MCP_SESSION_POOL_MAX_PER_SERVER,
+            idle_ttl=config.MCP_SESSION_POOL_IDLE_TTL,
+        )
+    return _pool
@@ -3,11 +3,15 @@ import urllib.parse
 from typing import Optional
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Form, Depends, Request
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from daytona_sdk import AsyncSandbox
 
 from sandbox.sandbox import get_or_start_sandbox, delete_sandbox
+from sandbox.file_transfer import (
+    RangeNotSatisfiable, SMALL_FILE_SIZE, file_etag, format_http_date, get_small_file_cache,
+    is_not_modified, last_modified, parse_range, stream_file, upload_stream
+)
 from utils.logger import logger
 from utils.auth_utils import get_optional_user_id
 from services.supabase import DBConnection
@@ -163,12 +167,10 @@ async def create_file(
         # Get sandbox using the safer method
         sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
         
-        # Read file content directly from the uploaded file
-        content = await file.read()
-        
-        # Create file using raw binary content
-        await sandbox.fs.upload_file(content, path)
-        logger.info(f"File created at {path} in sandbox {sandbox_id}")
+        # Stream the upload to the sandbox in parts instead of reading it whole
+        size = await upload_stream(sandbox, file, path)
+        get_small_file_cache().invalidate(sandbox_id, path)
+        logger.info(f"File created at {path} in sandbox {sandbox_id} ({size} bytes)")
         
         return {"status": "success", "created": True, "path": path}
     except Exception as e:
@@ -245,29 +247,75 @@ async def read_file(
         # Get sandbox using the safer method
         sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
         
-        # Read file directly - don't check existence first with a separate call
+        # Size and modification time give the ETag and decide how the file is served
         try:
-            content = await sandbox.fs.download_file(path)
-        except Exception as download_err:
-            logger.error(f"Error downloading file {path} from sandbox {sandbox_id}: {str(download_err)}")
+            info = await sandbox.fs.get_file_info(path)
+        except Exception as info_err:
+            logger.error(f"Error getting info of file {path} in sandbox {sandbox_id}: {str(info_err)}")
             raise HTTPException(
                 status_code=404, 
-                detail=f"Failed to download file: {str(download_err)}"
+                detail=f"Failed to download file: {str(info_err)}"
             )
-        
-        # Return a Response object with the content directly
+        if info.is_dir:
+            raise HTTPException(status_code=404, detail=f"Failed to download file: {path} is a directory")
+
+        size = info.size
+        etag = file_etag(path, size, str(info.mod_time))
+        modified = last_modified(info.mod_time)
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        if modified:
+            headers["Last-Modified"] = format_http_date(modified)
+
+        request_headers = request.headers if request else {}
+        if is_not_modified(etag, modified, request_headers.get("if-none-match"), request_headers.get("if-modified-since")):
+            return Response(status_code=304, headers=headers)
+
+        # A Range is only honoured for the version of the file named by If-Range
+        if_range = request_headers.get("if-range")
+        try:
+            byte_range = None if if_range and if_range != etag else parse_range(request_headers.get("range"), size)
+        except RangeNotSatisfiable:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+
         filename = os.path.basename(path)
-        logger.info(f"Successfully read file {filename} from sandbox {sandbox_id}")
-        
         # Ensure proper encoding by explicitly using UTF-8 for the filename in Content-Disposition header
         # This applies RFC 5987 encoding for the filename to support non-ASCII characters
         encoded_filename = filename.encode('utf-8').decode('latin-1')
-        content_disposition = f"attachment; filename*=UTF-8''{encoded_filename}"
-        
-        return Response(
-            content=content,
+        headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        start, end = byte_range or (0, size - 1)
+        status_code = 206 if byte_range else 200
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        if size <= SMALL_FILE_SIZE:
+            # Small files are downloaded whole and cached until they change
+            cache = get_small_file_cache()
+            content = cache.get(sandbox_id, path, etag)
+            if content is None:
+                try:
+                    content = await sandbox.fs.download_file(path)
+                except Exception as download_err:
+                    logger.error(f"Error downloading file {path} from sandbox {sandbox_id}: {str(download_err)}")
+                    raise HTTPException(
+                        status_code=404, 
+                        detail=f"Failed to download file: {str(download_err)}"
+                    )
+                cache.put(sandbox_id, path, etag, content)
+            logger.info(f"Successfully read file {filename} from sandbox {sandbox_id}")
+            return Response(
+                content=content[start:end + 1],
+                status_code=status_code,
+                media_type="application/octet-stream",
+                headers=headers
+            )
+
+        logger.info(f"Streaming bytes {start}-{end} of file {filename} ({size} bytes) from sandbox {sandbox_id}")
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            stream_file(sandbox, path, start, end),
+            status_code=status_code,
             media_type="application/octet-stream",
-            headers={"Content-Disposition": content_disposition}
+            headers=headers
         )
     except HTTPException:
         # Re-raise HTTP exceptions without wrapping
@@ -299,6 +347,7 @@ async def delete_file(
         
         # Delete file
         await sandbox.fs.delete_file(path)
+        get_small_file_cache().invalidate(sandbox_id, path)
         logger.info(f"File deleted at {path} in sandbox {sandbox_id}")
         
         return {"status": "success", "deleted": True, "path": path}
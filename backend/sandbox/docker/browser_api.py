@@ -1,8 +1,9 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Request, Response
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import asyncio
+import hashlib
 import json
 import logging
 import base64
@@ -15,6 +16,41 @@ import traceback
 import pytesseract
 from PIL import Image
 import io
+import time
+import multiprocessing
+import urllib.request
+from contextvars import ContextVar
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# "eager" waits for OCR of every screenshot, "lazy" runs it in the background and
+# only returns it once done, "off" leaves it to /automation/ocr. Callers that get no
+# ocr_text fetch it from /automation/ocr by screenshot_hash.
+OCR_MODE = os.environ.get("BROWSER_OCR_MODE", "lazy")
+OCR_WORKERS = int(os.environ.get("BROWSER_OCR_WORKERS", "2"))
+OCR_CACHE_SIZE = 32  # OCR results kept, keyed by screenshot hash
+SETTLE_DELAY = 0.15  # Seconds the page gets to react to an action
+SETTLE_TIMEOUT_MS = 3000  # How long to wait for the network to go idle before capturing state
+UPLOAD_TIMEOUT = 15
+
+# Where the screenshot of the current request goes, (signed upload url, public url).
+# Set from the X-Screenshot-Upload-Url and X-Screenshot-Public-Url request headers.
+screenshot_upload: ContextVar[Optional[tuple]] = ContextVar("screenshot_upload", default=None)
+
+def _ocr_image_bytes(image_bytes: bytes) -> str:
+    """Extract text from an image, runs in the OCR process pool"""
+    image = Image.open(io.BytesIO(image_bytes))
+    return pytesseract.image_to_string(image).strip()
+
+def _screenshot_digest(image_bytes: bytes) -> str:
+    """Digest of the exact bytes of a screenshot, equal only for identical images"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def _upload_image_bytes(upload_url: str, image_bytes: bytes):
+    """PUT an image to a signed storage upload url"""
+    request = urllib.request.Request(upload_url, data=image_bytes, method="PUT", headers={"Content-Type": "image/jpeg"})
+    with urllib.request.urlopen(request, timeout=UPLOAD_TIMEOUT) as response:
+        response.read()
 
 #######################################################
 # Action model definitions
@@ -59,6 +95,9 @@ class CloseTabAction(BaseModel):
 class NoParamsAction(BaseModel):
     pass
 
+class OCRAction(BaseModel):
+    screenshot_hash: Optional[str] = None
+
 class DragDropAction(BaseModel):
     element_source: Optional[str] = None
     element_target: Optional[str] = None
@@ -260,10 +299,13 @@ class BrowserActionResult(BaseModel):
     title: Optional[str] = None
     elements: Optional[str] = None  # Formatted string of clickable elements
     screenshot_base64: Optional[str] = None
+    image_url: Optional[str] = None  # Set instead of screenshot_base64 when the screenshot was uploaded to storage
     pixels_above: int = 0
     pixels_below: int = 0
     content: Optional[str] = None
     ocr_text: Optional[str] = None  # Added field for OCR text
+    screenshot_hash: Optional[str] = None  # Digest of the screenshot, pass to /automation/ocr
+    timings: Optional[Dict[str, float]] = None  # Milliseconds spent per stage of capturing the state
     
     # Additional metadata
     element_count: int = 0  # Number of interactive elements found
@@ -289,6 +331,10 @@ class BrowserAutomation:
         self.include_attributes = ["id", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
         self.screenshot_dir = os.path.join(os.getcwd(), "screenshots")
         os.makedirs(self.screenshot_dir, exist_ok=True)
+        self.ocr_pool: Optional[ProcessPoolExecutor] = None
+        self.ocr_results: OrderedDict[str, asyncio.Future] = OrderedDict()
+        self.last_screenshot: Optional[tuple] = None  # (hash, bytes, base64) of the latest distinct screenshot
+        self.uploaded_screenshots: OrderedDict[str, str] = OrderedDict()  # Screenshot hash -> public url
         
         # Register routes
         self.router.on_startup.append(self.startup)
@@ -314,6 +360,8 @@ class BrowserAutomation:
         # Content actions
         self.router.post("/automation/extract_content")(self.extract_content)
         self.router.post("/automation/save_pdf")(self.save_pdf)
+        self.router.post("/automation/ocr")(self.ocr)
+        self.router.get("/automation/screenshot/{screenshot_hash}")(self.get_screenshot)
         
         # Scroll actions
         self.router.post("/automation/scroll_down")(self.scroll_down)
@@ -386,6 +434,9 @@ class BrowserAutomation:
             await self.browser_context.close()
         if self.browser:
             await self.browser.close()
+        if self.ocr_pool:
+            self.ocr_pool.shutdown(wait=False, cancel_futures=True)
+            self.ocr_pool = None
 
     async def handle_page_created(self, page: Page):
         """Handle new page creation"""
@@ -633,29 +684,31 @@ class BrowserAutomation:
                 pixels_below=0
             )
     
+    async def wait_for_page_to_settle(self, page: Page):
+        """Give the page a moment to react to an action, bounded so slow pages don't stall actions"""
+        await asyncio.sleep(SETTLE_DELAY)
+        try:
+            await page.wait_for_load_state("networkidle", timeout=SETTLE_TIMEOUT_MS)
+        except Exception:
+            # Pages that keep polling never go idle, capture them as they are
+            pass
+
+    async def capture_screenshot(self, page: Page) -> bytes:
+        """Take a JPEG screenshot of the viewport"""
+        return await page.screenshot(
+            type='jpeg',
+            quality=60,
+            full_page=False,
+            timeout=60000,
+            scale='device'  # Use device scale factor
+        )
+
     async def take_screenshot(self) -> str:
         """Take a screenshot and return as base64 encoded string"""
         try:
             page = await self.get_current_page()
-            
-            # Wait for network to be idle and DOM to be stable
-            try:
-                await page.wait_for_load_state("networkidle", timeout=60000)  # Increased timeout to 60s
-            except Exception as e:
-                print(f"Warning: Network idle timeout, proceeding anyway: {e}")
-            
-            # Wait for any animations to complete
-            # await page.wait_for_timeout(1000)  # Wait 1 second for animations
-            
-            # Take screenshot with increased timeout and better options
-            screenshot_bytes = await page.screenshot(
-                type='jpeg',
-                quality=60,
-                full_page=False,
-                timeout=60000,  # Increased timeout to 60s
-                scale='device'  # Use device scale factor
-            )
-            
+            await self.wait_for_page_to_settle(page)
+            screenshot_bytes = await self.capture_screenshot(page)
             return base64.b64encode(screenshot_bytes).decode('utf-8')
         except Exception as e:
             print(f"Error taking screenshot: {e}")
@@ -677,6 +730,50 @@ class BrowserAutomation:
         except Exception as e:
             print(f"Error saving screenshot: {e}")
             return ""
+
+    def get_ocr_pool(self) -> ProcessPoolExecutor:
+        """Get the process pool OCR runs in, so tesseract never blocks the event loop"""
+        if self.ocr_pool is None:
+            # Spawn rather than fork, the browser process has threads of its own
+            self.ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self.ocr_pool
+
+    def start_ocr(self, screenshot_hash: str, screenshot_bytes: bytes) -> asyncio.Future:
+        """Start OCR of a screenshot in the process pool, or return the running or finished OCR of the same screenshot"""
+        future = self.ocr_results.get(screenshot_hash)
+        if future is not None:
+            self.ocr_results.move_to_end(screenshot_hash)
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.get_ocr_pool(), _ocr_image_bytes, screenshot_bytes)
+        future.add_done_callback(lambda f: self._ocr_done(screenshot_hash, f))
+        self.ocr_results[screenshot_hash] = future
+        while len(self.ocr_results) > OCR_CACHE_SIZE:
+            self.ocr_results.popitem(last=False)
+        return future
+
+    def _ocr_done(self, screenshot_hash: str, future: asyncio.Future):
+        if future.cancelled() or future.exception() is None:
+            return
+        print(f"Error performing OCR: {future.exception()}")
+        # Don't cache failures, the next request tries again
+        if self.ocr_results.get(screenshot_hash) is future:
+            del self.ocr_results[screenshot_hash]
+
+    async def get_ocr_text(self, screenshot_hash: str, screenshot_bytes: bytes) -> str:
+        """OCR a screenshot, waiting for the result"""
+        try:
+            return await asyncio.shield(self.start_ocr(screenshot_hash, screenshot_bytes))
+        except Exception:
+            return ""
+
+    def get_finished_ocr_text(self, screenshot_hash: str) -> Optional[str]:
+        """OCR text of a screenshot if it has already been computed"""
+        future = self.ocr_results.get(screenshot_hash)
+        if future is None or not future.done() or future.cancelled() or future.exception():
+            return None
+        return future.result()
     
     async def extract_ocr_text_from_screenshot(self, screenshot_base64: str) -> str:
         """Extract text from screenshot using OCR"""
@@ -684,41 +781,107 @@ class BrowserAutomation:
             return ""
             
         try:
-            # Decode base64 to image
             image_bytes = base64.b64decode(screenshot_base64)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Extract text using pytesseract
-            ocr_text = pytesseract.image_to_string(image)
-            
-            # Clean up the text
-            ocr_text = ocr_text.strip()
-            
-            return ocr_text
+            return await self.get_ocr_text(_screenshot_digest(image_bytes), image_bytes)
         except Exception as e:
             print(f"Error performing OCR: {e}")
             traceback.print_exc()
             return ""
+
+    async def dedupe_screenshot(self, screenshot_bytes: bytes) -> tuple:
+        """Hash a screenshot and reuse the previous one if it is byte for byte the same
+        Returns a tuple of (hash, screenshot_bytes, screenshot_base64)
+        """
+        screenshot_hash = _screenshot_digest(screenshot_bytes)
+        last = self.last_screenshot
+        if last and last[0] == screenshot_hash:
+            # Same image, keep the encoding callers have already seen along with its OCR
+            return last
+        screenshot = (screenshot_hash, screenshot_bytes, base64.b64encode(screenshot_bytes).decode('utf-8'))
+        self.last_screenshot = screenshot
+        return screenshot
+    
+    async def upload_screenshot(self, screenshot_hash: str, screenshot_bytes: bytes) -> Optional[str]:
+        """Upload a screenshot to the storage the caller asked for, returning its public url
+        Returns None if the caller didn't ask for an upload or it failed.
+        """
+        if screenshot_hash in self.uploaded_screenshots:
+            # The page didn't change, the caller can use the image it already has
+            return self.uploaded_screenshots[screenshot_hash]
+        upload = screenshot_upload.get()
+        if not upload:
+            return None
+        upload_url, public_url = upload
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _upload_image_bytes, upload_url, screenshot_bytes)
+        except Exception as e:
+            print(f"Error uploading screenshot: {e}")
+            return None
+        self.uploaded_screenshots[screenshot_hash] = public_url
+        while len(self.uploaded_screenshots) > OCR_CACHE_SIZE:
+            self.uploaded_screenshots.popitem(last=False)
+        return public_url
+
+    async def get_screenshot(self, screenshot_hash: str):
+        """Get the latest screenshot as raw JPEG bytes"""
+        if not self.last_screenshot or self.last_screenshot[0] != screenshot_hash:
+            raise HTTPException(status_code=404, detail=f"Screenshot {screenshot_hash} is no longer available")
+        return Response(content=self.last_screenshot[1], media_type="image/jpeg")
     
     async def get_updated_browser_state(self, action_name: str) -> tuple:
         """Helper method to get updated browser state after any action
         Returns a tuple of (dom_state, screenshot, elements, metadata)
+
+        The DOM, screenshot and viewport are captured concurrently. metadata['timings']
+        holds the milliseconds each stage took.
         """
+        timings = {}
+        started = time.perf_counter()
+
+        async def timed(stage: str, coro):
+            stage_started = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[stage] = round((time.perf_counter() - stage_started) * 1000, 1)
+
+        async def get_viewport(page: Page) -> dict:
+            try:
+                return await page.evaluate("""
+                () => {
+                    return {
+                        width: window.innerWidth,
+                        height: window.innerHeight
+                    };
+                }
+                """)
+            except Exception as e:
+                print(f"Error getting viewport dimensions: {e}")
+                return {}
+
+        async def get_screenshot(page: Page) -> Optional[bytes]:
+            try:
+                return await self.capture_screenshot(page)
+            except Exception as e:
+                print(f"Error taking screenshot: {e}")
+                return None
+
         try:
-            # Wait a moment for any potential async processes to settle
-            await asyncio.sleep(0.5)
+            page = await self.get_current_page()
+            await timed('settle', self.wait_for_page_to_settle(page))
             
-            # Get updated state
-            dom_state = await self.get_current_dom_state()
-            screenshot = await self.take_screenshot()
+            dom_state, screenshot_bytes, viewport = await asyncio.gather(
+                timed('dom', self.get_current_dom_state()),
+                timed('screenshot', get_screenshot(page)),
+                get_viewport(page),
+            )
             
             # Format elements for output
             elements = dom_state.element_tree.clickable_elements_to_string(
                 include_attributes=self.include_attributes
             )
             
-            # Collect additional metadata
-            page = await self.get_current_page()
             metadata = {}
             
             # Get element count
@@ -742,31 +905,33 @@ class BrowserAutomation:
                 interactive_elements.append(element_info)
             
             metadata['interactive_elements'] = interactive_elements
-            
-            # Get viewport dimensions - Fix syntax error in JavaScript
-            try:
-                viewport = await page.evaluate("""
-                () => {
-                    return {
-                        width: window.innerWidth,
-                        height: window.innerHeight
-                    };
-                }
-                """)
-                metadata['viewport_width'] = viewport.get('width', 0)
-                metadata['viewport_height'] = viewport.get('height', 0)
-            except Exception as e:
-                print(f"Error getting viewport dimensions: {e}")
-                metadata['viewport_width'] = 0
-                metadata['viewport_height'] = 0
-            
-            # Extract OCR text from screenshot if available
-            ocr_text = ""
-            if screenshot:
-                ocr_text = await self.extract_ocr_text_from_screenshot(screenshot)
-                metadata['ocr_text'] = ocr_text
-            
-            print(f"Got updated state after {action_name}: {len(dom_state.selector_map)} elements")
+            metadata['viewport_width'] = viewport.get('width', 0)
+            metadata['viewport_height'] = viewport.get('height', 0)
+            
+            screenshot = ""
+            if screenshot_bytes:
+                metadata['screenshot_hash'], screenshot_bytes, screenshot = await timed('hash', self.dedupe_screenshot(screenshot_bytes))
+
+                image_url = await timed('upload', self.upload_screenshot(metadata['screenshot_hash'], screenshot_bytes))
+                if image_url:
+                    # Only the url goes back, the image itself is already in storage
+                    metadata['image_url'] = image_url
+                    screenshot = ""
+
+                # OCR runs in the process pool. Lazily it is only returned once done,
+                # e.g. when the page didn't change, otherwise the caller fetches it from
+                # /automation/ocr while it stores the screenshot.
+                if OCR_MODE == "eager":
+                    metadata['ocr_text'] = await timed('ocr', self.get_ocr_text(metadata['screenshot_hash'], screenshot_bytes))
+                elif OCR_MODE == "lazy":
+                    self.start_ocr(metadata['screenshot_hash'], screenshot_bytes)
+                    ocr_text = self.get_finished_ocr_text(metadata['screenshot_hash'])
+                    if ocr_text is not None:
+                        metadata['ocr_text'] = ocr_text
+            
+            timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+            metadata['timings'] = timings
+            print(f"Got updated state after {action_name}: {len(dom_state.selector_map)} elements, timings (ms): {timings}")
             return dom_state, screenshot, elements, metadata
         except Exception as e:
             print(f"Error getting updated state after {action_name}: {e}")
@@ -789,11 +954,14 @@ class BrowserAutomation:
             url=dom_state.url if dom_state else fallback_url or "",
             title=dom_state.title if dom_state else "",
             elements=elements,
-            screenshot_base64=screenshot,
+            screenshot_base64=screenshot or None,
+            image_url=metadata.get('image_url'),
             pixels_above=dom_state.pixels_above if dom_state else 0,
             pixels_below=dom_state.pixels_below if dom_state else 0,
             content=content,
             ocr_text=metadata.get('ocr_text', ""),
+            screenshot_hash=metadata.get('screenshot_hash'),
+            timings=metadata.get('timings'),
             element_count=metadata.get('element_count', 0),
             interactive_elements=metadata.get('interactive_elements', []),
             viewport_width=metadata.get('viewport_width', 0),
@@ -1468,6 +1636,35 @@ class BrowserAutomation:
                 content=None
             )
     
+    async def ocr(self, action: OCRAction = Body(...)):
+        """Get the OCR text of a screenshot, by default of the current page"""
+        try:
+            screenshot_hash = action.screenshot_hash
+            if screenshot_hash and screenshot_hash in self.ocr_results:
+                ocr_text = await self.get_ocr_text(screenshot_hash, b"")
+            elif screenshot_hash and self.last_screenshot and self.last_screenshot[0] == screenshot_hash:
+                ocr_text = await self.get_ocr_text(screenshot_hash, self.last_screenshot[1])
+            elif screenshot_hash:
+                raise HTTPException(status_code=404, detail=f"Screenshot {screenshot_hash} is no longer available")
+            else:
+                page = await self.get_current_page()
+                screenshot_bytes = await self.capture_screenshot(page)
+                screenshot_hash, screenshot_bytes, _ = await self.dedupe_screenshot(screenshot_bytes)
+                ocr_text = await self.get_ocr_text(screenshot_hash, screenshot_bytes)
+            
+            return BrowserActionResult(
+                success=True,
+                message="Extracted text from screenshot",
+                ocr_text=ocr_text,
+                screenshot_hash=screenshot_hash
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error performing OCR: {e}")
+            traceback.print_exc()
+            return BrowserActionResult(success=False, message=str(e), error=str(e))
+    
     # Scroll Actions
 
     async def scroll_down(self, action: ScrollAction = Body(...)):
@@ -1848,6 +2045,14 @@ api_app = FastAPI()
 async def health_check():
     return {"status": "ok", "message": "API server is running"}
 
+@api_app.middleware("http")
+async def read_screenshot_upload(request: Request, call_next):
+    upload_url = request.headers.get("x-screenshot-upload-url")
+    public_url = request.headers.get("x-screenshot-public-url")
+    if upload_url and public_url:
+        screenshot_upload.set((upload_url, public_url))
+    return await call_next(request)
+
 # Include automation service router with /api prefix
 api_app.include_router(automation_service.router, prefix="/api")
 
@@ -0,0 +1,220 @@
+"""
+Streaming file transfers between the API and a sandbox.
+
+The sandbox SDK only moves whole files in memory. Large files are read in ranges of
+READ_CHUNK_SIZE bytes with dd in the sandbox and streamed out as each range arrives,
+which also serves HTTP Range requests. The next range is read while the current one is
+sent, so the round trips to the sandbox overlap with the transfer to the client.
+Uploads are written to the sandbox in parts of UPLOAD_CHUNK_SIZE bytes that are joined
+in place. Memory per request stays around two chunks whatever the size of the file.
+
+Small files, like the todo.md the frontend polls, are cached per sandbox and path
+under an ETag built from their size and modification time, so that repeated reads
+cost a get_file_info call instead of a download.
+"""
+
+import asyncio
+import base64
+import email.utils
+import hashlib
+import posixpath
+import re
+import shlex
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from daytona_sdk import AsyncSandbox
+from fastapi import UploadFile
+
+from utils.logger import logger
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+SMALL_FILE_SIZE = 256 * 1024  # Files up to this size are downloaded whole and cached
+MAX_CACHED_BYTES = 32 * 1024 * 1024
+EXEC_TIMEOUT = 60
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range lies outside the file."""
+
+
+def file_etag(path: str, size: int, mod_time: str) -> str:
+    """ETag of a file version, from its path, size and modification time."""
+    return '"' + hashlib.sha1(f"{path}:{size}:{mod_time}".encode()).hexdigest()[:20] + '"'
+
+
+def last_modified(mod_time: str) -> Optional[datetime]:
+    """Parse the modification time the sandbox reports, None if its format is unknown."""
+    try:
+        modified = datetime.fromisoformat(str(mod_time).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return modified if modified.tzinfo else modified.replace(tzinfo=timezone.utc)
+
+
+def format_http_date(value: datetime) -> str:
+    return email.utils.format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(etag: str, modified: Optional[datetime], if_none_match: Optional[str],
+                    if_modified_since: Optional[str]) -> bool:
+    """Whether the client's cached copy is current, by If-None-Match or else If-Modified-Since."""
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if if_modified_since and modified:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a Range header into an inclusive (start, end) byte range.
+
+    Returns None for a missing, malformed or multi-range header, which is answered
+    with the whole file.
+
+    Raises:
+        RangeNotSatisfiable: If the range starts past the end of the file.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.group(1), match.group(2)
+    if start == "":
+        # Suffix range, the last bytes of the file
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = size - 1 if end == "" else min(int(end), size - 1)
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+async def read_range(sandbox: AsyncSandbox, path: str, start: int, length: int) -> bytes:
+    """Read length bytes of a file from offset start."""
+    response = await sandbox.process.exec(
+        f"dd if={shlex.quote(path)} iflag=skip_bytes,count_bytes skip={start} count={length} bs=65536 "
+        f"status=none | base64 -w0",
+        timeout=EXEC_TIMEOUT,
+    )
+    if response.exit_code != 0:
+        raise RuntimeError(f"Failed to read {path}: {response.result}")
+    return base64.b64decode(response.result.strip())
+
+
+async def stream_file(sandbox: AsyncSandbox, path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield the bytes start to end (inclusive) of a file, one chunk at a time.
+
+    Each chunk is yielded while the next one is read.
+    """
+    def read(offset: int) -> asyncio.Task:
+        return asyncio.create_task(read_range(sandbox, path, offset, min(READ_CHUNK_SIZE, end - offset + 1)))
+
+    offset = start
+    pending: Optional[asyncio.Task] = read(offset)
+    try:
+        while pending is not None:
+            try:
+                chunk = await pending
+            except Exception as e:
+                # Headers are sent already, the client sees a short response
+                logger.error(f"Error streaming {path} at offset {offset}: {str(e)}")
+                return
+            if not chunk:
+                return
+            offset += len(chunk)
+            pending = read(offset) if offset <= end else None
+            yield chunk
+    finally:
+        # The client went away while the next chunk was being read
+        if pending is not None:
+            pending.cancel()
+
+
+async def upload_stream(sandbox: AsyncSandbox, file: UploadFile, path: str) -> int:
+    """Write an upload to the sandbox in parts, returning its size in bytes."""
+    first = await file.read(UPLOAD_CHUNK_SIZE)
+    if len(first) < UPLOAD_CHUNK_SIZE:
+        await sandbox.fs.upload_file(first, path)
+        return len(first)
+
+    parts_dir = f"/tmp/upload_{uuid.uuid4().hex}"
+    await sandbox.fs.create_folder(parts_dir, "755")
+    try:
+        size, index, chunk = 0, 0, first
+        while chunk:
+            await sandbox.fs.upload_file(chunk, f"{parts_dir}/{index:06d}")
+            size += len(chunk)
+            index += 1
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        response = await sandbox.process.exec(
+            f"mkdir -p {shlex.quote(posixpath.dirname(path) or '/')} && cat {parts_dir}/* > {shlex.quote(path)}",
+            timeout=EXEC_TIMEOUT,
+        )
+        if response.exit_code != 0:
+            raise RuntimeError(f"Failed to join the parts of {path}: {response.result}")
+        return size
+    finally:
+        try:
+            await sandbox.process.exec(f"rm -rf {parts_dir}", timeout=10)
+        except Exception:
+            pass
+
+
+class SmallFileCache:
+    """LRU cache of small file contents by sandbox, path and ETag.
+
+    Args:
+        max_bytes: Total size of the cached contents.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, sandbox_id: str, path: str, etag: str) -> Optional[bytes]:
+        entry = self._entries.get((sandbox_id, path))
+        if entry is None or entry[0] != etag:
+            return None
+        self._entries.move_to_end((sandbox_id, path))
+        return entry[1]
+
+    def put(self, sandbox_id: str, path: str, etag: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        self.invalidate(sandbox_id, path)
+        self._entries[(sandbox_id, path)] = (etag, content)
+        self._bytes += len(content)
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def invalidate(self, sandbox_id: str, path: str) -> None:
+        entry = self._entries.pop((sandbox_id, path), None)
+        if entry:
+            self._bytes -= len(entry[1])
+
+
+_cache: Optional[SmallFileCache] = None
+
+
+def get_small_file_cache() -> SmallFileCache:
+    """Get the process-wide small file cache."""
+    global _cache
+    if _cache is None:
+        _cache = SmallFileCache(MAX_CACHED_BYTES)
+    return _cache
@@ -0,0 +1,320 @@
+"""
+Pool of pre-created, started sandboxes.
+
+Creating a sandbox and starting supervisord takes long enough to dominate trigger
+executions and new projects. The pool keeps config.SANDBOX_POOL_SIZE started sandboxes
+per profile in the Redis list sandbox_pool:{profile}. Claiming one is a single LPOP,
+so a sandbox is never handed out twice across processes. A background task refills
+the pool and deletes sandboxes that sat idle long enough to be auto-stopped.
+
+Sandboxes are created through a SandboxBackend, so the pool can be run against
+InMemorySandboxBackend instead of Daytona.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, List
+
+from services import redis
+from utils.config import config, Configuration
+from utils.logger import logger
+
+REFILL_INTERVAL = 30  # Seconds between refill and reap passes
+REFILL_LOCK_TTL = 300
+
+
+@dataclass(frozen=True)
+class SandboxProfile:
+    """Image and resources of the sandboxes in a pool."""
+    image: str
+    cpu: int = 2
+    memory: int = 4
+    disk: int = 5
+
+    @property
+    def key(self) -> str:
+        return f"{self.image}:{self.cpu}cpu-{self.memory}gb-{self.disk}gb"
+
+
+DEFAULT_PROFILE = SandboxProfile(image=Configuration.SANDBOX_IMAGE_NAME)
+
+
+@dataclass
+class PooledSandbox:
+    """A started sandbox and what a project needs to use it.
+
+    to_project_sandbox() gives the value stored in projects.sandbox.
+    """
+    id: str
+    password: str
+    vnc_preview: str
+    sandbox_url: str
+    token: Optional[str] = None
+    created_at: float = 0.0
+
+    def to_project_sandbox(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "pass": self.password,
+            "vnc_preview": self.vnc_preview,
+            "sandbox_url": self.sandbox_url,
+            "token": self.token,
+        }
+
+
+class SandboxBackend(ABC):
+    """Creates and deletes sandboxes for the pool."""
+
+    @abstractmethod
+    async def create(self, profile: SandboxProfile, password: str, project_id: Optional[str] = None) -> PooledSandbox:
+        """Create and start a sandbox. project_id is only given for sandboxes created on demand."""
+
+    @abstractmethod
+    async def assign(self, sandbox_id: str, project_id: str) -> None:
+        """Record that a pooled sandbox now belongs to a project."""
+
+    @abstractmethod
+    async def delete(self, sandbox_id: str) -> None:
+        """Delete a sandbox."""
+
+
+def _parse_preview_link(link: Any) -> tuple[str, Optional[str]]:
+    url = link.url if hasattr(link, 'url') else str(link).split("url='")[1].split("'")[0]
+    token = None
+    if hasattr(link, 'token'):
+        token = link.token
+    elif "token='" in str(link):
+        token = str(link).split("token='")[1].split("'")[0]
+    return url, token
+
+
+class DaytonaSandboxBackend(SandboxBackend):
+    """Sandboxes created with sandbox.sandbox.create_sandbox."""
+
+    async def create(self, profile: SandboxProfile, password: str, project_id: Optional[str] = None) -> PooledSandbox:
+        from sandbox.sandbox import create_sandbox, delete_sandbox
+
+        sandbox = await create_sandbox(password, project_id, image=profile.image, cpu=profile.cpu, memory=profile.memory, disk=profile.disk)
+        try:
+            vnc_link, website_link = await asyncio.gather(
+                sandbox.get_preview_link(6080),
+                sandbox.get_preview_link(8080),
+            )
+        except Exception:
+            await delete_sandbox(sandbox.id)
+            raise
+        vnc_url, token = _parse_preview_link(vnc_link)
+        website_url, _ = _parse_preview_link(website_link)
+        return PooledSandbox(
+            id=sandbox.id,
+            password=password,
+            vnc_preview=vnc_url,
+            sandbox_url=website_url,
+            token=token,
+            created_at=time.time(),
+        )
+
+    async def assign(self, sandbox_id: str, project_id: str) -> None:
+        from sandbox.sandbox import daytona
+
+        sandbox = await daytona.get(sandbox_id)
+        await sandbox.set_labels({'id': project_id})
+
+    async def delete(self, sandbox_id: str) -> None:
+        from sandbox.sandbox import delete_sandbox
+
+        await delete_sandbox(sandbox_id)
+
+
+class InMemorySandboxBackend(SandboxBackend):
+    """Sandboxes that only exist in memory, to run the pool without Daytona."""
+
+    def __init__(self):
+        self.sandboxes: Dict[str, Optional[str]] = {}  # Sandbox ID -> project ID
+        self.created: List[str] = []
+        self.deleted: List[str] = []
+
+    async def create(self, profile: SandboxProfile, password: str, project_id: Optional[str] = None) -> PooledSandbox:
+        sandbox_id = f"local-{uuid.uuid4().hex[:12]}"
+        self.sandboxes[sandbox_id] = project_id
+        self.created.append(sandbox_id)
+        return PooledSandbox(
+            id=sandbox_id,
+            password=password,
+            vnc_preview=f"http://{sandbox_id}.localhost:6080",
+            sandbox_url=f"http://{sandbox_id}.localhost:8080",
+            created_at=time.time(),
+        )
+
+    async def assign(self, sandbox_id: str, project_id: str) -> None:
+        if sandbox_id not in self.sandboxes:
+            raise KeyError(f"Sandbox {sandbox_id} does not exist")
+        self.sandboxes[sandbox_id] = project_id
+
+    async def delete(self, sandbox_id: str) -> None:
+        self.sandboxes.pop(sandbox_id, None)
+        self.deleted.append(sandbox_id)
+
+
+class SandboxPool:
+    """Hands out pre-created sandboxes and keeps the pool topped up.
+
+    Args:
+        backend: Creates and deletes the sandboxes.
+        size: Number of idle sandboxes to keep per profile. 0 disables the pool.
+        max_idle: Seconds an idle sandbox is kept before it is deleted. Keep this
+            below the sandbox auto-stop interval so claimed sandboxes are running.
+        profiles: Profiles to keep warm.
+    """
+
+    def __init__(self, backend: SandboxBackend, size: int, max_idle: int, profiles: Optional[List[SandboxProfile]] = None):
+        self.backend = backend
+        self.size = size
+        self.max_idle = max_idle
+        self.profiles = profiles or [DEFAULT_PROFILE]
+        self._task: Optional[asyncio.Task] = None
+        self._refilling: set = set()
+
+    def _pool_key(self, profile: SandboxProfile) -> str:
+        return f"sandbox_pool:{profile.key}"
+
+    async def acquire(self, project_id: str, profile: SandboxProfile = DEFAULT_PROFILE) -> PooledSandbox:
+        """Get a started sandbox for a project.
+
+        Claims a pooled sandbox if one is available and creates one otherwise.
+        The caller owns the sandbox and deletes it if it cannot be used.
+        """
+        sandbox = await self._claim(profile)
+        if sandbox:
+            try:
+                await self.backend.assign(sandbox.id, project_id)
+            except Exception as e:
+                logger.warning(f"Failed to label pooled sandbox {sandbox.id} with project {project_id}: {str(e)}")
+            logger.info(f"Claimed pooled sandbox {sandbox.id} for project {project_id}")
+            self._schedule_refill(profile)
+            return sandbox
+
+        logger.info(f"No pooled sandbox available for project {project_id}, creating one")
+        self._schedule_refill(profile)
+        return await self.backend.create(profile, str(uuid.uuid4()), project_id)
+
+    async def _claim(self, profile: SandboxProfile) -> Optional[PooledSandbox]:
+        if self.size <= 0:
+            return None
+        try:
+            redis_client = await redis.get_client()
+            while True:
+                raw = await redis_client.lpop(self._pool_key(profile))
+                if raw is None:
+                    return None
+                sandbox = PooledSandbox(**json.loads(raw))
+                if time.time() - sandbox.created_at <= self.max_idle:
+                    return sandbox
+                # Too old to still be running, it is ours to delete now
+                asyncio.create_task(self._delete(sandbox.id))
+        except Exception as e:
+            logger.warning(f"Failed to claim a pooled sandbox: {str(e)}")
+            return None
+
+    async def _delete(self, sandbox_id: str) -> None:
+        try:
+            await self.backend.delete(sandbox_id)
+        except Exception as e:
+            logger.error(f"Failed to delete pooled sandbox {sandbox_id}: {str(e)}")
+
+    def _schedule_refill(self, profile: SandboxProfile) -> None:
+        if self.size <= 0 or profile.key in self._refilling:
+            return
+        self._refilling.add(profile.key)
+        task = asyncio.create_task(self.refill(profile))
+        task.add_done_callback(lambda task: self._refill_done(profile, task))
+
+    def _refill_done(self, profile: SandboxProfile, task: asyncio.Task) -> None:
+        self._refilling.discard(profile.key)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Failed to refill sandbox pool {profile.key}: {str(task.exception())}")
+
+    async def refill(self, profile: SandboxProfile) -> None:
+        """Create sandboxes until the pool of the profile is full.
+
+        A Redis lock keeps processes from overfilling the same pool.
+        """
+        redis_client = await redis.get_client()
+        lock_key = f"{self._pool_key(profile)}:refill_lock"
+        lock_value = str(uuid.uuid4())
+        if not await redis.set(lock_key, lock_value, nx=True, ex=REFILL_LOCK_TTL):
+            return
+        try:
+            missing = self.size - await redis_client.llen(self._pool_key(profile))
+            if missing <= 0:
+                return
+            results = await asyncio.gather(
+                *(self.backend.create(profile, str(uuid.uuid4())) for _ in range(missing)),
+                return_exceptions=True,
+            )
+            created = [result for result in results if isinstance(result, PooledSandbox)]
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.error(f"Failed to create pooled sandbox: {str(result)}")
+            if created:
+                await redis_client.rpush(self._pool_key(profile), *(json.dumps(asdict(sandbox)) for sandbox in created))
+                logger.info(f"Added {len(created)} sandboxes to pool {profile.key}")
+        finally:
+            if await redis.get(lock_key) == lock_value:
+                await redis.delete(lock_key)
+
+    async def reap(self, profile: SandboxProfile) -> None:
+        """Delete pooled sandboxes that have been idle longer than max_idle."""
+        redis_client = await redis.get_client()
+        now = time.time()
+        for raw in await redis_client.lrange(self._pool_key(profile), 0, -1):
+            sandbox = PooledSandbox(**json.loads(raw))
+            if now - sandbox.created_at <= self.max_idle:
+                continue
+            # LREM is atomic, so only one process deletes a sandbox and claimed ones are skipped
+            if await redis_client.lrem(self._pool_key(profile), 1, raw):
+                logger.info(f"Reaping idle pooled sandbox {sandbox.id}")
+                await self._delete(sandbox.id)
+
+    async def _maintain(self) -> None:
+        while True:
+            for profile in self.profiles:
+                try:
+                    await self.reap(profile)
+                    await self.refill(profile)
+                except Exception as e:
+                    logger.error(f"Error maintaining sandbox pool {profile.key}: {str(e)}")
+            await asyncio.sleep(REFILL_INTERVAL)
+
+    def start(self) -> None:
+        """Start refilling and reaping in the background."""
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_pool: Optional[SandboxPool] = None
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Get the process-wide sandbox pool."""
+    global _pool
+    if _pool is None:
+        _pool = SandboxPool(
+            DaytonaSandboxBackend(),
+            size=config.SANDBOX_POOL_SIZE,
+            max_idle=config.SANDBOX_POOL_MAX_IDLE,
+        )
+    return _pool
@@ -78,7 +78,14 @@ async def start_supervisord_session(sandbox: AsyncSandbox):
         logger.error(f"Error starting supervisord session: {str(e)}")
         raise e
 
-async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
+async def create_sandbox(
+    password: str,
+    project_id: str = None,
+    image: str = Configuration.SANDBOX_IMAGE_NAME,
+    cpu: int = 2,
+    memory: int = 4,
+    disk: int = 5,
+) -> AsyncSandbox:
     """Create a new sandbox with all required services configured and running."""
     
     logger.debug("Creating new Daytona sandbox environment")
@@ -90,7 +97,7 @@ async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
         labels = {'id': project_id}
         
     params = CreateSandboxFromImageParams(
-        image=Configuration.SANDBOX_IMAGE_NAME,
+        image=image,
         public=True,
         labels=labels,
         env_vars={
@@ -107,9 +114,9 @@ async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
             "CHROME_CDP": ""
         },
         resources=Resources(
-            cpu=2,
-            memory=4,
-            disk=5,
+            cpu=cpu,
+            memory=memory,
+            disk=disk,
         ),
         auto_stop_interval=15,
         auto_archive_interval=24 * 60,
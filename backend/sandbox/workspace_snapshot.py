@@ -0,0 +1,233 @@
+"""
+Snapshots of the text files in a sandbox workspace.
+
+The workspace is listed recursively with a single find in the sandbox, which skips the
+excluded directories like node_modules without descending into them. Only files whose
+size or modification time changed since the previous snapshot are downloaded again:
+a handful with concurrent downloads, many at once as a single tar archive built in the
+sandbox. Files are streamed one at a time through iter_files(), and binary files are
+recognised by sniffing their first bytes.
+"""
+
+import asyncio
+import codecs
+import hashlib
+import io
+import shlex
+import tarfile
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, List, AsyncIterator, Callable, Iterable
+
+from daytona_sdk import AsyncSandbox
+
+from utils.files_utils import EXCLUDED_DIRS, should_exclude_file
+from utils.logger import logger
+
+DOWNLOAD_CONCURRENCY = 8
+TAR_THRESHOLD = 20  # Changed files from which one archive is downloaded instead of each file
+MAX_FILE_SIZE = 2 * 1024 * 1024  # Larger files are listed without content
+MAX_CACHED_BYTES = 32 * 1024 * 1024  # Content of unchanged files kept between snapshots
+SNIFF_BYTES = 8192
+LIST_TIMEOUT = 60
+ARCHIVE_TIMEOUT = 120
+
+
+def is_binary(data: bytes) -> bool:
+    """Tell binary from UTF-8 text by the first bytes of a file."""
+    head = data[:SNIFF_BYTES]
+    if b"\0" in head:
+        return True
+    try:
+        # A character cut off at the end of the head is fine unless the file ends there
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=len(data) <= SNIFF_BYTES)
+        return False
+    except UnicodeDecodeError:
+        return True
+
+
+@dataclass
+class WorkspaceFile:
+    """A file of the workspace.
+
+    content is None for binary files and files larger than MAX_FILE_SIZE.
+    """
+    path: str  # Relative to the workspace
+    size: int
+    modified: float
+    sha256: Optional[str] = None
+    content: Optional[str] = None
+    is_binary: bool = False
+    changed: bool = True  # Whether the file changed since the previous snapshot
+
+
+class WorkspaceSnapshotter:
+    """Takes snapshots of a workspace, reusing what the previous snapshot fetched.
+
+    Args:
+        sandbox: The sandbox of the workspace.
+        workspace_path: Absolute path of the workspace in the sandbox.
+        should_exclude: Tells which relative paths to leave out.
+        excluded_dirs: Names of directories find doesn't descend into.
+    """
+
+    def __init__(self, sandbox: AsyncSandbox, workspace_path: str = "/workspace",
+                 should_exclude: Callable[[str], bool] = should_exclude_file,
+                 excluded_dirs: Iterable[str] = EXCLUDED_DIRS):
+        self.sandbox = sandbox
+        self.workspace_path = workspace_path.rstrip('/')
+        self.should_exclude = should_exclude
+        self.excluded_dirs = sorted(excluded_dirs)
+        self.manifest: Dict[str, WorkspaceFile] = {}
+        self._cached_bytes = 0
+
+    async def list_files(self) -> List[WorkspaceFile]:
+        """List the files of the workspace with their size and modification time."""
+        response = await self.sandbox.process.exec(self._find_command(), timeout=LIST_TIMEOUT)
+        if response.exit_code != 0:
+            raise RuntimeError(f"Failed to list workspace files: {response.result}")
+
+        files = []
+        for line in response.result.splitlines():
+            parts = line.rsplit("\t", 2)
+            if len(parts) != 3 or self.should_exclude(parts[0]):
+                continue
+            try:
+                files.append(WorkspaceFile(path=parts[0], size=int(parts[1]), modified=float(parts[2])))
+            except ValueError:
+                continue
+        return files
+
+    def _find_command(self) -> str:
+        list_files = "-type f -printf '%P\\t%s\\t%T@\\n'"
+        if not self.excluded_dirs:
+            return f"find {self.workspace_path} {list_files}"
+        names = " -o ".join(f"-name {shlex.quote(name)}" for name in self.excluded_dirs)
+        return f"find {self.workspace_path} -mindepth 1 -type d \\( {names} \\) -prune -o {list_files}"
+
+    async def iter_files(self) -> AsyncIterator[WorkspaceFile]:
+        """Yield the files of the workspace, downloading only those that changed.
+
+        Files are yielded as they become available, not in listing order.
+        """
+        files = await self.list_files()
+        current = {file.path for file in files}
+        for path in list(self.manifest):
+            if path not in current:
+                self._forget(path)
+
+        to_fetch = []
+        for file in files:
+            known = self.manifest.get(file.path)
+            if known and known.size == file.size and known.modified == file.modified:
+                if known.content is not None or known.is_binary or known.size > MAX_FILE_SIZE:
+                    yield WorkspaceFile(**{**asdict(known), "changed": False})
+                    continue
+                # Unchanged, but its content did not fit the cache
+                file.changed = False
+            if file.size > MAX_FILE_SIZE:
+                self._remember(file)
+                yield file
+                continue
+            to_fetch.append(file)
+
+        if len(to_fetch) >= TAR_THRESHOLD:
+            fetched = self._fetch_archive(to_fetch)
+        else:
+            fetched = self._fetch_each(to_fetch)
+        async for file in fetched:
+            self._remember(file)
+            yield file
+
+    async def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get the text files of the workspace as a dict of relative path to content and metadata."""
+        files_state = {}
+        async for file in self.iter_files():
+            if file.content is None:
+                continue
+            files_state[file.path] = {
+                "content": file.content,
+                "is_dir": False,
+                "size": file.size,
+                "modified": file.modified
+            }
+        return files_state
+
+    def _read(self, file: WorkspaceFile, data: bytes) -> WorkspaceFile:
+        file.sha256 = hashlib.sha256(data).hexdigest()
+        file.is_binary = is_binary(data)
+        file.content = None if file.is_binary else data.decode("utf-8", errors="replace")
+        return file
+
+    async def _fetch_each(self, files: List[WorkspaceFile]) -> AsyncIterator[WorkspaceFile]:
+        pending: asyncio.Queue = asyncio.Queue()
+        for file in files:
+            pending.put_nowait(file)
+        done: asyncio.Queue = asyncio.Queue(maxsize=DOWNLOAD_CONCURRENCY)
+
+        async def download() -> None:
+            while not pending.empty():
+                file = pending.get_nowait()
+                try:
+                    data = await self.sandbox.fs.download_file(f"{self.workspace_path}/{file.path}")
+                    await done.put(self._read(file, data))
+                except Exception as e:
+                    logger.warning(f"Error reading file {file.path}: {str(e)}")
+                    await done.put(None)
+
+        workers = [asyncio.create_task(download()) for _ in range(min(DOWNLOAD_CONCURRENCY, len(files)))]
+        try:
+            for _ in files:
+                file = await done.get()
+                if file is not None:
+                    yield file
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _fetch_archive(self, files: List[WorkspaceFile]) -> AsyncIterator[WorkspaceFile]:
+        archive_id = uuid.uuid4().hex
+        list_path = f"/tmp/snapshot_{archive_id}.list"
+        archive_path = f"/tmp/snapshot_{archive_id}.tar.gz"
+        try:
+            await self.sandbox.fs.upload_file("\0".join(file.path for file in files).encode(), list_path)
+            response = await self.sandbox.process.exec(
+                f"tar --null -czf {archive_path} -C {self.workspace_path} -T {list_path}", timeout=ARCHIVE_TIMEOUT
+            )
+            if response.exit_code != 0:
+                raise RuntimeError(response.result)
+            archive = await self.sandbox.fs.download_file(archive_path)
+        except Exception as e:
+            logger.warning(f"Failed to archive workspace, downloading files one by one: {str(e)}")
+            async for file in self._fetch_each(files):
+                yield file
+            return
+        finally:
+            try:
+                await self.sandbox.process.exec(f"rm -f {list_path} {archive_path}", timeout=10)
+            except Exception:
+                pass
+
+        by_path = {file.path: file for file in files}
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+            for member in tar:
+                file = by_path.get(member.name)
+                if file is None or not member.isfile():
+                    continue
+                data = await asyncio.to_thread(lambda: tar.extractfile(member).read())
+                yield self._read(file, data)
+
+    def _remember(self, file: WorkspaceFile) -> None:
+        self._forget(file.path)
+        entry = WorkspaceFile(**asdict(file))
+        if entry.content is not None:
+            if self._cached_bytes + len(entry.content) > MAX_CACHED_BYTES:
+                entry.content = None
+            else:
+                self._cached_bytes += len(entry.content)
+        self.manifest[file.path] = entry
+
+    def _forget(self, path: str) -> None:
+        entry = self.manifest.pop(path, None)
+        if entry and entry.content is not None:
+            self._cached_bytes -= len(entry.content)
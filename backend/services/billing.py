@@ -15,6 +15,9 @@ from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES, HARDCODED_MODEL_PRICES
 from litellm.cost_calculator import cost_per_token
+from services import redis
+from services.subscription_cache import SubscriptionCache
+import asyncio
 import time
 
 # Initialize Stripe
@@ -23,6 +26,27 @@ stripe.api_key = config.STRIPE_SECRET_KEY
 # Token price multiplier
 TOKEN_PRICE_MULTIPLIER = 1.5
 
+# Usage ledger settings
+USAGE_LEDGER_TTL = 3600 * 24 * 35  # Outlives the month it tracks
+USAGE_LEDGER_RECONCILE_INTERVAL = 600  # Seconds between DB reconciles per account
+USAGE_LEDGER_THREAD_CACHE_SIZE = 10000
+USAGE_LEDGER_REBUILD_LOCK_TTL = 120  # Longest a rebuild of a missing ledger may hold its lock
+USAGE_LEDGER_REBUILD_POLL_INTERVAL = 0.2
+
+# Increment the ledger only when it exists, so a missing ledger is always rebuilt from the DB
+_USAGE_LEDGER_INCR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBYFLOAT', KEYS[1], 'total', ARGV[1])
+end
+return false
+"""
+
+# thread_id -> (account_id, created_at) for usage ledger updates
+_ledger_thread_cache: Dict[str, Tuple[str, datetime]] = {}
+_ledger_reconcile_tasks: set = set()
+# user_id -> rebuild of a missing ledger in this process
+_ledger_rebuilds: Dict[str, asyncio.Task] = {}
+
 # Initialize router
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -117,79 +141,98 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
     
     return customer.id
 
-async def get_user_subscription(user_id: str) -> Optional[Dict]:
-    """Get the current subscription for a user from Stripe."""
-    try:
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
+def _fetch_subscription_from_stripe(customer_id: str, user_id: str) -> Optional[Dict]:
+    """Get the current subscription of a Stripe customer. Blocking, run it in a thread."""
+    # Get all active subscriptions for the customer
+    subscriptions = stripe.Subscription.list(
+        customer=customer_id,
+        status='active'
+    )
+    # print("Found subscriptions:", subscriptions)
+    
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        if not customer_id:
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = stripe.Subscription.list(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Get the first subscription item
+        if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
+            item = sub['items']['data'][0]
+            if item.get('price') and item['price'].get('id') in [
+                config.STRIPE_FREE_TIER_ID,
+                config.STRIPE_TIER_2_20_ID,
+                config.STRIPE_TIER_6_50_ID,
+                config.STRIPE_TIER_12_100_ID,
+                config.STRIPE_TIER_25_200_ID,
+                config.STRIPE_TIER_50_400_ID,
+                config.STRIPE_TIER_125_800_ID,
+                config.STRIPE_TIER_200_1000_ID,
+                # Yearly tiers
+                config.STRIPE_TIER_2_20_YEARLY_ID,
+                config.STRIPE_TIER_6_50_YEARLY_ID,
+                config.STRIPE_TIER_12_100_YEARLY_ID,
+                config.STRIPE_TIER_25_200_YEARLY_ID,
+                config.STRIPE_TIER_50_400_YEARLY_ID,
+                config.STRIPE_TIER_125_800_YEARLY_ID,
+                config.STRIPE_TIER_200_1000_YEARLY_ID
+            ]:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
         
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Get the first subscription item
-            if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
-                item = sub['items']['data'][0]
-                if item.get('price') and item['price'].get('id') in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID,
-                    config.STRIPE_TIER_6_50_ID,
-                    config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID,
-                    config.STRIPE_TIER_50_400_ID,
-                    config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID,
-                    config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID,
-                    config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID,
-                    config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID
-                ]:
-                    our_subscriptions.append(sub)
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
         
-        if not our_subscriptions:
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        stripe.Subscription.modify(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
-            
-        return our_subscriptions[0]
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    stripe.Subscription.modify(
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
+        
+    return our_subscriptions[0]
+
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user from Stripe without blocking the event loop."""
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
+    
+    if not customer_id:
+        return None
+    
+    return await asyncio.to_thread(_fetch_subscription_from_stripe, customer_id, user_id)
+
+subscription_cache = SubscriptionCache(_fetch_user_subscription)
+
+async def get_user_subscription(user_id: str, refresh: bool = False) -> Optional[Dict]:
+    """Get the current subscription for a user.
+    
+    Served from the subscription cache, which the Stripe webhook keeps up to date.
+    Stripe is only called on a cache miss or when refresh is set.
+    
+    Args:
+        user_id: The user to get the subscription for
+        refresh: Bypass the cache, e.g. before modifying the subscription
+    """
+    try:
+        if refresh:
+            return await subscription_cache.refresh(user_id)
+        return await subscription_cache.get(user_id)
         
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
@@ -228,17 +271,189 @@ async def calculate_monthly_usage(client, user_id: str) -> float:
     return total_cost
 
 
-async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
-    """Get detailed usage logs for a user with pagination."""
-    # Get start of current month in UTC
-    now = datetime.now(timezone.utc)
+def get_usage_period_start(now: Optional[datetime] = None) -> datetime:
+    """Get the start of the current billing period (start of month in UTC)."""
+    now = now or datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
     
     # Use fixed cutoff date: June 26, 2025 midnight UTC
     # Ignore all token counts before this date
     cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
     
-    start_of_month = max(start_of_month, cutoff_date)
+    return max(start_of_month, cutoff_date)
+
+
+def _usage_ledger_key(user_id: str, now: Optional[datetime] = None) -> str:
+    """Get the Redis key of the usage ledger for a user's current month."""
+    now = now or datetime.now(timezone.utc)
+    return f"usage_ledger:{user_id}:{now.strftime('%Y-%m')}"
+
+
+async def _get_thread_billing_info(client, thread_id: str) -> Optional[Tuple[str, datetime]]:
+    """Get (account_id, created_at) for a thread, cached in process as neither ever changes."""
+    cached = _ledger_thread_cache.get(thread_id)
+    if cached:
+        return cached
+    
+    result = await client.table('threads').select('account_id, created_at').eq('thread_id', thread_id).execute()
+    if not result.data or not result.data[0].get('account_id'):
+        return None
+    
+    info = (result.data[0]['account_id'], datetime.fromisoformat(result.data[0]['created_at']))
+    if len(_ledger_thread_cache) >= USAGE_LEDGER_THREAD_CACHE_SIZE:
+        _ledger_thread_cache.pop(next(iter(_ledger_thread_cache)))
+    _ledger_thread_cache[thread_id] = info
+    return info
+
+
+async def record_usage(client, thread_id: str, content) -> None:
+    """
+    Add the cost of an assistant_response_end message to the running usage ledger.
+    
+    Called when the message is written. Mirrors the filters of get_usage_logs, so the
+    ledger only counts messages of threads created in the current billing period.
+    The ledger is only incremented when it already exists; a missing ledger is rebuilt
+    from the DB on the next read, which will include this message.
+    """
+    if config.ENV_MODE == EnvMode.LOCAL:
+        return
+    
+    if not isinstance(content, dict):
+        content = content.model_dump() if hasattr(content, 'model_dump') else {}
+    usage = content.get('usage') or {}
+    cost = calculate_token_cost(
+        usage.get('prompt_tokens', 0),
+        usage.get('completion_tokens', 0),
+        content.get('model', 'unknown')
+    )
+    if cost <= 0:
+        return
+    
+    thread_info = await _get_thread_billing_info(client, thread_id)
+    if not thread_info:
+        logger.warning(f"Could not resolve account for thread {thread_id}, skipping usage ledger update")
+        return
+    
+    user_id, thread_created_at = thread_info
+    if thread_created_at < get_usage_period_start():
+        return
+    
+    redis_client = await redis.get_client()
+    await redis_client.eval(_USAGE_LEDGER_INCR_SCRIPT, 1, _usage_ledger_key(user_id), cost)
+
+
+async def reconcile_monthly_usage(client, user_id: str) -> float:
+    """
+    Rebuild the usage ledger of a user from the DB and return the current month's usage.
+    
+    Increments recorded while the scan is running may be overwritten; they are picked up
+    again by the next reconcile.
+    """
+    key = _usage_ledger_key(user_id)
+    total_cost = await calculate_monthly_usage(client, user_id)
+    
+    try:
+        redis_client = await redis.get_client()
+        await redis_client.hset(key, mapping={
+            'total': total_cost,
+            'reconciled_at': time.time()
+        })
+        await redis_client.expire(key, USAGE_LEDGER_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to store usage ledger for user {user_id}: {str(e)}")
+    
+    return total_cost
+
+
+async def _reconcile_usage_ledger_in_background(user_id: str) -> None:
+    """Reconcile a user's usage ledger, allowing a single reconcile per account across workers."""
+    lock_key = f"{_usage_ledger_key(user_id)}:reconcile_lock"
+    try:
+        if not await redis.set(lock_key, "1", ex=USAGE_LEDGER_RECONCILE_INTERVAL, nx=True):
+            return
+        
+        db = DBConnection()
+        client = await db.client
+        await reconcile_monthly_usage(client, user_id)
+    except Exception as e:
+        logger.error(f"Error reconciling usage ledger for user {user_id}: {str(e)}")
+
+
+async def _rebuild_usage_ledger(client, user_id: str) -> float:
+    """
+    Rebuild a missing usage ledger, with a single rebuild per account across workers.
+    
+    The worker holding the lock rescans the month; the others wait for the ledger it
+    stores and only rescan themselves if it fails.
+    """
+    key = _usage_ledger_key(user_id)
+    lock_key = f"{key}:rebuild_lock"
+    try:
+        has_lock = await redis.set(lock_key, "1", ex=USAGE_LEDGER_REBUILD_LOCK_TTL, nx=True)
+    except Exception as e:
+        logger.warning(f"Failed to lock usage ledger rebuild for user {user_id}: {str(e)}")
+        has_lock = True
+    
+    if has_lock:
+        try:
+            return await reconcile_monthly_usage(client, user_id)
+        finally:
+            try:
+                await redis.delete(lock_key)
+            except Exception:
+                pass
+    
+    deadline = time.monotonic() + USAGE_LEDGER_REBUILD_LOCK_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(USAGE_LEDGER_REBUILD_POLL_INTERVAL)
+        try:
+            redis_client = await redis.get_client()
+            total = await redis_client.hget(key, 'total')
+            if total is not None:
+                return float(total)
+            if not await redis.get(lock_key):
+                break
+        except Exception:
+            break
+    logger.warning(f"Usage ledger rebuild of another worker failed for user {user_id}, rescanning usage")
+    return await reconcile_monthly_usage(client, user_id)
+
+
+async def get_monthly_usage(client, user_id: str) -> float:
+    """
+    Get the current month's usage for a user from the usage ledger.
+    
+    Reads the running total from Redis and schedules a background reconcile against the DB
+    once the ledger is older than USAGE_LEDGER_RECONCILE_INTERVAL. A missing ledger is
+    rebuilt once per account, however many checks are waiting for it. Falls back to a full
+    rescan when Redis is unavailable.
+    """
+    try:
+        redis_client = await redis.get_client()
+        ledger = await redis_client.hgetall(_usage_ledger_key(user_id))
+    except Exception as e:
+        logger.warning(f"Usage ledger unavailable for user {user_id}, rescanning usage: {str(e)}")
+        return await calculate_monthly_usage(client, user_id)
+    
+    if not ledger or 'total' not in ledger:
+        rebuild = _ledger_rebuilds.get(user_id)
+        if rebuild is None:
+            rebuild = asyncio.create_task(_rebuild_usage_ledger(client, user_id))
+            _ledger_rebuilds[user_id] = rebuild
+            rebuild.add_done_callback(lambda _: _ledger_rebuilds.pop(user_id, None))
+        return await asyncio.shield(rebuild)
+    
+    if time.time() - float(ledger.get('reconciled_at', 0)) > USAGE_LEDGER_RECONCILE_INTERVAL:
+        task = asyncio.create_task(_reconcile_usage_ledger_in_background(user_id))
+        _ledger_reconcile_tasks.add(task)
+        task.add_done_callback(_ledger_reconcile_tasks.discard)
+    
+    return float(ledger['total'])
+
+
+async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
+    """Get detailed usage logs for a user with pagination."""
+    start_of_month = get_usage_period_start()
     
     # First get all threads for this user in batches
     batch_size = 1000
@@ -494,8 +709,8 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
         logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
         tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
     
-    # Calculate current month's usage
-    current_usage = await calculate_monthly_usage(client, user_id)
+    # Get current month's usage from the running ledger
+    current_usage = await get_monthly_usage(client, user_id)
     
     # Check if within limits
     if current_usage >= tier_info['cost']:
@@ -536,7 +751,7 @@ async def create_checkout_session(
             raise HTTPException(status_code=400, detail="Price ID does not belong to the correct product.")
             
         # Check for existing subscription for our product
-        existing_subscription = await get_user_subscription(current_user_id)
+        existing_subscription = await get_user_subscription(current_user_id, refresh=True)
         # print("Existing subscription for product:", existing_subscription)
         
         if existing_subscription:
@@ -582,6 +797,7 @@ async def create_checkout_session(
                         {'active': True}
                     ).eq('id', customer_id).execute()
                     logger.info(f"Updated customer {customer_id} active status to TRUE after subscription upgrade")
+                    await subscription_cache.invalidate(current_user_id)
                     
                     latest_invoice = None
                     if updated_subscription.get('latest_invoice'):
@@ -903,7 +1119,7 @@ async def get_subscription(
         # Calculate current usage
         db = DBConnection()
         client = await db.client
-        current_usage = await calculate_monthly_usage(client, current_user_id)
+        current_usage = await get_monthly_usage(client, current_user_id)
 
         if not subscription:
             # Default to free tier status if no active subscription for our product
@@ -998,6 +1214,24 @@ async def check_status(
         logger.error(f"Error checking billing status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _refresh_cached_subscription(client, customer_id: str) -> None:
+    """Bring the cached subscription of a customer's account up to date after a webhook event."""
+    customer_result = await client.schema('basejump').from_('billing_customers') \
+        .select('account_id') \
+        .eq('id', customer_id) \
+        .execute()
+    
+    if not customer_result.data:
+        return
+    
+    account_id = customer_result.data[0]['account_id']
+    try:
+        # Events can arrive out of order, so re-read the subscription instead of caching the event's
+        await subscription_cache.refresh(account_id)
+    except Exception as e:
+        logger.error(f"Webhook: Error refreshing cached subscription for account {account_id}: {str(e)}")
+        await subscription_cache.invalidate(account_id)
+
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
     """Handle Stripe webhook events."""
@@ -1044,11 +1278,12 @@ async def stripe_webhook(request: Request):
                 else:
                     # Subscription is not active (e.g., past_due, canceled, etc.)
                     # Check if customer has any other active subscriptions before updating status
-                    has_active = len(stripe.Subscription.list(
+                    has_active = len((await asyncio.to_thread(
+                        stripe.Subscription.list,
                         customer=customer_id,
                         status='active',
                         limit=1
-                    ).get('data', [])) > 0
+                    )).get('data', [])) > 0
                     
                     if not has_active:
                         await client.schema('basejump').from_('billing_customers').update(
@@ -1058,11 +1293,12 @@ async def stripe_webhook(request: Request):
             
             elif event.type == 'customer.subscription.deleted':
                 # Check if customer has any other active subscriptions
-                has_active = len(stripe.Subscription.list(
+                has_active = len((await asyncio.to_thread(
+                    stripe.Subscription.list,
                     customer=customer_id,
                     status='active',
                     limit=1
-                ).get('data', [])) > 0
+                )).get('data', [])) > 0
                 
                 if not has_active:
                     # If no active subscriptions left, set active to false
@@ -1071,6 +1307,8 @@ async def stripe_webhook(request: Request):
                     ).eq('id', customer_id).execute()
                     logger.info(f"Webhook: Updated customer {customer_id} active status to FALSE after subscription deletion")
             
+            await _refresh_cached_subscription(client, customer_id)
+            
             logger.info(f"Processed {event.type} event for customer {customer_id}")
         
         return {"status": "success"}
@@ -0,0 +1,230 @@
+"""
+Firecrawl scraping engine.
+
+All scrapes of the process go through one pooled HTTP client. At most
+config.SCRAPE_CONCURRENCY requests are in flight, and at most
+config.SCRAPE_PER_HOST_CONCURRENCY per scraped host, started at least
+HOST_INTERVAL apart so a list of pages of one site doesn't hammer it. The limits of
+a host are dropped once none of its scrapes are running or waiting.
+
+Scraped pages are cached in Redis per account under scrape:{account_id}:{hash of the
+normalized URL}, so scraping the same page again within config.SCRAPE_CACHE_TTL
+doesn't call Firecrawl.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Union, AsyncIterator
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REQUEST_TIMEOUT = 120
+MAX_ATTEMPTS = 3
+HOST_INTERVAL = 0.25  # Seconds between the starts of two scrapes of the same host
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid")
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so different spellings of the same page share a cache entry.
+
+    Adds https:// if the scheme is missing, lowercases scheme and host, drops default
+    ports, fragments, tracking parameters and trailing slashes, and sorts the query.
+    Only used for cache keys, pages are scraped at the URL as given.
+    """
+    url = url.strip()
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (scheme == 'http' and parts.port == 80) and not (scheme == 'https' and parts.port == 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class _HostLimiter:
+    def __init__(self, concurrency: int):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.next_start = 0.0
+        self.users = 0  # Scrapes running or waiting
+
+    async def wait_turn(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + HOST_INTERVAL
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FirecrawlScraper:
+    """Scrapes pages to markdown through Firecrawl.
+
+    Args:
+        api_key: Firecrawl API key.
+        base_url: Firecrawl API URL.
+        concurrency: Scrapes in flight at the same time.
+        per_host_concurrency: Scrapes of the same host in flight at the same time.
+        cache_ttl: Seconds a scraped page is served from the cache.
+    """
+
+    def __init__(self, api_key: str, base_url: str, concurrency: int, per_host_concurrency: int, cache_ttl: int):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.cache_ttl = cache_ttl
+        self.per_host_concurrency = per_host_concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, _HostLimiter] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(REQUEST_TIMEOUT),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._client
+
+    async def scrape(self, url: str, account_id: Optional[str] = None) -> Dict[str, Any]:
+        """Scrape a page, from the cache of the account if it was scraped recently.
+
+        Returns:
+            The page as a dict with title, url, text and, if available, metadata.
+
+        Raises:
+            Exception: If the page could not be scraped.
+        """
+        url = url.strip()
+        if not url.lower().startswith(('http://', 'https://')):
+            url = 'https://' + url
+        cache_key = self._cache_key(normalize_url(url), account_id) if account_id else None
+        if cache_key:
+            cached = await self._load(cache_key)
+            if cached is not None:
+                logger.debug(f"Serving scrape of {url} from cache")
+                return cached
+
+        page = await self._scrape(url)
+        if cache_key:
+            await self._store(cache_key, page)
+        return page
+
+    async def scrape_many(self, urls: List[str], account_id: Optional[str] = None) -> List[Union[Dict[str, Any], Exception]]:
+        """Scrape pages concurrently.
+
+        Returns:
+            For each URL, in order, the page or the exception scraping it raised.
+            URLs that normalize to the same page are scraped once.
+        """
+        tasks: Dict[str, asyncio.Task] = {}
+        for url in urls:
+            normalized = normalize_url(url)
+            if normalized not in tasks:
+                tasks[normalized] = asyncio.create_task(self.scrape(url, account_id))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return [
+            task.exception() or task.result()
+            for task in (tasks[normalize_url(url)] for url in urls)
+        ]
+
+    async def _scrape(self, url: str) -> Dict[str, Any]:
+        async with self._host_turn(urlsplit(url).netloc):
+            data = await self._request(url)
+
+        title = data.get("data", {}).get("metadata", {}).get("title", "")
+        markdown_content = data.get("data", {}).get("markdown", "")
+        logger.info(f"Extracted content from {url}: title='{title}', content length={len(markdown_content)}")
+
+        page = {
+            "title": title,
+            "url": url,
+            "text": markdown_content
+        }
+        if "metadata" in data.get("data", {}):
+            page["metadata"] = data["data"]["metadata"]
+        return page
+
+    @asynccontextmanager
+    async def _host_turn(self, netloc: str) -> AsyncIterator[None]:
+        """Hold one of the host's slots and then a scrape slot, dropping the host's limits once unused.
+
+        The host's slot and spacing come first, so scrapes waiting for a busy host don't
+        hold scrape slots other hosts could use.
+        """
+        host = self._hosts.get(netloc)
+        if host is None:
+            host = self._hosts[netloc] = _HostLimiter(self.per_host_concurrency)
+        host.users += 1
+        try:
+            async with host.slots:
+                await host.wait_turn()
+                async with self._slots:
+                    yield
+        finally:
+            host.users -= 1
+            if host.users == 0:
+                del self._hosts[netloc]
+
+    async def _request(self, url: str) -> Dict[str, Any]:
+        payload = {
+            "url": url,
+            "formats": ["markdown"]
+        }
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                response = await self._get_client().post(f"{self.base_url}/v1/scrape", json=payload)
+                response.raise_for_status()
+                return response.json()
+            except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as e:
+                logger.warning(f"Scrape of {url} timed out (attempt {attempt}/{MAX_ATTEMPTS}): {str(e)}")
+                if attempt == MAX_ATTEMPTS:
+                    raise Exception(f"Request timed out after {MAX_ATTEMPTS} attempts with {REQUEST_TIMEOUT}s timeout")
+                await asyncio.sleep(2 ** attempt)
+
+    def _cache_key(self, url: str, account_id: str) -> str:
+        return f"scrape:{account_id}:{hashlib.sha256(url.encode()).hexdigest()}"
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await redis.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read cached scrape: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _store(self, key: str, page: Dict[str, Any]) -> None:
+        try:
+            await redis.set(key, json.dumps(page, ensure_ascii=False), ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache scrape: {str(e)}")
+
+
+_scraper: Optional[FirecrawlScraper] = None
+
+
+def get_scraper() -> FirecrawlScraper:
+    """Get the process-wide Firecrawl scraper."""
+    global _scraper
+    if _scraper is None:
+        _scraper = FirecrawlScraper(
+            api_key=config.FIRECRAWL_API_KEY,
+            base_url=config.FIRECRAWL_URL or "https://api.firecrawl.dev",
+            concurrency=config.SCRAPE_CONCURRENCY,
+            per_host_concurrency=config.SCRAPE_PER_HOST_CONCURRENCY,
+            cache_ttl=config.SCRAPE_CACHE_TTL,
+        )
+    return _scraper
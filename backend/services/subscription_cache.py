@@ -0,0 +1,99 @@
+"""
+Two-tier cache of user subscriptions.
+
+Subscriptions are read from an in-process TTL tier, then from Redis, and only on a
+miss from the billing provider. The Stripe webhook keeps the Redis tier up to date,
+so check_billing_status no longer waits on Stripe. The fetch function is injected,
+so the cache can run against a fake provider.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services import redis
+from utils.logger import logger
+
+# Shorter than the Redis TTL: other processes only learn about webhook updates via Redis
+LOCAL_TTL = 60
+REDIS_TTL = 3600
+
+
+class SubscriptionCache:
+    """Caches the active subscription (or the absence of one) of each user.
+
+    Args:
+        fetch: Coroutine function returning the current subscription of a user from
+            the billing provider, or None if the user has none.
+        local_ttl: Seconds entries stay in the in-process tier.
+        redis_ttl: Seconds entries stay in Redis.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]],
+        local_ttl: int = LOCAL_TTL,
+        redis_ttl: int = REDIS_TTL,
+    ):
+        self.fetch = fetch
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _redis_key(self, user_id: str) -> str:
+        return f"subscription:{user_id}"
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the subscription of a user, backfilling the cache on a miss."""
+        entry = self._local.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        try:
+            cached = await redis.get(self._redis_key(user_id))
+        except Exception as e:
+            logger.warning(f"Failed to read cached subscription for user {user_id}: {str(e)}")
+            cached = None
+        if cached is not None:
+            subscription = json.loads(cached)
+            self._local[user_id] = (time.monotonic() + self.local_ttl, subscription)
+            return subscription
+
+        return await self.refresh(user_id)
+
+    async def refresh(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the subscription of a user from the provider and cache it.
+
+        Concurrent refreshes of the same user share a single fetch.
+        """
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, user_id: str) -> Optional[Dict[str, Any]]:
+        subscription = await self.fetch(user_id)
+        await self.set(user_id, subscription)
+        return subscription
+
+    async def set(self, user_id: str, subscription: Optional[Dict[str, Any]]) -> None:
+        """Store the subscription of a user, e.g. from a webhook event."""
+        # Round trip through JSON so cached values look the same on every tier
+        serialized = json.dumps(subscription, default=str)
+        self._local[user_id] = (time.monotonic() + self.local_ttl, json.loads(serialized))
+        try:
+            await redis.set(self._redis_key(user_id), serialized, ex=self.redis_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache subscription for user {user_id}: {str(e)}")
+
+    async def invalidate(self, user_id: str) -> None:
+        """Drop the cached subscription of a user from both tiers."""
+        self._local.pop(user_id, None)
+        try:
+            await redis.delete(self._redis_key(user_id))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached subscription for user {user_id}: {str(e)}")
@@ -0,0 +1,193 @@
+"""
+Buffered Langfuse tracing for agent runs.
+
+RunTrace wraps a Langfuse trace with the same event, span, generation and update
+methods. Events are buffered and sent in batches from a worker thread instead of
+one by one on the event loop, stamped with the time they were recorded rather than
+sent. Routine events (DEFAULT and DEBUG levels) are sent for their first
+EVENT_SAMPLES_PER_NAME occurrences and only counted after that. Once a run sent
+config.TRACE_EVENT_BUDGET events, later routine events are counted as dropped;
+warnings and errors are always sent.
+
+Payloads longer than config.TRACE_MAX_PAYLOAD_CHARS are replaced by their sha256,
+length and first PREVIEW_CHARS characters. flush() sends the buffered events and a
+trace_summary event with the event counts, span duration histograms and the time
+spent tracing on the caller's side.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from langfuse.client import StatefulTraceClient
+
+from services.langfuse import langfuse
+from utils.config import config
+from utils.logger import logger
+
+EVENT_SAMPLES_PER_NAME = 3
+FLUSH_BATCH_SIZE = 50
+PREVIEW_CHARS = 200
+AGGREGATED_LEVELS = ("DEFAULT", "DEBUG")
+# Upper bounds in ms of the span duration histogram buckets
+DURATION_BUCKETS_MS = (10, 100, 1000, 10000, 60000)
+
+
+def truncate_payload(value: Any, max_chars: int) -> Any:
+    """Replace a payload longer than max_chars by its hash, length and a preview."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) <= max_chars:
+        return value
+    return {
+        "sha256": hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest(),
+        "length": len(text),
+        "preview": text[:PREVIEW_CHARS],
+    }
+
+
+def _truncate_text(text: Optional[str], max_chars: int) -> Optional[str]:
+    if text is None or len(text) <= max_chars:
+        return text
+    digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+    return f"{text[:PREVIEW_CHARS]}... [truncated, length={len(text)}, sha256={digest}]"
+
+
+def _duration_bucket(duration_ms: float) -> str:
+    for bound in DURATION_BUCKETS_MS:
+        if duration_ms <= bound:
+            return f"<={bound}ms"
+    return f">{DURATION_BUCKETS_MS[-1]}ms"
+
+
+class _Observation:
+    """Span or generation of a RunTrace, recording its duration when it ends."""
+
+    def __init__(self, trace: "RunTrace", name: str, observation: Any, truncate: bool = True):
+        self._trace = trace
+        self._name = name
+        self._observation = observation
+        self._truncate = truncate
+        self._started = time.monotonic()
+
+    def update(self, **kwargs: Any) -> "_Observation":
+        self._observation.update(**self._kwargs(kwargs))
+        return self
+
+    def end(self, **kwargs: Any) -> "_Observation":
+        self._trace._record_duration(self._name, (time.monotonic() - self._started) * 1000)
+        self._observation.end(**self._kwargs(kwargs))
+        return self
+
+    def _kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return self._trace._truncate_kwargs(kwargs) if self._truncate else kwargs
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._observation, name)
+
+
+class RunTrace:
+    """Langfuse trace of a run that buffers, aggregates and truncates what it sends.
+
+    Args:
+        trace: The Langfuse trace to send to.
+        event_budget: Events sent before only warnings and errors are, None for config.TRACE_EVENT_BUDGET.
+        max_payload_chars: Longest payload sent as is, None for config.TRACE_MAX_PAYLOAD_CHARS.
+    """
+
+    def __init__(self, trace: StatefulTraceClient, event_budget: Optional[int] = None,
+                 max_payload_chars: Optional[int] = None):
+        self._trace = trace
+        self.event_budget = config.TRACE_EVENT_BUDGET if event_budget is None else event_budget
+        self.max_payload_chars = config.TRACE_MAX_PAYLOAD_CHARS if max_payload_chars is None else max_payload_chars
+        self.counts: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.durations: Dict[str, Counter] = defaultdict(Counter)
+        self.sent = 0
+        self.overhead_seconds = 0.0  # Spent in event() on the caller's side
+        self._buffer: List[Dict[str, Any]] = []
+
+    def event(self, name: str, level: str = "DEFAULT", status_message: Optional[str] = None,
+              metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        """Record an event, sending it with the next batch if it is within the budget."""
+        started = time.perf_counter()
+        self.counts[name] += 1
+        if level in AGGREGATED_LEVELS and (self.counts[name] > EVENT_SAMPLES_PER_NAME or self.sent >= self.event_budget):
+            self.dropped[name] += 1
+        else:
+            self.sent += 1
+            event = {"name": name, "level": level, "start_time": datetime.now(timezone.utc), **kwargs}
+            if status_message is not None:
+                event["status_message"] = _truncate_text(status_message, self.max_payload_chars)
+            if metadata is not None:
+                event["metadata"] = {key: truncate_payload(value, self.max_payload_chars) for key, value in metadata.items()}
+            self._buffer.append(event)
+            if len(self._buffer) >= FLUSH_BATCH_SIZE:
+                self._send_batch()
+        self.overhead_seconds += time.perf_counter() - started
+
+    def span(self, name: str, **kwargs: Any) -> _Observation:
+        return _Observation(self, name, self._trace.span(name=name, **self._truncate_kwargs(kwargs)))
+
+    def generation(self, name: str, **kwargs: Any) -> _Observation:
+        # The prompt and completion of a generation are what it is traced for, so they are kept whole
+        return _Observation(self, name, self._trace.generation(name=name, **kwargs), truncate=False)
+
+    def update(self, **kwargs: Any) -> "RunTrace":
+        self._trace.update(**self._truncate_kwargs(kwargs))
+        return self
+
+    def flush(self) -> None:
+        """Send the buffered events and a summary of everything recorded so far."""
+        self._buffer.append({
+            "name": "trace_summary",
+            "level": "DEFAULT",
+            "start_time": datetime.now(timezone.utc),
+            "metadata": {
+                "event_counts": dict(self.counts),
+                "dropped_events": dict(self.dropped),
+                "span_duration_histograms": {name: dict(buckets) for name, buckets in self.durations.items()},
+                "sent_events": self.sent,
+                "tracing_overhead_ms": round(self.overhead_seconds * 1000, 2),
+            },
+        })
+        self._send_batch()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._trace, name)
+
+    def _send_batch(self) -> None:
+        batch, self._buffer = self._buffer, []
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._send, batch)
+        except RuntimeError:
+            # No event loop in this thread, send in place
+            self._send(batch)
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        for event in batch:
+            try:
+                self._trace.event(**event)
+            except Exception as e:
+                logger.warning(f"Failed to send trace event {event['name']}: {str(e)}")
+
+    def _truncate_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        for key in ("input", "output", "metadata"):
+            if key in kwargs:
+                kwargs[key] = truncate_payload(kwargs[key], self.max_payload_chars)
+        if isinstance(kwargs.get("status_message"), str):
+            kwargs["status_message"] = _truncate_text(kwargs["status_message"], self.max_payload_chars)
+        return kwargs
+
+    def _record_duration(self, name: str, duration_ms: float) -> None:
+        self.durations[name][_duration_bucket(duration_ms)] += 1
+
+
+def trace_run(**kwargs: Any) -> RunTrace:
+    """Start a buffered Langfuse trace, taking the arguments of Langfuse.trace()."""
+    return RunTrace(langfuse.trace(**kwargs))
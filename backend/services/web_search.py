@@ -0,0 +1,201 @@
+"""
+Tavily web search with a shared result cache.
+
+Search results are cached in Redis under web_search:{hash of the normalized query and
+search parameters} for config.WEB_SEARCH_CACHE_TTL, so the same search from another
+iteration or run is served without calling Tavily. Queries are normalized by case,
+whitespace and surrounding punctuation.
+
+Concurrent identical searches share one Tavily request: within a process through a
+shared task, across processes through a short Redis lock whose holder searches while
+the others wait for its result to be cached.
+
+Searches go to config.TAVILY_URL, which can point at a local fake of the Tavily API
+(python -m tests.fakes tavily <port>).
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional
+
+import httpx
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REQUEST_TIMEOUT = 60
+LOCK_TTL = REQUEST_TIMEOUT + 5
+LOCK_POLL_INTERVAL = 0.2
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so near-identical searches share a cache entry."""
+    return " ".join(query.lower().split()).strip(" .,;:!?\"'")
+
+
+@dataclass
+class WebSearchMetrics:
+    """Counters of the searches of this process."""
+    searches: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    coalesced: int = 0  # Searches that waited for an identical search instead of calling Tavily
+    errors: int = 0
+    upstream_requests: int = 0
+    upstream_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        stats["hit_rate"] = round(self.cache_hits / self.searches, 3) if self.searches else 0.0
+        stats["avg_upstream_latency_ms"] = round(self.upstream_seconds / self.upstream_requests * 1000, 1) if self.upstream_requests else 0.0
+        return stats
+
+
+class WebSearch:
+    """Searches the web through Tavily, caching and coalescing identical searches.
+
+    Args:
+        api_key: Tavily API key.
+        base_url: Tavily API URL.
+        cache_ttl: Seconds a search result is served from the cache.
+    """
+
+    def __init__(self, api_key: str, base_url: str, cache_ttl: int):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.cache_ttl = cache_ttl
+        self.metrics = WebSearchMetrics()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(REQUEST_TIMEOUT),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._client
+
+    async def search(self, query: str, **params: Any) -> Dict[str, Any]:
+        """Search the web.
+
+        Args:
+            query: The search query.
+            **params: Tavily search parameters, e.g. max_results or search_depth.
+
+        Returns:
+            The Tavily search response.
+        """
+        self.metrics.searches += 1
+        key = self._cache_key(query, params)
+
+        cached = await self._load(key)
+        if cached is not None:
+            self.metrics.cache_hits += 1
+            logger.debug(f"Serving web search '{query}' from cache")
+            return cached
+        self.metrics.cache_misses += 1
+
+        if key in self._inflight:
+            self.metrics.coalesced += 1
+        else:
+            task = asyncio.create_task(self._search_once(key, query, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda task: self._inflight.pop(key, None))
+        try:
+            return await asyncio.shield(self._inflight[key])
+        except Exception:
+            self.metrics.errors += 1
+            raise
+
+    async def _search_once(self, key: str, query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        lock_key = f"{key}:lock"
+        try:
+            has_lock = await redis.set(lock_key, "1", nx=True, ex=LOCK_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to lock web search, searching without coalescing: {str(e)}")
+            has_lock = True
+
+        if not has_lock:
+            # Another process runs the same search, use its result once cached
+            result = await self._wait_for_result(key, lock_key)
+            if result is not None:
+                self.metrics.coalesced += 1
+                return result
+            return await self._request(key, query, params)
+
+        try:
+            return await self._request(key, query, params)
+        finally:
+            try:
+                await redis.delete(lock_key)
+            except Exception:
+                pass
+
+    async def _wait_for_result(self, key: str, lock_key: str) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + LOCK_TTL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            cached = await self._load(key)
+            if cached is not None:
+                return cached
+            try:
+                if not await redis.get(lock_key):
+                    # The search failed or its result could not be cached
+                    return None
+            except Exception:
+                return None
+        return None
+
+    async def _request(self, key: str, query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            response = await self._get_client().post(f"{self.base_url}/search", json={"query": query, **params})
+            response.raise_for_status()
+            result = response.json()
+        finally:
+            self.metrics.upstream_requests += 1
+            self.metrics.upstream_seconds += time.monotonic() - started
+        logger.info(f"Web search '{query}' took {time.monotonic() - started:.2f}s")
+
+        if result.get('results') or (result.get('answer') or '').strip():
+            # Empty results are not cached, the next search tries again
+            await self._store(key, result)
+        return result
+
+    def _cache_key(self, query: str, params: Dict[str, Any]) -> str:
+        search = json.dumps({"query": normalize_query(query), **params}, sort_keys=True, default=str)
+        return f"web_search:{hashlib.sha256(search.encode()).hexdigest()}"
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await redis.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read cached web search: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _store(self, key: str, result: Dict[str, Any]) -> None:
+        try:
+            await redis.set(key, json.dumps(result, ensure_ascii=False), ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache web search: {str(e)}")
+
+
+_web_search: Optional[WebSearch] = None
+
+
+def get_web_search() -> WebSearch:
+    """Get the process-wide web search."""
+    global _web_search
+    if _web_search is None:
+        _web_search = WebSearch(
+            api_key=config.TAVILY_API_KEY,
+            base_url=config.TAVILY_URL or "https://api.tavily.com",
+            cache_ttl=config.WEB_SEARCH_CACHE_TTL,
+        )
+    return _web_search
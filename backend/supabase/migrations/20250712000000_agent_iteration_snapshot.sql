@@ -0,0 +1,69 @@
+BEGIN;
+
+-- Latest message of a given type in a thread
+CREATE INDEX IF NOT EXISTS idx_messages_thread_type_created_at ON messages(thread_id, type, created_at DESC);
+
+-- Thread state the agent loop needs before each LLM call, in one round trip.
+-- The browser state content is left out when it is the one the caller already has.
+CREATE OR REPLACE FUNCTION get_agent_iteration_snapshot(
+    p_thread_id UUID,
+    p_known_browser_state_id UUID DEFAULT NULL,
+    p_include_latest_user_message BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    latest_message_type TEXT;
+    browser_state_id UUID;
+    browser_state_content JSONB;
+    image_context_id UUID;
+    image_context_content JSONB;
+    latest_user_message_content JSONB;
+BEGIN
+    SELECT type INTO latest_message_type
+    FROM messages
+    WHERE thread_id = p_thread_id AND type IN ('assistant', 'tool', 'user')
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    SELECT message_id, CASE WHEN message_id = p_known_browser_state_id THEN NULL ELSE content END
+    INTO browser_state_id, browser_state_content
+    FROM messages
+    WHERE thread_id = p_thread_id AND type = 'browser_state'
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    SELECT message_id, content INTO image_context_id, image_context_content
+    FROM messages
+    WHERE thread_id = p_thread_id AND type = 'image_context'
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF p_include_latest_user_message THEN
+        SELECT content INTO latest_user_message_content
+        FROM messages
+        WHERE thread_id = p_thread_id AND type = 'user'
+        ORDER BY created_at DESC
+        LIMIT 1;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'latest_message_type', latest_message_type,
+        'browser_state', CASE WHEN browser_state_id IS NULL THEN NULL ELSE jsonb_build_object(
+            'message_id', browser_state_id,
+            'content', browser_state_content
+        ) END,
+        'image_context', CASE WHEN image_context_id IS NULL THEN NULL ELSE jsonb_build_object(
+            'message_id', image_context_id,
+            'content', image_context_content
+        ) END,
+        'latest_user_message', latest_user_message_content
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_agent_iteration_snapshot TO service_role;
+
+COMMIT;
@@ -0,0 +1,9 @@
+BEGIN;
+
+-- Pointer to and summary of the response journal of an agent run. The streamed
+-- responses themselves are kept in the journal instead of agent_runs.responses.
+ALTER TABLE agent_runs ADD COLUMN IF NOT EXISTS response_journal JSONB;
+
+COMMENT ON COLUMN agent_runs.response_journal IS 'Location (key) and summary (response_count, event_count, last_status, complete) of the journal of streamed responses for this agent run';
+
+COMMIT;
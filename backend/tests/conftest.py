@@ -0,0 +1,16 @@
+import pytest
+
+from tests.fakes import FakeRedis, set_test_settings
+
+set_test_settings()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Serve services.redis from a FakeRedis."""
+    from services import redis
+
+    fake = FakeRedis()
+    monkeypatch.setattr(redis, "client", fake)
+    monkeypatch.setattr(redis, "_initialized", True)
+    return fake
@@ -0,0 +1,466 @@
+"""
+In-memory stand-ins for the services the backend talks to, for tests and benchmarks.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+# Settings utils.config requires, so modules import without a .env
+REQUIRED_SETTINGS = (
+    "SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "REDIS_HOST",
+    "DAYTONA_API_KEY", "DAYTONA_SERVER_URL", "DAYTONA_TARGET", "TAVILY_API_KEY",
+    "RAPID_API_KEY", "FIRECRAWL_API_KEY",
+)
+
+
+def set_test_settings() -> None:
+    """Give the required settings placeholder values unless they are set already."""
+    for name in REQUIRED_SETTINGS:
+        os.environ.setdefault(name, "test")
+
+
+class FakeRedis:
+    """The subset of the redis.asyncio client the backend uses, kept in memory.
+
+    Expiry is checked on access against time.monotonic(). Commands that fail with
+    the error set in fail_with raise it instead, to exercise Redis outages.
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.calls: List[str] = []
+        self.fail_with: Optional[Exception] = None
+        self.scripts: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+    def _touch(self, command: str, key: Optional[str] = None) -> None:
+        self.calls.append(command)
+        if self.fail_with is not None:
+            raise self.fail_with
+        if key is not None and key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    async def get(self, key: str) -> Optional[str]:
+        self._touch("get", key)
+        value = self.data.get(key)
+        return value if value is None or isinstance(value, str) else str(value)
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        self._touch("set", key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, str) else str(value)
+        if ex:
+            self.expires[key] = time.monotonic() + ex
+        else:
+            self.expires.pop(key, None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            self._touch("delete", key)
+            if self.data.pop(key, None) is not None:
+                deleted += 1
+            self.expires.pop(key, None)
+        return deleted
+
+    async def exists(self, *keys: str) -> int:
+        for key in keys:
+            self._touch("exists", key)
+        return sum(1 for key in keys if key in self.data)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        self._touch("expire", key)
+        if key not in self.data:
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        self._touch("hgetall", key)
+        return {field: str(value) for field, value in self.data.get(key, {}).items()}
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        self._touch("hget", key)
+        value = self.data.get(key, {}).get(field)
+        return None if value is None else str(value)
+
+    async def hset(self, key: str, field: Optional[str] = None, value: Any = None,
+                   mapping: Optional[Dict[str, Any]] = None) -> int:
+        self._touch("hset", key)
+        entries = dict(mapping or {})
+        if field is not None:
+            entries[field] = value
+        hash_ = self.data.setdefault(key, {})
+        added = sum(1 for name in entries if name not in hash_)
+        hash_.update({name: str(item) for name, item in entries.items()})
+        return added
+
+    async def hincrbyfloat(self, key: str, field: str, amount: float) -> float:
+        self._touch("hincrbyfloat", key)
+        hash_ = self.data.setdefault(key, {})
+        hash_[field] = str(float(hash_.get(field, 0)) + float(amount))
+        return float(hash_[field])
+
+    def register_script(self, script: str, implementation: Callable[..., Awaitable[Any]]) -> None:
+        """Have eval run a Python implementation of a Lua script.
+
+        The implementation is called with this FakeRedis, the keys and the arguments.
+        """
+        self.scripts[script] = implementation
+
+    async def eval(self, script: str, numkeys: int, *args: Any) -> Any:
+        self._touch("eval")
+        implementation = self.scripts.get(script)
+        assert implementation is not None, (
+            f"FakeRedis can't run Lua, register an implementation of this script with register_script(): {script.strip()[:80]!r}"
+        )
+        return await implementation(self, list(args[:numkeys]), list(args[numkeys:]))
+
+    async def rpush(self, key: str, *values: Any) -> int:
+        self._touch("rpush", key)
+        items = self.data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    async def lpop(self, key: str) -> Optional[Any]:
+        self._touch("lpop", key)
+        items = self.data.get(key)
+        return items.pop(0) if items else None
+
+    async def llen(self, key: str) -> int:
+        self._touch("llen", key)
+        return len(self.data.get(key, []))
+
+    async def lrem(self, key: str, count: int, value: Any) -> int:
+        """Remove the first count occurrences of value (count > 0 only)."""
+        self._touch("lrem", key)
+        items = self.data.get(key, [])
+        removed = 0
+        while removed < count and value in items:
+            items.remove(value)
+            removed += 1
+        return removed
+
+    async def lrange(self, key: str, start: int, end: int) -> List[Any]:
+        self._touch("lrange", key)
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def publish(self, channel: str, message: str) -> int:
+        self._touch("publish")
+        return 0
+
+    async def keys(self, pattern: str) -> List[str]:
+        self._touch("keys")
+        return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+
+class _FakeResult:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class _FakeQuery:
+    """Select query over the rows of a FakeSupabase table.
+
+    select(count='exact') counts the matching rows before limit() and range().
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], count: Optional[int] = None, counting: bool = False):
+        self._rows = rows
+        self._count = count
+        self._counting = counting
+
+    def _filtered(self, rows: List[Dict[str, Any]]) -> "_FakeQuery":
+        return _FakeQuery(rows, counting=self._counting)
+
+    def _sliced(self, rows: List[Dict[str, Any]]) -> "_FakeQuery":
+        return _FakeQuery(rows, count=len(self._rows) if self._count is None else self._count, counting=self._counting)
+
+    def select(self, *columns: str, count: Optional[str] = None) -> "_FakeQuery":
+        return _FakeQuery(self._rows, counting=count is not None)
+
+    def eq(self, column: str, value: Any) -> "_FakeQuery":
+        return self._filtered([row for row in self._rows if row.get(column) == value])
+
+    def gte(self, column: str, value: Any) -> "_FakeQuery":
+        return self._filtered([row for row in self._rows if row.get(column) >= value])
+
+    def order(self, column: str, desc: bool = False) -> "_FakeQuery":
+        return self._filtered(sorted(self._rows, key=lambda row: row.get(column), reverse=desc))
+
+    def limit(self, count: int) -> "_FakeQuery":
+        return self._sliced(self._rows[:count])
+
+    def range(self, start: int, end: int) -> "_FakeQuery":
+        return self._sliced(self._rows[start:end + 1])
+
+    async def execute(self) -> _FakeResult:
+        count = None
+        if self._counting:
+            count = len(self._rows) if self._count is None else self._count
+        return _FakeResult([dict(row) for row in self._rows], count)
+
+
+class FakeSupabase:
+    """Supabase client answering select queries from in-memory tables.
+
+    Rows are compared as stored, so timestamps should be ISO strings of one format.
+
+    Args:
+        tables: Rows of each table by name, schemas ignored.
+    """
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.tables = tables or {}
+
+    def schema(self, name: str) -> "FakeSupabase":
+        return self
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self.tables.setdefault(name, []))
+
+    from_ = table
+
+
+class FakeDBConnection:
+    """DBConnection whose client is a FakeSupabase."""
+
+    def __init__(self, client: FakeSupabase):
+        self._client = client
+
+    @property
+    async def client(self) -> FakeSupabase:
+        return self._client
+
+
+class FakeStripe:
+    """The part of the stripe module used to read subscriptions, without network.
+
+    Args:
+        subscriptions: Subscriptions of each customer ID, as Stripe returns them.
+    """
+
+    def __init__(self, subscriptions: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.subscriptions = subscriptions or {}
+        self.list_calls: List[str] = []
+        fake = self
+
+        class Subscription:
+            @staticmethod
+            def list(customer: str, status: str = "active", **kwargs: Any) -> Dict[str, Any]:
+                fake.list_calls.append(customer)
+                return {"data": [sub for sub in fake.subscriptions.get(customer, []) if sub.get("status", "active") == status]}
+
+            @staticmethod
+            def modify(subscription_id: str, **kwargs: Any) -> Dict[str, Any]:
+                return {"id": subscription_id, **kwargs}
+
+        self.Subscription = Subscription
+
+    @staticmethod
+    def subscription(subscription_id: str, price_id: str, created: int = 0) -> Dict[str, Any]:
+        """A subscription with a single item of the given price."""
+        return {
+            "id": subscription_id,
+            "status": "active",
+            "created": created,
+            "items": {"data": [{"price": {"id": price_id}}]},
+        }
+
+
+class FakeLangfuseObservation:
+    """Span or generation of a FakeLangfuseTrace."""
+
+    def __init__(self, trace: "FakeLangfuseTrace", kind: str, kwargs: Dict[str, Any]):
+        self.trace = trace
+        self.kind = kind
+        self.kwargs = kwargs
+        self.ended: Optional[Dict[str, Any]] = None
+
+    def update(self, **kwargs: Any) -> "FakeLangfuseObservation":
+        self.trace._serialize(kwargs)
+        self.kwargs.update(kwargs)
+        return self
+
+    def end(self, **kwargs: Any) -> "FakeLangfuseObservation":
+        self.trace._serialize(kwargs)
+        self.ended = kwargs
+        return self
+
+
+class FakeLangfuseTrace:
+    """A Langfuse trace that keeps what it is sent.
+
+    Like the Langfuse client, every call serializes its arguments on the calling thread.
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.observations: List[FakeLangfuseObservation] = []
+        self.updates: List[Dict[str, Any]] = []
+
+    def _serialize(self, kwargs: Dict[str, Any]) -> None:
+        json.dumps(kwargs, default=str)
+
+    def event(self, **kwargs: Any) -> None:
+        self._serialize(kwargs)
+        self.events.append(kwargs)
+
+    def span(self, **kwargs: Any) -> FakeLangfuseObservation:
+        self._serialize(kwargs)
+        observation = FakeLangfuseObservation(self, "span", kwargs)
+        self.observations.append(observation)
+        return observation
+
+    def generation(self, **kwargs: Any) -> FakeLangfuseObservation:
+        self._serialize(kwargs)
+        observation = FakeLangfuseObservation(self, "generation", kwargs)
+        self.observations.append(observation)
+        return observation
+
+    def update(self, **kwargs: Any) -> "FakeLangfuseTrace":
+        self._serialize(kwargs)
+        self.updates.append(kwargs)
+        return self
+
+
+class FakeHTTPService:
+    """Base of the fakes of HTTP APIs, answering JSON requests from handle().
+
+    The fake is mounted in an httpx client through transport(), or served on a local
+    port through serve() for code that only takes a base URL. Every request is kept in
+    requests as (method, path, body); delay is added to each response.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests: List[Tuple[str, str, Any]] = []
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+    def _respond(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        self.requests.append((method, path, body))
+        return self.handle(method, path, query, body)
+
+    def transport(self):
+        """An httpx transport that answers from this fake."""
+        import httpx
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            body = json.loads(request.content) if request.content else None
+            status, payload = self._respond(request.method, request.url.path, dict(request.url.params), body)
+            return httpx.Response(status, json=payload)
+
+        return httpx.MockTransport(handler)
+
+    def serve(self, port: int = 0) -> Tuple[str, ThreadingHTTPServer]:
+        """Serve this fake on a local port from a background thread.
+
+        Returns:
+            The base URL and the server, to shut down when done.
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                url = urlsplit(self.path)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                status, payload = fake._respond(self.command, url.path, dict(parse_qsl(url.query)), body)
+                content = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = _dispatch
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+class FakeTavily(FakeHTTPService):
+    """The Tavily search API, answering POST /search.
+
+    Args:
+        results: Results of each query; other queries get a generic result.
+            A query mapped to an empty list gets no results.
+        delay: Seconds each search takes.
+    """
+
+    def __init__(self, results: Optional[Dict[str, List[Dict[str, Any]]]] = None, delay: float = 0.0):
+        super().__init__(delay)
+        self.results = results or {}
+
+    @property
+    def searches(self) -> List[str]:
+        return [body["query"] for method, path, body in self.requests if path == "/search"]
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        if method != "POST" or path != "/search":
+            return 404, {"detail": "Not found"}
+        search_query = body["query"]
+        results = self.results.get(search_query)
+        if results is None:
+            results = [{"title": f"Result for {search_query}", "url": "https://example.com/", "content": search_query}]
+        return 200, {"query": search_query, "answer": "", "results": results[:body.get("max_results", 5)]}
+
+
+class FakeRapidAPI(FakeHTTPService):
+    """RapidAPI provider hosts, answering any route.
+
+    Args:
+        responses: Response of each route; other routes echo the request.
+        failures: Status codes the next requests fail with, in order, e.g. [429, 503].
+        delay: Seconds each request takes.
+    """
+
+    def __init__(self, responses: Optional[Dict[str, Any]] = None, failures: Optional[List[int]] = None,
+                 delay: float = 0.0):
+        super().__init__(delay)
+        self.responses = responses or {}
+        self.failures = list(failures or [])
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, Any]:
+        if self.failures:
+            status = self.failures.pop(0)
+            return status, {"message": f"Fake failure {status}"}
+        if path in self.responses:
+            return 200, self.responses[path]
+        return 200, {"method": method, "route": path, "params": body if method == "POST" else query}
+
+
+if __name__ == "__main__":
+    # Serve a fake for local runs, e.g. python -m tests.fakes tavily 8765 with TAVILY_URL=http://127.0.0.1:8765,
+    # or python -m tests.fakes rapidapi 8766 with RAPID_API_BASE_URL=http://127.0.0.1:8766
+    import sys
+
+    fakes = {"tavily": FakeTavily, "rapidapi": FakeRapidAPI}
+    base_url, server = fakes[sys.argv[1]]().serve(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print(f"Serving a fake {sys.argv[1]} API at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,30 @@
+"""
+Stand-in MCP server for the session pool tests, run over stdio.
+
+Each process answers with its own pid, so tests can tell whether two calls went
+through the same session.
+"""
+
+import asyncio
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+server = FastMCP("stub")
+
+
+@server.tool()
+def pid() -> int:
+    """Return the pid of the server process."""
+    return os.getpid()
+
+
+@server.tool()
+async def sleep(seconds: float) -> int:
+    """Sleep, then return the pid of the server process."""
+    await asyncio.sleep(seconds)
+    return os.getpid()
+
+
+if __name__ == "__main__":
+    server.run()
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from services import billing
+
+
+@pytest.fixture
+def rescans(monkeypatch):
+    """Count full rescans of monthly usage, each taking a moment and finding 42.0."""
+    calls = []
+
+    async def calculate_monthly_usage(client, user_id):
+        calls.append(user_id)
+        await asyncio.sleep(0.05)
+        return 42.0
+
+    monkeypatch.setattr(billing, "calculate_monthly_usage", calculate_monthly_usage)
+    monkeypatch.setattr(billing, "USAGE_LEDGER_REBUILD_POLL_INTERVAL", 0.01)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_missing_ledger_is_rebuilt_once_for_concurrent_checks(fake_redis, rescans):
+    totals = await asyncio.gather(*(billing.get_monthly_usage(None, "user-1") for _ in range(20)))
+
+    assert totals == [42.0] * 20
+    assert rescans == ["user-1"]
+    assert (await fake_redis.hgetall(billing._usage_ledger_key("user-1")))["total"] == "42.0"
+
+
+@pytest.mark.asyncio
+async def test_existing_ledger_is_read_without_rescan(fake_redis, rescans):
+    await billing.reconcile_monthly_usage(None, "user-1")
+    rescans.clear()
+
+    assert await billing.get_monthly_usage(None, "user-1") == 42.0
+    assert rescans == []
+
+
+@pytest.mark.asyncio
+async def test_waits_for_the_rebuild_of_another_worker(fake_redis, rescans):
+    key = billing._usage_ledger_key("user-1")
+    await fake_redis.set(f"{key}:rebuild_lock", "1", nx=True)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        await fake_redis.hset(key, mapping={"total": 7.5, "reconciled_at": 0})
+        await fake_redis.delete(f"{key}:rebuild_lock")
+
+    worker = asyncio.create_task(other_worker())
+    assert await billing.get_monthly_usage(None, "user-1") == 7.5
+    await worker
+    assert rescans == []
+
+
+@pytest.mark.asyncio
+async def test_rescans_when_the_other_worker_fails(fake_redis, rescans):
+    key = billing._usage_ledger_key("user-1")
+    await fake_redis.set(f"{key}:rebuild_lock", "1", ex=1, nx=True)
+
+    async def failing_worker():
+        await asyncio.sleep(0.05)
+        await fake_redis.delete(f"{key}:rebuild_lock")
+
+    worker = asyncio.create_task(failing_worker())
+    assert await billing.get_monthly_usage(None, "user-1") == 42.0
+    await worker
+    assert rescans == ["user-1"]
+
+
+@pytest.fixture
+def ledger_increments(fake_redis, monkeypatch):
+    """Run the ledger increment script on the fake, and bill every response 1.5."""
+    async def increment_if_exists(redis, keys, args):
+        if not await redis.exists(keys[0]):
+            return None
+        return await redis.hincrbyfloat(keys[0], "total", args[0])
+
+    fake_redis.register_script(billing._USAGE_LEDGER_INCR_SCRIPT, increment_if_exists)
+    monkeypatch.setattr(billing.config, "ENV_MODE", billing.EnvMode.PRODUCTION)
+    monkeypatch.setattr(billing, "calculate_token_cost", lambda prompt_tokens, completion_tokens, model: 1.5)
+    monkeypatch.setitem(billing._ledger_thread_cache, "thread-1", ("user-1", billing.datetime.now(billing.timezone.utc)))
+
+
+RESPONSE_END = {"model": "gpt-4o", "usage": {"prompt_tokens": 100, "completion_tokens": 50}}
+
+
+@pytest.mark.asyncio
+async def test_usage_is_added_to_an_existing_ledger(fake_redis, ledger_increments):
+    key = billing._usage_ledger_key("user-1")
+    await fake_redis.hset(key, mapping={"total": 10.0, "reconciled_at": 0})
+
+    await billing.record_usage(None, "thread-1", RESPONSE_END)
+
+    assert float((await fake_redis.hgetall(key))["total"]) == 11.5
+
+
+@pytest.mark.asyncio
+async def test_usage_is_not_recorded_without_a_ledger(fake_redis, ledger_increments):
+    await billing.record_usage(None, "thread-1", RESPONSE_END)
+
+    assert not await fake_redis.exists(billing._usage_ledger_key("user-1"))
@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from agentpress import compression_service
+from agentpress.compression_service import CompressionResult, CompressionService
+
+MESSAGES = [{"role": "user", "content": "hello " * 100}]
+
+
+class BrokenPool(Executor):
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def in_process_calls(monkeypatch):
+    calls = []
+
+    def compress(context_manager, messages, llm_model):
+        calls.append(messages)
+        return CompressionResult(messages[-1:], 10, 5)
+
+    monkeypatch.setattr(compression_service, "_compress", compress)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_worker_result_is_returned(monkeypatch, in_process_calls):
+    monkeypatch.setattr(compression_service, "_compress_in_worker",
+                        lambda messages, model: (CompressionResult(messages, 7, 7), time.time(), time.time()))
+    service = CompressionService(workers=1, timeout=5)
+    service._pool = ThreadPoolExecutor(1)
+
+    result = await service.compress(MESSAGES, "gpt-4o")
+
+    assert result.token_count == 7
+    assert service.metrics.pool_calls == 1
+    assert in_process_calls == []
+    service.shutdown()
+
+
+@pytest.fixture
+def slow_pool_service(monkeypatch):
+    """A service whose worker takes longer than its timeout."""
+    def slow(messages, model):
+        time.sleep(0.5)
+        return CompressionResult(messages, 7, 7), time.time(), time.time()
+
+    monkeypatch.setattr(compression_service, "_compress_in_worker", slow)
+    service = CompressionService(workers=1, timeout=0.05)
+    service._pool = ThreadPoolExecutor(1)
+    yield service
+    service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_timeout_omits_messages_by_estimate_without_redoing_the_work(slow_pool_service, in_process_calls):
+    long_thread = [{"role": "system", "content": "system prompt"}] + [
+        {"role": "user", "content": f"{i} " + "x" * 4000} for i in range(40)
+    ]
+
+    result = await slow_pool_service.compress(long_thread, "some-model")
+
+    max_tokens = slow_pool_service._context_manager.get_model_max_tokens("some-model")
+    assert result.token_count > max_tokens >= result.compressed_token_count
+    assert result.messages[0] == long_thread[0]
+    assert result.messages[1] == long_thread[1]
+    assert result.messages[-1] == long_thread[-1]
+    assert len(result.messages) < len(long_thread)
+    assert slow_pool_service.metrics.timeouts == 1
+    assert slow_pool_service.metrics.fallbacks == 0
+    assert in_process_calls == []
+
+
+@pytest.mark.asyncio
+async def test_timeout_keeps_messages_that_fit(slow_pool_service, in_process_calls):
+    result = await slow_pool_service.compress(MESSAGES, "gpt-4o")
+
+    assert result.messages == MESSAGES
+    assert result.token_count == result.compressed_token_count > 100
+    assert in_process_calls == []
+
+
+@pytest.mark.asyncio
+async def test_broken_pool_is_shut_down_and_the_work_runs_in_process(in_process_calls):
+    service = CompressionService(workers=1, timeout=5)
+    broken = service._pool = BrokenPool()
+
+    result = await service.compress(MESSAGES, "gpt-4o")
+
+    assert result.compressed_token_count == 5
+    assert broken.shut_down
+    assert service._pool is None
+    assert service.metrics.fallbacks == 1
+    assert in_process_calls == [MESSAGES]
@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import re
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from sandbox import file_transfer
+from sandbox.file_transfer import (
+    RangeNotSatisfiable, SmallFileCache, format_http_date, is_not_modified, parse_range, stream_file
+)
+
+CONTENT = bytes(range(256)) * 4
+
+
+class FakeSandbox:
+    """Serves the dd reads of stream_file from CONTENT, recording reads in flight and cancelled."""
+
+    def __init__(self, content=CONTENT, fail_at=None):
+        self.content = content
+        self.fail_at = fail_at
+        self.reads = []
+        self.running = 0
+        self.peak = 0
+        self.cancelled = 0
+        self.process = SimpleNamespace(exec=self.exec)
+
+    async def exec(self, command, timeout=None):
+        skip, count = (int(value) for value in re.search(r"skip=(\d+) count=(\d+)", command).groups())
+        self.reads.append(skip)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+        if skip == self.fail_at:
+            return SimpleNamespace(exit_code=1, result="dd: read error")
+        return SimpleNamespace(exit_code=0, result=base64.b64encode(self.content[skip:skip + count]).decode())
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-100", (924, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5-4", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1024)
+
+
+def test_is_not_modified():
+    modified = datetime(2024, 5, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+    assert is_not_modified('"a"', modified, '"b", "a"', None)
+    assert is_not_modified('"a"', modified, "*", None)
+    assert not is_not_modified('"a"', modified, '"b"', format_http_date(modified))
+    assert is_not_modified('"a"', modified, None, format_http_date(modified))
+    assert not is_not_modified('"a"', modified, None, "Wed, 01 May 2024 11:59:59 GMT")
+    assert not is_not_modified('"a"', modified, None, "not a date")
+    assert not is_not_modified('"a"', None, None, format_http_date(modified))
+    assert not is_not_modified('"a"', modified, None, None)
+
+
+def test_small_file_cache_serves_only_the_cached_version():
+    cache = SmallFileCache(max_bytes=100)
+    cache.put("sandbox-1", "/todo.md", '"v1"', b"old")
+
+    assert cache.get("sandbox-1", "/todo.md", '"v1"') == b"old"
+    assert cache.get("sandbox-1", "/todo.md", '"v2"') is None
+    assert cache.get("sandbox-2", "/todo.md", '"v1"') is None
+
+    cache.put("sandbox-1", "/todo.md", '"v2"', b"new")
+    assert cache.get("sandbox-1", "/todo.md", '"v1"') is None
+    assert cache.get("sandbox-1", "/todo.md", '"v2"') == b"new"
+
+    cache.invalidate("sandbox-1", "/todo.md")
+    assert cache.get("sandbox-1", "/todo.md", '"v2"') is None
+    assert cache._bytes == 0
+
+
+def test_small_file_cache_evicts_the_least_recently_used():
+    cache = SmallFileCache(max_bytes=100)
+    cache.put("sandbox-1", "/a", '"a"', b"a" * 40)
+    cache.put("sandbox-1", "/b", '"b"', b"b" * 40)
+    cache.get("sandbox-1", "/a", '"a"')
+    cache.put("sandbox-1", "/c", '"c"', b"c" * 40)
+    cache.put("sandbox-1", "/huge", '"h"', b"h" * 101)
+
+    assert cache.get("sandbox-1", "/a", '"a"') == b"a" * 40
+    assert cache.get("sandbox-1", "/b", '"b"') is None
+    assert cache.get("sandbox-1", "/c", '"c"') == b"c" * 40
+    assert cache.get("sandbox-1", "/huge", '"h"') is None
+    assert cache._bytes == 80
+
+
+@pytest.mark.asyncio
+async def test_stream_file_reads_the_next_chunk_while_sending(monkeypatch):
+    monkeypatch.setattr(file_transfer, "READ_CHUNK_SIZE", 100)
+    sandbox = FakeSandbox()
+    received = []
+
+    async for chunk in stream_file(sandbox, "/data.bin", 50, 1023):
+        received.append(chunk)
+        await asyncio.sleep(0)
+        # The next chunk is being read while this one is sent
+        assert sandbox.running == (1 if sum(map(len, received)) < 974 else 0)
+
+    assert b"".join(received) == CONTENT[50:]
+    assert sandbox.reads == list(range(50, 1024, 100))
+    assert sandbox.peak == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_file_stops_at_a_failed_read(monkeypatch):
+    monkeypatch.setattr(file_transfer, "READ_CHUNK_SIZE", 100)
+    sandbox = FakeSandbox(fail_at=200)
+
+    received = [chunk async for chunk in stream_file(sandbox, "/data.bin", 0, 1023)]
+
+    assert b"".join(received) == CONTENT[:200]
+
+
+@pytest.mark.asyncio
+async def test_closing_the_stream_cancels_the_next_read(monkeypatch):
+    monkeypatch.setattr(file_transfer, "READ_CHUNK_SIZE", 100)
+    sandbox = FakeSandbox()
+    stream = stream_file(sandbox, "/data.bin", 0, 1023)
+
+    assert await stream.__anext__() == CONTENT[:100]
+    await asyncio.sleep(0)
+    await stream.aclose()
+    await asyncio.sleep(0.02)
+
+    assert sandbox.reads == [0, 100]
+    assert sandbox.cancelled == 1
@@ -0,0 +1,89 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+
+from mcp_service import session_pool
+from mcp_service.session_pool import MCPServerSpec, MCPSessionPool
+
+STUB_SERVER = str(Path(__file__).with_name("mcp_stub_server.py"))
+
+
+@pytest.fixture
+def spec():
+    return MCPServerSpec(transport="stdio", command=sys.executable, args=[STUB_SERVER])
+
+
+@pytest_asyncio.fixture
+async def pool():
+    pool = MCPSessionPool(max_sessions_per_server=2, idle_ttl=300)
+    yield pool
+    await pool.close_all()
+
+
+def returned_pid(result) -> int:
+    return int(result.content[0].text)
+
+
+@pytest.mark.asyncio
+async def test_sequential_calls_reuse_one_session(pool, spec):
+    first = await pool.call_tool(spec, "pid", {})
+    second = await pool.call_tool(spec, "pid", {})
+
+    assert returned_pid(first) == returned_pid(second)
+    assert len(pool._servers[spec.key].idle) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_open_at_most_max_sessions(pool, spec):
+    results = await asyncio.gather(*(pool.call_tool(spec, "sleep", {"seconds": 0.2}) for _ in range(4)))
+
+    assert len({returned_pid(result) for result in results}) == 2
+    assert len(pool._servers[spec.key].idle) == 2
+
+
+@pytest.mark.asyncio
+async def test_session_closed_when_body_raises(pool, spec):
+    with pytest.raises(RuntimeError):
+        async with pool.session(spec) as session:
+            await session.list_tools()
+            raise RuntimeError("caller failed")
+
+    assert pool._servers[spec.key].idle == []
+
+
+@pytest.mark.asyncio
+async def test_list_tools(pool, spec):
+    tools = await pool.list_tools(spec)
+
+    assert {tool.name for tool in tools} == {"pid", "sleep"}
+
+
+@pytest.mark.asyncio
+async def test_reaper_closes_idle_sessions(monkeypatch, spec):
+    monkeypatch.setattr(session_pool, "REAP_INTERVAL", 0.05)
+    pool = MCPSessionPool(max_sessions_per_server=2, idle_ttl=0)
+    try:
+        await pool.call_tool(spec, "pid", {})
+        pooled = pool._servers[spec.key].idle[0]
+
+        for _ in range(100):
+            if spec.key not in pool._servers:
+                break
+            await asyncio.sleep(0.05)
+
+        assert spec.key not in pool._servers
+        assert not pooled.alive
+    finally:
+        await pool.close_all()
+
+
+@pytest.mark.asyncio
+async def test_unknown_command_fails_to_connect(pool):
+    spec = MCPServerSpec(transport="stdio", command="/nonexistent/mcp-server")
+
+    with pytest.raises(Exception):
+        await pool.call_tool(spec, "pid", {})
+    assert pool._servers[spec.key].idle == []
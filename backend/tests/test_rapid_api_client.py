@@ -0,0 +1,82 @@
+import time
+
+import httpx
+import pytest
+
+from agent.tools.data_providers import RapidApiClient as rapid_api, RapidDataProviderBase
+from agent.tools.data_providers.RapidApiClient import RapidApiClient
+from agent.tools.data_providers.TwitterProvider import TwitterProvider
+from agent.tools.data_providers.YahooFinanceProvider import YahooFinanceProvider
+from tests.fakes import FakeRapidAPI
+
+
+@pytest.fixture
+def rapidapi():
+    return FakeRapidAPI()
+
+
+@pytest.fixture
+def client(fake_redis, rapidapi, monkeypatch):
+    monkeypatch.setattr(rapid_api, "BACKOFF_BASE", 0)
+    instance = RapidApiClient("key", rate_limit=1000, cache_ttl=900, base_url="https://rapidapi.test")
+    instance._client = httpx.AsyncClient(transport=rapidapi.transport())
+    monkeypatch.setattr(RapidDataProviderBase, "get_rapid_api_client", lambda: instance)
+    return instance
+
+
+@pytest.mark.asyncio
+async def test_requests_go_to_the_base_url_with_the_provider_path(client, rapidapi):
+    result = await YahooFinanceProvider().call_endpoint_async("search", {"search": "AAPL"})
+
+    assert result == {"method": "GET", "route": "/api/v1/markets/search", "params": {"search": "AAPL"}}
+
+
+@pytest.mark.asyncio
+async def test_responses_are_cached_for_the_default_ttl(client, rapidapi, fake_redis):
+    provider = YahooFinanceProvider()
+    await provider.call_endpoint_async("search", {"search": "AAPL"})
+    await provider.call_endpoint_async("search", {"search": "AAPL"})
+
+    assert len(rapidapi.requests) == 1
+    key = next(key for key in fake_redis.data if key.startswith("rapid_api:"))
+    assert RapidDataProviderBase.FEED_CACHE_TTL < fake_redis.expires[key] - time.monotonic() <= 900
+
+
+@pytest.mark.asyncio
+async def test_quotes_and_indicators_are_never_cached(client, rapidapi, fake_redis):
+    provider = YahooFinanceProvider()
+    payload = {"symbol": "AAPL", "interval": "5m", "series_type": "close", "time_period": "14"}
+    await provider.call_endpoint_async("get_rsi", payload)
+    await provider.call_endpoint_async("get_rsi", payload)
+
+    assert len(rapidapi.requests) == 2
+    assert not [key for key in fake_redis.data if key.startswith("rapid_api:")]
+
+
+@pytest.mark.asyncio
+async def test_feeds_are_cached_briefly(client, rapidapi, fake_redis):
+    await TwitterProvider().call_endpoint_async("timeline", {"screenname": "python"})
+
+    key = next(key for key in fake_redis.data if key.startswith("rapid_api:"))
+    ttl = fake_redis.expires[key] - time.monotonic()
+    assert 0 < ttl <= RapidDataProviderBase.FEED_CACHE_TTL
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_and_failed_requests_are_retried(client, rapidapi):
+    rapidapi.failures = [429, 503]
+
+    result = await client.call("https://twitter-api45.p.rapidapi.com/tweet.php", "GET", {"id": "1"}, cache_ttl=0)
+
+    assert result["route"] == "/tweet.php"
+    assert len(rapidapi.requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached(client, rapidapi, fake_redis):
+    rapidapi.failures = [500, 500, 500]
+
+    result = await client.call("https://twitter-api45.p.rapidapi.com/tweet.php", "GET", {"id": "1"})
+
+    assert result == {"message": "Fake failure 500"}
+    assert not [key for key in fake_redis.data if key.startswith("rapid_api:")]
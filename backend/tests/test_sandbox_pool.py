@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+from dataclasses import asdict
+
+import pytest
+
+from sandbox.pool import DEFAULT_PROFILE, InMemorySandboxBackend, SandboxPool
+
+POOL_KEY = f"sandbox_pool:{DEFAULT_PROFILE.key}"
+
+
+@pytest.fixture
+def backend():
+    return InMemorySandboxBackend()
+
+
+@pytest.fixture
+def pool(fake_redis, backend):
+    return SandboxPool(backend, size=2, max_idle=600)
+
+
+async def wait_for_refills(pool: SandboxPool) -> None:
+    while pool._refilling:
+        await asyncio.sleep(0.01)
+
+
+async def pooled_ids(fake_redis):
+    return [json.loads(raw)["id"] for raw in await fake_redis.lrange(POOL_KEY, 0, -1)]
+
+
+@pytest.mark.asyncio
+async def test_acquire_from_empty_pool_creates_on_demand_and_refills(pool, backend, fake_redis):
+    sandbox = await pool.acquire("project-1")
+
+    assert backend.sandboxes[sandbox.id] == "project-1"
+    await wait_for_refills(pool)
+    assert len(await pooled_ids(fake_redis)) == 2
+    assert len(backend.created) == 3
+
+
+@pytest.mark.asyncio
+async def test_acquire_claims_a_pooled_sandbox(pool, backend, fake_redis):
+    await pool.refill(DEFAULT_PROFILE)
+    first_pooled = (await pooled_ids(fake_redis))[0]
+
+    sandbox = await pool.acquire("project-1")
+
+    assert sandbox.id == first_pooled
+    assert backend.sandboxes[sandbox.id] == "project-1"
+    await wait_for_refills(pool)
+    assert sandbox.id not in await pooled_ids(fake_redis)
+    assert len(await pooled_ids(fake_redis)) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refills_do_not_overfill(pool, backend, fake_redis):
+    await asyncio.gather(*(pool.refill(DEFAULT_PROFILE) for _ in range(5)))
+
+    assert len(await pooled_ids(fake_redis)) == 2
+    assert len(backend.created) == 2
+
+
+@pytest.mark.asyncio
+async def test_acquire_skips_and_deletes_stale_sandboxes(pool, backend, fake_redis):
+    stale = await backend.create(DEFAULT_PROFILE, "password")
+    stale.created_at = time.time() - 3600
+    await fake_redis.rpush(POOL_KEY, json.dumps(asdict(stale)))
+
+    sandbox = await pool.acquire("project-1")
+    await wait_for_refills(pool)
+    await asyncio.sleep(0)
+
+    assert sandbox.id != stale.id
+    assert stale.id in backend.deleted
+
+
+@pytest.mark.asyncio
+async def test_reap_deletes_only_idle_sandboxes(pool, backend, fake_redis):
+    await pool.refill(DEFAULT_PROFILE)
+    fresh_ids = await pooled_ids(fake_redis)
+    stale = await backend.create(DEFAULT_PROFILE, "password")
+    stale.created_at = time.time() - 3600
+    await fake_redis.rpush(POOL_KEY, json.dumps(asdict(stale)))
+
+    await pool.reap(DEFAULT_PROFILE)
+
+    assert await pooled_ids(fake_redis) == fresh_ids
+    assert backend.deleted == [stale.id]
+    assert stale.id not in backend.sandboxes
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from mcp_service.schema_cache import MCPSchemaCache, get_schema_cache_key
+
+SERVER = {"url": "https://mcp.test", "headers": {"Authorization": "Bearer token"}}
+TOOLS = [{"name": "search", "description": "Search", "input_schema": {"type": "object"}}]
+NEW_TOOLS = [{"name": "fetch", "description": "Fetch", "input_schema": {"type": "object"}}]
+
+
+@pytest.fixture
+def listings():
+    """Record the tool listings of the server, which lists TOOLS until told otherwise."""
+    class Listings:
+        def __init__(self):
+            self.count = 0
+            self.tools = TOOLS
+            self.error = None
+
+        async def __call__(self):
+            self.count += 1
+            await asyncio.sleep(0)
+            if self.error:
+                raise self.error
+            return self.tools
+
+    return Listings()
+
+
+async def cache_stale_tools(fake_redis, tools, age):
+    await fake_redis.set(get_schema_cache_key(SERVER), json.dumps({"tools": tools, "fetched_at": time.time() - age}))
+
+
+@pytest.mark.asyncio
+async def test_miss_lists_and_caches_the_tools(fake_redis, listings):
+    cache = MCPSchemaCache(ttl=3600)
+
+    assert await cache.get_tools(SERVER, listings) == TOOLS
+    assert await cache.get_tools(SERVER, listings) == TOOLS
+    assert listings.count == 1
+    assert get_schema_cache_key(SERVER) in fake_redis.expires
+
+
+def test_key_does_not_contain_credentials():
+    assert "token" not in get_schema_cache_key(SERVER)
+    assert get_schema_cache_key(SERVER) != get_schema_cache_key({**SERVER, "url": "https://other.test"})
+
+
+@pytest.mark.asyncio
+async def test_stale_tools_are_returned_and_refreshed_in_the_background(fake_redis, listings):
+    cache = MCPSchemaCache(ttl=3600, refresh_after=60)
+    await cache_stale_tools(fake_redis, TOOLS, age=120)
+    listings.tools = NEW_TOOLS
+
+    assert await cache.get_tools(SERVER, listings) == TOOLS
+    await asyncio.gather(*cache._refreshing.values())
+
+    assert listings.count == 1
+    assert cache._refreshing == {}
+    assert await cache.get_tools(SERVER, listings) == NEW_TOOLS
+    assert listings.count == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_stale_reads_refresh_once(fake_redis, listings):
+    cache = MCPSchemaCache(ttl=3600, refresh_after=60)
+    await cache_stale_tools(fake_redis, TOOLS, age=120)
+
+    await asyncio.gather(*(cache.get_tools(SERVER, listings) for _ in range(5)))
+    await asyncio.gather(*cache._refreshing.values())
+
+    assert listings.count == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_the_cached_tools(fake_redis, listings):
+    cache = MCPSchemaCache(ttl=3600, refresh_after=60)
+    await cache_stale_tools(fake_redis, TOOLS, age=120)
+    listings.error = RuntimeError("server unavailable")
+
+    assert await cache.get_tools(SERVER, listings) == TOOLS
+    await asyncio.gather(*cache._refreshing.values(), return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert cache._refreshing == {}
+    assert json.loads(await fake_redis.get(get_schema_cache_key(SERVER)))["tools"] == TOOLS
+    listings.error = None
+    assert await cache.get_tools(SERVER, listings) == TOOLS
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from services import scraper
+from services.scraper import FirecrawlScraper
+
+
+@pytest.fixture
+def firecrawl(monkeypatch):
+    monkeypatch.setattr(scraper, "HOST_INTERVAL", 0)
+    instance = FirecrawlScraper("key", "https://firecrawl.test", concurrency=8, per_host_concurrency=2, cache_ttl=60)
+    instance.running = {}
+    instance.peak = {}
+
+    async def request(url):
+        host = url.split("/")[2]
+        instance.running[host] = instance.running.get(host, 0) + 1
+        instance.peak[host] = max(instance.peak.get(host, 0), instance.running[host])
+        await asyncio.sleep(0.01)
+        instance.running[host] -= 1
+        return {"data": {"markdown": url}}
+
+    monkeypatch.setattr(instance, "_request", request)
+    return instance
+
+
+@pytest.mark.asyncio
+async def test_per_host_concurrency_is_limited(firecrawl):
+    urls = [f"https://a.test/{i}" for i in range(6)] + [f"https://b.test/{i}" for i in range(6)]
+
+    pages = await firecrawl.scrape_many(urls)
+
+    assert [page["text"] for page in pages] == urls
+    assert firecrawl.peak == {"a.test": 2, "b.test": 2}
+
+
+@pytest.mark.asyncio
+async def test_host_limits_are_dropped_once_idle(firecrawl):
+    task = asyncio.create_task(firecrawl.scrape_many([f"https://a.test/{i}" for i in range(4)]))
+    await asyncio.sleep(0)
+    assert "a.test" in firecrawl._hosts
+
+    await task
+
+    assert firecrawl._hosts == {}
+
+
+@pytest.mark.asyncio
+async def test_host_limits_are_dropped_after_a_failure(firecrawl, monkeypatch):
+    async def request(url):
+        raise RuntimeError("scrape failed")
+
+    monkeypatch.setattr(firecrawl, "_request", request)
+
+    with pytest.raises(RuntimeError):
+        await firecrawl.scrape("https://a.test/")
+    assert firecrawl._hosts == {}
+
+
+@pytest.mark.asyncio
+async def test_busy_host_does_not_hold_slots_of_other_hosts(monkeypatch):
+    monkeypatch.setattr(scraper, "HOST_INTERVAL", 0)
+    instance = FirecrawlScraper("key", "https://firecrawl.test", concurrency=2, per_host_concurrency=1, cache_ttl=60)
+    loop = asyncio.get_running_loop()
+    finished = {}
+
+    async def request(url):
+        await asyncio.sleep(0.3 if "slow.test" in url else 0.01)
+        finished[url] = loop.time()
+        return {"data": {"markdown": url}}
+
+    monkeypatch.setattr(instance, "_request", request)
+    started = loop.time()
+    await instance.scrape_many([f"https://slow.test/{i}" for i in range(3)] + ["https://fast.test/"])
+
+    assert finished["https://fast.test/"] - started < 0.1
+    assert max(finished.values()) - started >= 0.9
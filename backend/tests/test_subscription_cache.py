@@ -0,0 +1,66 @@
+import pytest
+
+from services import billing
+from services.subscription_cache import SubscriptionCache
+from tests.fakes import FakeDBConnection, FakeStripe, FakeSupabase
+from utils.config import config
+
+USER_ID = "user-1"
+CUSTOMER_ID = "cus_1"
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch, fake_redis):
+    """Serve subscriptions from a FakeStripe through the real Stripe fetch of billing."""
+    stripe = FakeStripe({CUSTOMER_ID: [FakeStripe.subscription("sub_1", config.STRIPE_TIER_2_20_ID)]})
+    supabase = FakeSupabase({"billing_customers": [{"id": CUSTOMER_ID, "account_id": USER_ID}]})
+    monkeypatch.setattr(billing, "stripe", stripe)
+    monkeypatch.setattr(billing, "DBConnection", lambda: FakeDBConnection(supabase))
+    monkeypatch.setattr(billing, "subscription_cache", SubscriptionCache(billing._fetch_user_subscription))
+    stripe.supabase = supabase
+    return stripe
+
+
+@pytest.mark.asyncio
+async def test_cold_miss_fetches_from_stripe_and_caches(fake_stripe, fake_redis):
+    subscription = await billing.get_user_subscription(USER_ID)
+
+    assert subscription["id"] == "sub_1"
+    assert fake_stripe.list_calls == [CUSTOMER_ID]
+    assert await fake_redis.get(f"subscription:{USER_ID}") is not None
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_do_not_call_stripe(fake_stripe, fake_redis):
+    await billing.get_user_subscription(USER_ID)
+    assert (await billing.get_user_subscription(USER_ID))["id"] == "sub_1"
+
+    # Another process only has the Redis tier
+    billing.subscription_cache._local.clear()
+    assert (await billing.get_user_subscription(USER_ID))["id"] == "sub_1"
+    assert fake_stripe.list_calls == [CUSTOMER_ID]
+
+
+@pytest.mark.asyncio
+async def test_webhook_refreshes_the_cached_subscription(fake_stripe, fake_redis):
+    await billing.get_user_subscription(USER_ID)
+    fake_stripe.subscriptions[CUSTOMER_ID] = [FakeStripe.subscription("sub_2", config.STRIPE_TIER_6_50_ID)]
+
+    await billing._refresh_cached_subscription(fake_stripe.supabase, CUSTOMER_ID)
+
+    assert (await billing.get_user_subscription(USER_ID))["id"] == "sub_2"
+    assert fake_stripe.list_calls == [CUSTOMER_ID, CUSTOMER_ID]
+
+
+@pytest.mark.asyncio
+async def test_webhook_invalidates_when_stripe_fails(fake_stripe, fake_redis, monkeypatch):
+    await billing.get_user_subscription(USER_ID)
+
+    def failing_list(**kwargs):
+        raise RuntimeError("Stripe unavailable")
+
+    monkeypatch.setattr(fake_stripe.Subscription, "list", staticmethod(failing_list))
+    await billing._refresh_cached_subscription(fake_stripe.supabase, CUSTOMER_ID)
+
+    assert USER_ID not in billing.subscription_cache._local
+    assert await fake_redis.get(f"subscription:{USER_ID}") is None
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from agentpress.message_cache import CachedMessage, CachedThread, ThreadMessageCache, _parse_created_at
+from agentpress.thread_manager import ThreadManager
+from tests.fakes import FakeDBConnection, FakeSupabase
+
+
+def timestamp(second: int) -> str:
+    return f"2025-01-01T00:00:{second:02d}+00:00"
+
+
+def row(message_id: str, second: int, is_llm_message: bool = True, text: str = None):
+    return {
+        "message_id": message_id,
+        "thread_id": "thread-1",
+        "is_llm_message": is_llm_message,
+        "content": json.dumps({"role": "user", "content": text or message_id}),
+        "created_at": timestamp(second),
+        "updated_at": timestamp(second),
+    }
+
+
+@pytest.fixture
+def messages():
+    return [row("m1", 1), row("m2", 2), row("status", 3, is_llm_message=False)]
+
+
+@pytest.fixture
+def thread_manager(messages):
+    manager = ThreadManager.__new__(ThreadManager)
+    manager.db = FakeDBConnection(FakeSupabase({"messages": messages}))
+    manager.message_cache = ThreadMessageCache(max_bytes=10 * 1024 * 1024, ttl=3600)
+    return manager
+
+
+async def contents(thread_manager):
+    return [message["content"] for message in await thread_manager.get_llm_messages("thread-1")]
+
+
+@pytest.mark.asyncio
+async def test_new_messages_are_synced_into_the_cache(thread_manager, messages):
+    assert await contents(thread_manager) == ["m1", "m2"]
+
+    messages.append(row("m3", 4))
+
+    assert await contents(thread_manager) == ["m1", "m2", "m3"]
+    assert thread_manager.message_cache._threads["thread-1"].synced_at == timestamp(4)
+
+
+@pytest.mark.asyncio
+async def test_deleted_message_is_dropped(thread_manager, messages):
+    await contents(thread_manager)
+
+    del messages[0]
+
+    assert await contents(thread_manager) == ["m2"]
+
+
+@pytest.mark.asyncio
+async def test_edited_message_is_reloaded(thread_manager, messages):
+    await contents(thread_manager)
+
+    messages[0].update(content=json.dumps({"role": "user", "content": "m1 edited"}), updated_at=timestamp(9))
+
+    assert await contents(thread_manager) == ["m1 edited", "m2"]
+
+
+@pytest.mark.asyncio
+async def test_message_flipped_to_non_llm_is_dropped(thread_manager, messages):
+    await contents(thread_manager)
+
+    messages[1].update(is_llm_message=False, updated_at=timestamp(9))
+
+    assert await contents(thread_manager) == ["m1"]
+
+
+@pytest.mark.asyncio
+async def test_late_commit_with_an_earlier_created_at_is_picked_up(thread_manager, messages):
+    await contents(thread_manager)
+    messages.append(row("m3", 5))
+    await contents(thread_manager)
+
+    messages.append(row("late", 3))
+
+    assert await contents(thread_manager) == ["m1", "m2", "late", "m3"]
+
+
+def test_is_current_tolerates_rows_written_after_the_version_was_read():
+    thread = CachedThread(updated_at=timestamp(5))
+    thread.add(CachedMessage("m1", _parse_created_at(timestamp(1)), "{}"))
+
+    assert ThreadMessageCache.is_current(thread, 1, timestamp(4))
+    assert not ThreadMessageCache.is_current(thread, 1, timestamp(6))
+    assert not ThreadMessageCache.is_current(thread, 2, timestamp(4))
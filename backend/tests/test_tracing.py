@@ -0,0 +1,74 @@
+import time
+from datetime import datetime, timezone
+
+from services.tracing import EVENT_SAMPLES_PER_NAME, RunTrace
+from tests.fakes import FakeLangfuseTrace
+
+
+def make_trace(**kwargs):
+    langfuse_trace = FakeLangfuseTrace()
+    return RunTrace(langfuse_trace, **kwargs), langfuse_trace
+
+
+def test_events_keep_the_time_they_were_recorded():
+    trace, langfuse_trace = make_trace(event_budget=100, max_payload_chars=1000)
+    before = datetime.now(timezone.utc)
+    trace.event(name="tool_started", level="DEFAULT")
+    after = datetime.now(timezone.utc)
+    time.sleep(0.05)
+
+    trace.flush()
+
+    assert before <= langfuse_trace.events[0]["start_time"] <= after
+
+
+def test_routine_events_are_sampled_and_counted():
+    trace, langfuse_trace = make_trace(event_budget=100, max_payload_chars=1000)
+    for _ in range(10):
+        trace.event(name="chunk", level="DEFAULT")
+    trace.event(name="failure", level="ERROR")
+
+    trace.flush()
+
+    names = [event["name"] for event in langfuse_trace.events]
+    assert names.count("chunk") == EVENT_SAMPLES_PER_NAME
+    assert "failure" in names
+    summary = langfuse_trace.events[-1]["metadata"]
+    assert summary["event_counts"] == {"chunk": 10, "failure": 1}
+    assert summary["dropped_events"] == {"chunk": 10 - EVENT_SAMPLES_PER_NAME}
+
+
+def test_routine_events_past_the_budget_are_dropped():
+    trace, langfuse_trace = make_trace(event_budget=2, max_payload_chars=1000)
+    for index in range(5):
+        trace.event(name=f"step_{index}", level="DEFAULT")
+
+    trace.flush()
+
+    assert [event["name"] for event in langfuse_trace.events] == ["step_0", "step_1", "trace_summary"]
+    assert langfuse_trace.events[-1]["metadata"]["dropped_events"] == {"step_2": 1, "step_3": 1, "step_4": 1}
+
+
+def test_warnings_and_errors_past_the_budget_are_sent():
+    trace, langfuse_trace = make_trace(event_budget=2, max_payload_chars=1000)
+    for index in range(3):
+        trace.event(name=f"step_{index}", level="DEFAULT")
+    trace.event(name="slow_tool", level="WARNING")
+    trace.event(name="tool_failed", level="ERROR")
+
+    trace.flush()
+
+    names = [event["name"] for event in langfuse_trace.events]
+    assert names == ["step_0", "step_1", "slow_tool", "tool_failed", "trace_summary"]
+
+
+def test_long_payloads_are_truncated():
+    trace, langfuse_trace = make_trace(event_budget=100, max_payload_chars=100)
+    trace.event(name="result", level="ERROR", status_message="x" * 500, metadata={"output": "y" * 500, "size": 500})
+
+    trace.flush()
+
+    event = langfuse_trace.events[0]
+    assert "truncated, length=500" in event["status_message"]
+    assert event["metadata"]["output"]["length"] == 500
+    assert event["metadata"]["size"] == 500
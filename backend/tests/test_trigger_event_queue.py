@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+
+from triggers import event_queue
+from triggers.core import TriggerEvent, TriggerResult, TriggerType
+from triggers.event_queue import TriggerEventQueue
+
+ACCOUNTS = {"agent-a": "account-1", "agent-b": "account-2", "agent-c": "account-2"}
+
+
+def entry(agent_id, event_id="event-1", attempt=1):
+    trigger_event = TriggerEvent(trigger_id="trigger-1", agent_id=agent_id, trigger_type=TriggerType.WEBHOOK,
+                                 event_id=event_id, raw_data={})
+    trigger_result = TriggerResult(success=True, should_execute_agent=True, agent_prompt="hi")
+    return {"payload": json.dumps({
+        "trigger_event": trigger_event.model_dump(mode='json'),
+        "trigger_result": trigger_result.model_dump(mode='json'),
+        "attempt": attempt,
+    })}
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    """A queue whose executions take a moment, recording the peak running per agent and account."""
+    instance = TriggerEventQueue(None, concurrency=2, per_agent_concurrency=1, per_account_concurrency=1)
+    instance.finished = []
+    instance.acked = []
+    instance.peak = {}
+    running = {}
+
+    async def execute(trigger_event, trigger_result):
+        keys = (trigger_event.agent_id, ACCOUNTS[trigger_event.agent_id])
+        for key in keys:
+            running[key] = running.get(key, 0) + 1
+            instance.peak[key] = max(instance.peak.get(key, 0), running[key])
+        await asyncio.sleep(0.02)
+        for key in keys:
+            running[key] -= 1
+        instance.finished.append(trigger_event.event_id)
+        return None
+
+    async def get_account_id(agent_id):
+        return ACCOUNTS[agent_id]
+
+    async def ack(message_id):
+        instance.acked.append(message_id)
+
+    monkeypatch.setattr(instance, "_execute", execute)
+    monkeypatch.setattr(instance, "_get_account_id", get_account_id)
+    monkeypatch.setattr(instance, "_ack", ack)
+    return instance
+
+
+def handle(queue, message_id, fields):
+    """Start handling an entry the way the consumer does."""
+    queue._waiting.add(message_id)
+    task = asyncio.create_task(queue._handle(message_id, fields))
+    task.add_done_callback(lambda _: queue._waiting.discard(message_id))
+    return task
+
+
+@pytest.mark.asyncio
+async def test_executions_waiting_for_their_agent_hold_no_slot(queue):
+    tasks = [handle(queue, f"a-{i}", entry("agent-a", f"a-{i}")) for i in range(5)]
+    await asyncio.sleep(0.005)
+
+    assert queue._running == 1
+    assert len(queue._waiting) == 4
+
+    tasks.append(handle(queue, "b-0", entry("agent-b", "b-0")))
+    await asyncio.sleep(0.005)
+    assert queue._running == 2
+
+    await asyncio.gather(*tasks)
+    assert queue.finished.index("b-0") < queue.finished.index("a-1")
+    assert queue.peak["agent-a"] == 1
+    assert queue._agent_slots == {} and queue._account_slots == {}
+
+
+@pytest.mark.asyncio
+async def test_executions_are_limited_per_account(queue):
+    await asyncio.gather(*(handle(queue, f"{agent_id}-{i}", entry(agent_id, f"{agent_id}-{i}"))
+                           for i in range(3) for agent_id in ("agent-b", "agent-c")))
+
+    assert queue.peak == {"agent-b": 1, "agent-c": 1, "account-2": 1}
+    assert len(queue.finished) == 6
+
+
+@pytest.mark.asyncio
+async def test_failed_execution_is_retried_without_holding_a_slot(queue, monkeypatch):
+    monkeypatch.setattr(event_queue, "RETRY_DELAY", 0.05)
+    enqueued = []
+
+    async def execute(trigger_event, trigger_result):
+        return "sandbox unavailable"
+
+    async def enqueue(trigger_event, trigger_result, attempt=1):
+        enqueued.append((trigger_event.event_id, attempt))
+
+    monkeypatch.setattr(queue, "_execute", execute)
+    monkeypatch.setattr(queue, "enqueue", enqueue)
+
+    task = handle(queue, "a-0", entry("agent-a", "a-0"))
+    await asyncio.sleep(0.01)
+    assert queue._running == 0 and not queue._waiting
+
+    await task
+    assert enqueued == [("a-0", 2)]
+    assert queue.acked == ["a-0"]
+
+
+@pytest.mark.asyncio
+async def test_retried_execution_resumes_after_completed_steps(fake_redis, monkeypatch):
+    from triggers.integration import AgentTriggerExecutor
+
+    executor = AgentTriggerExecutor(None)
+    calls = []
+    failures = ["messages unavailable"]
+
+    async def get_agent_config(agent_id):
+        return {"agent_id": agent_id, "account_id": "account-1"}
+
+    async def create_trigger_thread(agent_id, agent_config, trigger_event, trigger_result, progress):
+        calls.append("thread")
+        await progress.save(project_id="project-1")
+        await progress.save(thread_id="thread-1")
+        return "thread-1", "project-1"
+
+    async def create_initial_message(thread_id, prompt, trigger_data):
+        calls.append("message")
+        if failures:
+            raise RuntimeError(failures.pop())
+
+    async def start_agent_execution(thread_id, project_id, agent_config, trigger_variables):
+        calls.append("run")
+        return "run-1"
+
+    monkeypatch.setattr(executor, "_get_agent_config", get_agent_config)
+    monkeypatch.setattr(executor, "_create_trigger_thread", create_trigger_thread)
+    monkeypatch.setattr(executor, "_create_initial_message", create_initial_message)
+    monkeypatch.setattr(executor, "_start_agent_execution", start_agent_execution)
+
+    trigger_event = TriggerEvent(trigger_id="trigger-1", agent_id="agent-a", trigger_type=TriggerType.WEBHOOK,
+                                 event_id="event-1", raw_data={})
+    trigger_result = TriggerResult(success=True, should_execute_agent=True, agent_prompt="hi")
+
+    first = await executor.execute_triggered_agent("agent-a", trigger_result, trigger_event)
+    second = await executor.execute_triggered_agent("agent-a", trigger_result, trigger_event)
+    third = await executor.execute_triggered_agent("agent-a", trigger_result, trigger_event)
+
+    assert first["success"] is False
+    assert second == {"success": True, "thread_id": "thread-1", "agent_run_id": "run-1",
+                      "message": "Agent execution started successfully"}
+    assert third["agent_run_id"] == "run-1"
+    assert calls == ["thread", "message", "message", "run"]
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from services import web_search
+from services.web_search import WebSearch
+from tests.fakes import FakeTavily
+
+
+@pytest.fixture
+def tavily():
+    return FakeTavily({"nothing here": []}, delay=0.05)
+
+
+@pytest.fixture
+def search(fake_redis, tavily, monkeypatch):
+    monkeypatch.setattr(web_search, "LOCK_POLL_INTERVAL", 0.01)
+    instance = WebSearch("key", "https://tavily.test", cache_ttl=60)
+    instance._client = httpx.AsyncClient(transport=tavily.transport())
+    return instance
+
+
+@pytest.mark.asyncio
+async def test_repeated_search_is_served_from_cache(search, tavily):
+    first = await search.search("Python asyncio", max_results=3)
+    second = await search.search("  python   ASYNCIO?", max_results=3)
+
+    assert second == first
+    assert tavily.searches == ["Python asyncio"]
+    assert search.metrics.cache_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_one_request(search, tavily):
+    results = await asyncio.gather(*(search.search("python asyncio") for _ in range(5)))
+
+    assert all(result == results[0] for result in results)
+    assert len(tavily.searches) == 1
+    assert search.metrics.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_waits_for_the_search_of_another_process(search, tavily, fake_redis):
+    key = search._cache_key("python asyncio", {})
+    await fake_redis.set(f"{key}:lock", "1", ex=60)
+    cached = {"query": "python asyncio", "results": [{"title": "From the other process"}]}
+
+    task = asyncio.create_task(search.search("python asyncio"))
+    await asyncio.sleep(0.05)
+    assert not task.done()
+    await fake_redis.set(key, json.dumps(cached))
+    await fake_redis.delete(f"{key}:lock")
+
+    assert await task == cached
+    assert tavily.searches == []
+
+
+@pytest.mark.asyncio
+async def test_searches_itself_when_the_other_process_fails(search, tavily, fake_redis):
+    key = search._cache_key("python asyncio", {})
+    await fake_redis.set(f"{key}:lock", "1", ex=60)
+
+    task = asyncio.create_task(search.search("python asyncio"))
+    await asyncio.sleep(0.05)
+    await fake_redis.delete(f"{key}:lock")
+
+    result = await task
+    assert result["results"]
+    assert tavily.searches == ["python asyncio"]
+
+
+@pytest.mark.asyncio
+async def test_empty_results_are_not_cached(search, tavily, fake_redis):
+    first = await search.search("nothing here")
+    await search.search("nothing here")
+
+    assert first["results"] == []
+    assert tavily.searches == ["nothing here", "nothing here"]
+    assert await fake_redis.get(search._cache_key("nothing here", {})) is None
+
+
+@pytest.mark.asyncio
+async def test_lock_is_released_after_a_search(search, fake_redis):
+    await search.search("python asyncio")
+
+    assert await fake_redis.get(search._cache_key("python asyncio", {}) + ":lock") is None
@@ -0,0 +1,47 @@
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from sandbox.workspace_snapshot import WorkspaceSnapshotter
+
+
+class LocalProcess:
+    """Runs the sandbox commands on this machine."""
+
+    def __init__(self):
+        self.commands = []
+
+    async def exec(self, command: str, timeout: int = None):
+        self.commands.append(command)
+        completed = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=timeout)
+        return SimpleNamespace(exit_code=completed.returncode, result=completed.stdout + completed.stderr)
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    for path in ("src/main.py", "node_modules/pkg/index.js", "app/.next/cache.json", ".git/HEAD", "README.md"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("content")
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_list_files_prunes_excluded_directories(workspace):
+    process = LocalProcess()
+    snapshotter = WorkspaceSnapshotter(SimpleNamespace(process=process), str(workspace))
+
+    files = await snapshotter.list_files()
+
+    assert sorted(file.path for file in files) == ["README.md", "src/main.py"]
+    assert "-prune" in process.commands[0]
+
+
+@pytest.mark.asyncio
+async def test_list_files_without_excluded_directories(workspace):
+    snapshotter = WorkspaceSnapshotter(SimpleNamespace(process=LocalProcess()), str(workspace),
+                                       should_exclude=lambda path: False, excluded_dirs=())
+
+    files = await snapshotter.list_files()
+
+    assert len(files) == 5
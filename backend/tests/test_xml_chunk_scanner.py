@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from agentpress.xml_tool_parser import StreamingXMLChunkScanner, XMLTagMatcher
+
+TAGS = ["function_calls", "ask", "create-file", "complete"]
+CALLS = (
+    '<function_calls>\n<invoke name="create_file">\n<parameter name="file_path">a.py</parameter>\n'
+    '</invoke>\n</function_calls>'
+)
+
+
+def scan(deltas):
+    scanner = StreamingXMLChunkScanner(XMLTagMatcher(TAGS))
+    chunks = []
+    for delta in deltas:
+        chunks.extend(scanner.feed(delta))
+    return chunks
+
+
+def split(text, sizes):
+    deltas, pos = [], 0
+    for size in sizes:
+        deltas.append(text[pos:pos + size])
+        pos += size
+    deltas.append(text[pos:])
+    return deltas
+
+
+def every_split(text):
+    """The text fed whole, one character at a time and in random deltas of a few characters."""
+    rng = random.Random(0)
+    return [[text], list(text)] + [split(text, [rng.randint(1, 7) for _ in range(len(text))]) for _ in range(20)]
+
+
+@pytest.mark.parametrize("deltas", every_split(f"Let me write it.\n{CALLS}\nDone."))
+def test_function_calls_block(deltas):
+    assert scan(deltas) == [CALLS]
+
+
+@pytest.mark.parametrize("deltas", every_split(f"I'll use the <ask> tool if needed.\n{CALLS}\nthen {CALLS}"))
+def test_unclosed_legacy_tag_in_prose_does_not_hide_function_calls(deltas):
+    assert scan(deltas) == [CALLS, CALLS]
+
+
+@pytest.mark.parametrize("deltas", every_split("<ask>Which <ask>nested</ask> one?</ask> and <complete>\n</complete>"))
+def test_legacy_blocks_with_nesting(deltas):
+    assert scan(deltas) == ["<ask>Which <ask>nested</ask> one?</ask>", "<complete>\n</complete>"]
+
+
+@pytest.mark.parametrize("deltas", every_split("<asking>no</asking> <function_callsX> <create-file path='a'>x</create-file>"))
+def test_tags_only_match_whole_names(deltas):
+    assert scan(deltas) == ["<create-file path='a'>x</create-file>"]
+
+
+def test_function_calls_tag_split_across_deltas_inside_legacy_block():
+    deltas = ["use <ask> here <functi", "on_calls>\n<invoke name=\"x\"></invoke>\n</function_ca", "lls>"]
+
+    assert scan(deltas) == ['<function_calls>\n<invoke name="x"></invoke>\n</function_calls>']
+
+
+def test_consumed_content_is_dropped_from_the_buffer():
+    scanner = StreamingXMLChunkScanner(XMLTagMatcher(TAGS))
+    for _ in range(100):
+        assert scanner.feed("some prose " + CALLS) == [CALLS]
+
+    assert len(scanner._buffer) < len(CALLS)
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Body, Query
 from fastapi.responses import JSONResponse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
 import uuid
 import os
 from datetime import datetime
 
-from .core import TriggerManager, TriggerConfig, ProviderDefinition, TriggerType
+from .core import TriggerManager, TriggerConfig, ProviderDefinition, TriggerType, TriggerEvent
+from .event_queue import get_trigger_event_queue, get_event_dedupe_id
 from .registry import trigger_registry
 from services.supabase import DBConnection
 from utils.auth_utils import get_current_user_id_from_jwt
@@ -305,27 +306,94 @@ async def delete_trigger(
     else:
         raise HTTPException(status_code=500, detail="Failed to delete trigger")
 
+async def _parse_webhook_body(request: Request) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    body = await request.body()
+    headers = dict(request.headers)
+    
+    logger.debug(f"Webhook body: {body[:500]}...")
+    logger.debug(f"Webhook headers: {headers}")
+    
+    try:
+        if body:
+            data = await request.json()
+        else:
+            data = {}
+    except Exception as e:
+        logger.warning(f"Failed to parse JSON body: {e}")
+        data = {
+            "raw_body": body.decode('utf-8', errors='ignore'),
+            "content_type": headers.get('content-type', '')
+        }
+    return data, headers
+
+async def _process_and_enqueue(
+    trigger_id: str,
+    data: Dict[str, Any],
+    source: str,
+    trigger_config: Optional[TriggerConfig] = None
+):
+    """Validate a trigger event and queue its execution.
+    
+    The execution itself (project, sandbox, thread and agent run creation) runs in
+    the trigger event queue, so the provider gets its response right away.
+    """
+    queue = get_trigger_event_queue()
+    dedupe_id = get_event_dedupe_id(data)
+    if await queue.is_duplicate(trigger_id, dedupe_id):
+        logger.info(f"Ignoring duplicate {source} event {dedupe_id} for trigger {trigger_id}")
+        return {"message": f"{source} event already received"}
+    
+    try:
+        manager = await get_trigger_manager()
+        if trigger_config is None:
+            trigger_config = await manager.get_trigger(trigger_id)
+        result = await manager.process_trigger_event(trigger_id, data)
+        
+        logger.info(f"{source} trigger processing result: success={result.success}, should_execute={result.should_execute_agent}, error={result.error_message}")
+        
+        if result.success and (result.should_execute_agent or result.should_execute_workflow) and trigger_config:
+            trigger_type = trigger_config.trigger_type
+            if isinstance(trigger_type, str):
+                trigger_type = TriggerType(trigger_type)
+            
+            trigger_event = TriggerEvent(
+                trigger_id=trigger_id,
+                agent_id=trigger_config.agent_id,
+                trigger_type=trigger_type,
+                raw_data=data
+            )
+            await queue.enqueue(trigger_event, result)
+            
+            execution_type = "workflow" if result.should_execute_workflow else "agent"
+            logger.info(f"Queued {execution_type} execution {trigger_event.event_id} for trigger {trigger_id}")
+            return JSONResponse(status_code=202, content={
+                "message": f"{source} processed and {execution_type} execution queued",
+                "trigger_id": trigger_id,
+                "agent_id": trigger_config.agent_id,
+                "execution_type": execution_type,
+                "event_id": trigger_event.event_id
+            })
+    except Exception:
+        # Let the provider's retry through
+        await queue.forget(trigger_id, dedupe_id)
+        raise
+    
+    if result.response_data:
+        return JSONResponse(content=result.response_data)
+    elif result.success:
+        return {"message": f"{source} processed successfully"}
+    else:
+        logger.warning(f"{source} processing failed for {trigger_id}: {result.error_message}")
+        return JSONResponse(
+            status_code=400,
+            content={"error": result.error_message}
+        )
+
 @router.post("/qstash/webhook")
 async def handle_qstash_webhook(request: Request):
     try:
         logger.info("QStash webhook received")
-        body = await request.body()
-        headers = dict(request.headers)
-        
-        logger.debug(f"QStash webhook body: {body[:500]}...")
-        logger.debug(f"QStash webhook headers: {headers}")
-        
-        try:
-            if body:
-                data = await request.json()
-            else:
-                data = {}
-        except Exception as e:
-            logger.warning(f"Failed to parse JSON body: {e}")
-            data = {
-                "raw_body": body.decode('utf-8', errors='ignore'),
-                "content_type": headers.get('content-type', '')
-            }
+        data, headers = await _parse_webhook_body(request)
         
         trigger_id = data.get('trigger_id')
         
@@ -341,57 +409,7 @@ async def handle_qstash_webhook(request: Request):
         data["qstash_schedule_id"] = headers.get('upstash-schedule-id')
         
         logger.info(f"Processing QStash trigger event for {trigger_id}")
-        manager = await get_trigger_manager()
-        result = await manager.process_trigger_event(trigger_id, data)
-        
-        logger.info(f"QStash trigger processing result: success={result.success}, should_execute={result.should_execute_agent}, error={result.error_message}")
-        
-        if result.success and (result.should_execute_agent or result.should_execute_workflow):
-            from .integration import TriggerExecutor
-            executor = TriggerExecutor(db)
-            trigger_config = await manager.get_trigger(trigger_id)
-            if trigger_config:
-                from .core import TriggerEvent, TriggerType
-                trigger_type = trigger_config.trigger_type
-                if isinstance(trigger_type, str):
-                    trigger_type = TriggerType(trigger_type)
-                
-                trigger_event = TriggerEvent(
-                    trigger_id=trigger_id,
-                    agent_id=trigger_config.agent_id,
-                    trigger_type=trigger_type,
-                    raw_data=data
-                )
-                
-                execution_result = await executor.execute_trigger_result(
-                    agent_id=trigger_config.agent_id,
-                    trigger_result=result,
-                    trigger_event=trigger_event
-                )
-                
-                logger.info(f"QStash execution result: {execution_result}")
-                
-                execution_type = "workflow" if result.should_execute_workflow else "agent"
-                return JSONResponse(content={
-                    "message": f"QStash webhook processed and {execution_type} execution started",
-                    "trigger_id": trigger_id,
-                    "agent_id": trigger_config.agent_id,
-                    "execution_type": execution_type,
-                    "thread_id": execution_result.get("thread_id"),
-                    "agent_run_id": execution_result.get("agent_run_id"),
-                    "execution_id": execution_result.get("execution_id")
-                })
-        
-        if result.response_data:
-            return JSONResponse(content=result.response_data)
-        elif result.success:
-            return {"message": "QStash webhook processed successfully"}
-        else:
-            logger.warning(f"QStash webhook processing failed for {trigger_id}: {result.error_message}")
-            return JSONResponse(
-                status_code=400,
-                content={"error": result.error_message}
-            )
+        return await _process_and_enqueue(trigger_id, data, "QStash webhook")
             
     except Exception as e:
         logger.error(f"Error processing QStash webhook: {e}")
@@ -406,26 +424,9 @@ async def handle_qstash_webhook(request: Request):
 async def handle_schedule_webhook(request: Request):
     try:
         logger.info("Schedule webhook received from Pipedream")
-        body = await request.body()
-        headers = dict(request.headers)
-        
-        logger.debug(f"Schedule webhook body: {body[:500]}...")
-        logger.debug(f"Schedule webhook headers: {headers}")
-        
-        try:
-            if body:
-                data = await request.json()
-            else:
-                data = {}
-        except Exception as e:
-            logger.warning(f"Failed to parse JSON body: {e}")
-            data = {
-                "raw_body": body.decode('utf-8', errors='ignore'),
-                "content_type": headers.get('content-type', '')
-            }
+        data, headers = await _parse_webhook_body(request)
         
         trigger_id = data.get('trigger_id')
-        agent_id = data.get('agent_id')
         
         if not trigger_id:
             logger.error("No trigger_id in schedule webhook payload")
@@ -441,55 +442,7 @@ async def handle_schedule_webhook(request: Request):
         if trigger_config:
             data['trigger_config'] = trigger_config.config
         
-        result = await manager.process_trigger_event(trigger_id, data)
-        
-        logger.info(f"Schedule trigger processing result: success={result.success}, should_execute={result.should_execute_agent}, error={result.error_message}")
-        
-        if result.success and (result.should_execute_agent or result.should_execute_workflow):
-            from .integration import TriggerExecutor
-            executor = TriggerExecutor(db)
-            if trigger_config:
-                from .core import TriggerEvent, TriggerType
-                trigger_type = trigger_config.trigger_type
-                if isinstance(trigger_type, str):
-                    trigger_type = TriggerType(trigger_type)
-                
-                trigger_event = TriggerEvent(
-                    trigger_id=trigger_id,
-                    agent_id=trigger_config.agent_id,
-                    trigger_type=trigger_type,
-                    raw_data=data
-                )
-                
-                execution_result = await executor.execute_trigger_result(
-                    agent_id=trigger_config.agent_id,
-                    trigger_result=result,
-                    trigger_event=trigger_event
-                )
-                
-                logger.info(f"Scheduled execution result: {execution_result}")
-                
-                execution_type = "workflow" if result.should_execute_workflow else "agent"
-                return JSONResponse(content={
-                    "message": f"Schedule webhook processed and {execution_type} execution started",
-                    "trigger_id": trigger_id,
-                    "agent_id": trigger_config.agent_id,
-                    "execution_type": execution_type,
-                    "thread_id": execution_result.get("thread_id"),
-                    "agent_run_id": execution_result.get("agent_run_id"),
-                    "execution_id": execution_result.get("execution_id")
-                })
-        
-        if result.response_data:
-            return JSONResponse(content=result.response_data)
-        elif result.success:
-            return {"message": "Schedule webhook processed successfully"}
-        else:
-            logger.warning(f"Schedule webhook processing failed for {trigger_id}: {result.error_message}")
-            return JSONResponse(
-                status_code=400,
-                content={"error": result.error_message}
-            )
+        return await _process_and_enqueue(trigger_id, data, "Schedule webhook", trigger_config)
             
     except Exception as e:
         logger.error(f"Error processing schedule webhook: {e}")
@@ -507,77 +460,11 @@ async def handle_webhook(
 ):
     try:
         logger.info(f"Webhook received for trigger {trigger_id}")
-        body = await request.body()
-        headers = dict(request.headers)
-        
-        logger.debug(f"Webhook body: {body[:500]}...")
-        logger.debug(f"Webhook headers: {headers}")
-        
-        try:
-            if body:
-                data = await request.json()
-            else:
-                data = {}
-        except Exception as e:
-            logger.warning(f"Failed to parse JSON body: {e}")
-            data = {
-                "raw_body": body.decode('utf-8', errors='ignore'),
-                "content_type": headers.get('content-type', '')
-            }
+        data, headers = await _parse_webhook_body(request)
         data["headers"] = headers
         
         logger.info(f"Processing trigger event for {trigger_id}")
-        manager = await get_trigger_manager()
-        result = await manager.process_trigger_event(trigger_id, data)
-        
-        logger.info(f"Trigger processing result: success={result.success}, should_execute={result.should_execute_agent}, error={result.error_message}")
-        
-        if result.success and (result.should_execute_agent or result.should_execute_workflow):
-            from .integration import TriggerExecutor
-            executor = TriggerExecutor(db)
-            trigger_config = await manager.get_trigger(trigger_id)
-            if trigger_config:
-                from .core import TriggerEvent, TriggerType
-                trigger_type = trigger_config.trigger_type
-                if isinstance(trigger_type, str):
-                    trigger_type = TriggerType(trigger_type)
-                
-                trigger_event = TriggerEvent(
-                    trigger_id=trigger_id,
-                    agent_id=trigger_config.agent_id,
-                    trigger_type=trigger_type,
-                    raw_data=data
-                )
-                
-                execution_result = await executor.execute_trigger_result(
-                    agent_id=trigger_config.agent_id,
-                    trigger_result=result,
-                    trigger_event=trigger_event
-                )
-                
-                logger.info(f"Execution result: {execution_result}")
-                
-                execution_type = "workflow" if result.should_execute_workflow else "agent"
-                return JSONResponse(content={
-                    "message": f"Webhook processed and {execution_type} execution started",
-                    "trigger_id": trigger_id,
-                    "agent_id": trigger_config.agent_id,
-                    "execution_type": execution_type,
-                    "thread_id": execution_result.get("thread_id"),
-                    "agent_run_id": execution_result.get("agent_run_id"),
-                    "execution_id": execution_result.get("execution_id")
-                })
-        
-        if result.response_data:
-            return JSONResponse(content=result.response_data)
-        elif result.success:
-            return {"message": "Webhook processed successfully"}
-        else:
-            logger.warning(f"Webhook processing failed for {trigger_id}: {result.error_message}")
-            return JSONResponse(
-                status_code=400,
-                content={"error": result.error_message}
-            )
+        return await _process_and_enqueue(trigger_id, data, "Webhook")
             
     except Exception as e:
         logger.error(f"Error handling webhook for trigger {trigger_id}: {e}")
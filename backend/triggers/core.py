@@ -1,4 +1,5 @@
 import abc
+import time
 import uuid
 import importlib
 from datetime import datetime, timezone
@@ -201,6 +202,18 @@ class ProviderFactory:
         
         raise ValueError(f"Provider {provider_definition.provider_id} has no implementation")
 
+# Seconds provider definitions are reused before custom providers are reloaded from the DB
+PROVIDER_DEFINITIONS_TTL = 60
+
+# Provider definitions shared by all trigger managers of the process
+_provider_definitions: Dict[str, ProviderDefinition] = {}
+_provider_definitions_loaded_at = 0.0
+
+def invalidate_provider_definitions():
+    """Reload provider definitions on the next lookup, e.g. after custom providers changed."""
+    global _provider_definitions_loaded_at
+    _provider_definitions_loaded_at = 0.0
+
 class TriggerManager:
     def __init__(self, db_connection):
         self.db = db_connection
@@ -208,12 +221,26 @@ class TriggerManager:
         self.provider_definitions: Dict[str, ProviderDefinition] = {}
         self.active_triggers: Dict[str, TriggerConfig] = {}
     
-    async def load_provider_definitions(self):
+    async def load_provider_definitions(self, force: bool = False):
+        global _provider_definitions, _provider_definitions_loaded_at
         from utils.logger import logger
-        logger.info("Loading provider definitions...")
-        await self._load_builtin_providers()
-        await self._load_custom_providers()
-        logger.info(f"Loaded {len(self.provider_definitions)} provider definitions: {list(self.provider_definitions.keys())}")
+        
+        if force or not _provider_definitions_loaded_at or time.monotonic() - _provider_definitions_loaded_at > PROVIDER_DEFINITIONS_TTL:
+            logger.info("Loading provider definitions...")
+            previous_definitions = dict(self.provider_definitions)
+            await self._load_builtin_providers()
+            await self._load_custom_providers()
+            _provider_definitions = dict(self.provider_definitions)
+            _provider_definitions_loaded_at = time.monotonic()
+            logger.info(f"Loaded {len(self.provider_definitions)} provider definitions: {list(self.provider_definitions.keys())}")
+        else:
+            previous_definitions = dict(self.provider_definitions)
+            self.provider_definitions = dict(_provider_definitions)
+        
+        # Providers built from a definition that changed or disappeared are rebuilt on next use
+        for provider_id, definition in previous_definitions.items():
+            if self.provider_definitions.get(provider_id) != definition:
+                self.providers.pop(provider_id, None)
     
     async def _load_builtin_providers(self):
         builtin_providers = [
@@ -378,17 +405,14 @@ class TriggerManager:
     
     async def get_or_create_provider(self, provider_id: str) -> Optional[TriggerProvider]:
         from utils.logger import logger
-        logger.info(f"Looking for provider: {provider_id}")
-        logger.info(f"Available providers: {list(self.providers.keys())}")
-        logger.info(f"Available provider definitions: {list(self.provider_definitions.keys())}")
+        logger.debug(f"Looking for provider: {provider_id}")
         
         if provider_id in self.providers:
-            logger.info(f"Found existing provider: {provider_id}")
             return self.providers[provider_id]
         
         definition = self.provider_definitions.get(provider_id)
         if not definition:
-            logger.error(f"No provider definition found for: {provider_id}")
+            logger.error(f"No provider definition found for: {provider_id}", available_providers=list(self.provider_definitions.keys()))
             return None
         
         try:
@@ -0,0 +1,315 @@
+"""
+Durable queue of trigger executions.
+
+Webhooks only validate an event, drop duplicates and enqueue the execution on the
+trigger_events Redis stream, so providers get their acknowledgement right away.
+Consumers in the trigger_executors group run the executions in the background with a
+bounded number of executions in total, per agent and per account. An execution first
+waits for a slot of its agent and of its account, and only then for one of the process,
+so a burst of events for one agent does not keep other agents' executions from running.
+An execution is acknowledged once it ran; executions of a consumer that died are claimed
+by another consumer after CLAIM_IDLE_MS. Failed executions are queued again with an
+attempt count, up to MAX_ATTEMPTS, and then moved to the trigger_events_dead stream. The
+executor records the steps of an execution that completed, so a retry resumes after them.
+"""
+
+import asyncio
+import json
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, Any, Optional, List, Set, Tuple, AsyncIterator
+
+from redis.exceptions import ResponseError
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+from .core import TriggerEvent, TriggerResult
+
+STREAM_KEY = "trigger_events"
+DEAD_LETTER_KEY = "trigger_events_dead"
+CONSUMER_GROUP = "trigger_executors"
+STREAM_MAX_LEN = 10000
+DEDUPE_TTL = 3600 * 24
+READ_BLOCK_MS = 5000  # Below the Redis socket timeout
+CLAIM_IDLE_MS = 10 * 60 * 1000
+CLAIM_INTERVAL = 60
+STOP_TIMEOUT = 30
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5  # Seconds before the first retry, doubled for each further one
+MAX_WAITING = 100  # Executions read ahead while their agent or account is busy
+
+
+def get_event_dedupe_id(data: Dict[str, Any]) -> Optional[str]:
+    """ID the provider gives an event, used to drop redeliveries of the same event.
+
+    Returns None for events without such an ID; these are never deduplicated.
+    """
+    headers = data.get('headers') or {}
+    if data.get('update_id') is not None:
+        return f"update:{data['update_id']}"
+    if data.get('event_id'):
+        return f"event:{data['event_id']}"
+    if headers.get('upstash-message-id'):
+        return f"qstash:{headers['upstash-message-id']}"
+    return None
+
+
+class _Slot:
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.users = 0
+
+
+class TriggerEventQueue:
+    """Enqueues trigger executions and runs them from the stream.
+
+    Args:
+        db: Database connection for the trigger executor.
+        concurrency: Executions this process runs at the same time.
+        per_agent_concurrency: Executions of the same agent this process runs at the same time.
+        per_account_concurrency: Executions of agents of the same account this process runs at the same time.
+    """
+
+    def __init__(self, db: DBConnection, concurrency: int, per_agent_concurrency: int, per_account_concurrency: int):
+        self.db = db
+        self.concurrency = concurrency
+        self.per_agent_concurrency = per_agent_concurrency
+        self.per_account_concurrency = per_account_concurrency
+        self.consumer_name = f"consumer-{uuid.uuid4()}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._agent_slots: Dict[str, _Slot] = {}
+        self._account_slots: Dict[str, _Slot] = {}
+        self._waiting: Set[str] = set()  # Stream entries not yet holding their execution slots
+        self._running = 0
+        self._tasks: set = set()
+        self._consumer_task: Optional[asyncio.Task] = None
+
+    async def is_duplicate(self, trigger_id: str, dedupe_id: Optional[str]) -> bool:
+        """Record an event and tell whether it was seen before."""
+        if not dedupe_id:
+            return False
+        try:
+            first_seen = await redis.set(f"trigger_event_seen:{trigger_id}:{dedupe_id}", "1", nx=True, ex=DEDUPE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to check for duplicate trigger event {dedupe_id}: {str(e)}")
+            return False
+        return not first_seen
+
+    async def forget(self, trigger_id: str, dedupe_id: Optional[str]) -> None:
+        """Let an event through again, e.g. after it could not be enqueued."""
+        if dedupe_id:
+            await redis.delete(f"trigger_event_seen:{trigger_id}:{dedupe_id}")
+
+    async def enqueue(self, trigger_event: TriggerEvent, trigger_result: TriggerResult, attempt: int = 1) -> str:
+        """Queue the execution of a processed trigger event.
+
+        Returns:
+            The ID of the stream entry.
+        """
+        redis_client = await redis.get_client()
+        payload = json.dumps({
+            "trigger_event": trigger_event.model_dump(mode='json'),
+            "trigger_result": trigger_result.model_dump(mode='json'),
+            "attempt": attempt,
+        })
+        return await redis_client.xadd(STREAM_KEY, {"payload": payload}, maxlen=STREAM_MAX_LEN, approximate=True)
+
+    async def _ensure_group(self) -> None:
+        redis_client = await redis.get_client()
+        try:
+            await redis_client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _claim_stale(self, count: int) -> List[Tuple[str, Dict[str, str]]]:
+        redis_client = await redis.get_client()
+        result = await redis_client.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, self.consumer_name,
+            min_idle_time=CLAIM_IDLE_MS, start_id='0-0', count=count,
+        )
+        return result[1] if result else []
+
+    async def _consume(self) -> None:
+        logger.info(f"Trigger event consumer {self.consumer_name} started")
+        group_ready = False
+        last_claim = 0.0
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                if not group_ready:
+                    await self._ensure_group()
+                    group_ready = True
+                redis_client = await redis.get_client()
+
+                # Executions waiting for their agent or account, or sleeping before a retry, hold no slot
+                while self._running >= self.concurrency or len(self._waiting) >= MAX_WAITING:
+                    await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                free_slots = min(self.concurrency - self._running, MAX_WAITING - len(self._waiting))
+
+                messages = []
+                if loop.time() - last_claim >= CLAIM_INTERVAL:
+                    last_claim = loop.time()
+                    messages = await self._claim_stale(free_slots)
+                    if messages:
+                        logger.info(f"Claimed {len(messages)} stale trigger executions")
+                if not messages:
+                    response = await redis_client.xreadgroup(
+                        CONSUMER_GROUP, self.consumer_name, {STREAM_KEY: '>'},
+                        count=free_slots, block=READ_BLOCK_MS,
+                    )
+                    messages = response[0][1] if response else []
+
+                for message_id, fields in messages:
+                    self._waiting.add(message_id)
+                    task = asyncio.create_task(self._handle(message_id, fields))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    task.add_done_callback(lambda _, message_id=message_id: self._waiting.discard(message_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading trigger events: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _handle(self, message_id: str, fields: Dict[str, str]) -> None:
+        try:
+            payload = json.loads(fields['payload'])
+            trigger_event = TriggerEvent(**payload['trigger_event'])
+            trigger_result = TriggerResult(**payload['trigger_result'])
+            attempt = int(payload.get('attempt', 1))
+        except Exception as e:
+            logger.error(f"Dropping malformed trigger event {message_id}: {str(e)}")
+            await self._ack(message_id)
+            return
+
+        account_id = await self._get_account_id(trigger_event.agent_id)
+        async with self._execution_slot(message_id, trigger_event.agent_id, account_id):
+            error = await self._execute(trigger_event, trigger_result)
+
+        if error:
+            logger.error(f"Error executing trigger event {message_id} for trigger {trigger_event.trigger_id} (attempt {attempt}/{MAX_ATTEMPTS}): {error}")
+            if not await self._retry(message_id, fields, trigger_event, trigger_result, attempt, error):
+                # Left pending, so it is claimed again after CLAIM_IDLE_MS
+                return
+        await self._ack(message_id)
+
+    async def _execute(self, trigger_event: TriggerEvent, trigger_result: TriggerResult) -> Optional[str]:
+        """Run an execution. Returns its error, None if it succeeded."""
+        from .integration import TriggerExecutor
+
+        try:
+            execution_result = await TriggerExecutor(self.db).execute_trigger_result(
+                agent_id=trigger_event.agent_id,
+                trigger_result=trigger_result,
+                trigger_event=trigger_event
+            )
+            logger.info(f"Execution result for trigger {trigger_event.trigger_id}: {execution_result}")
+            return None if execution_result.get('success') else execution_result.get('error', 'Execution failed')
+        except Exception as e:
+            return str(e)
+
+    async def _get_account_id(self, agent_id: str) -> Optional[str]:
+        """Account of an agent, None if it is unknown and the execution is only limited per agent."""
+        from agent.config_resolver import get_agent_config_resolver
+
+        try:
+            agent_config = await get_agent_config_resolver().get_agent_config(agent_id)
+        except Exception as e:
+            logger.warning(f"Failed to get the account of agent {agent_id}: {str(e)}")
+            return None
+        return agent_config.get('account_id') if agent_config else None
+
+    async def _retry(self, message_id: str, fields: Dict[str, str], trigger_event: TriggerEvent,
+                     trigger_result: TriggerResult, attempt: int, error: str) -> bool:
+        """Queue a failed execution again, or dead-letter it after MAX_ATTEMPTS. Returns False if neither worked."""
+        try:
+            if attempt >= MAX_ATTEMPTS:
+                redis_client = await redis.get_client()
+                await redis_client.xadd(
+                    DEAD_LETTER_KEY, {**fields, "error": error, "message_id": message_id},
+                    maxlen=STREAM_MAX_LEN, approximate=True,
+                )
+                logger.error(f"Moved trigger event {message_id} to {DEAD_LETTER_KEY} after {attempt} attempts")
+                return True
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            await self.enqueue(trigger_event, trigger_result, attempt + 1)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to retry trigger event {message_id}: {str(e)}")
+            return False
+
+    @asynccontextmanager
+    async def _execution_slot(self, message_id: str, agent_id: str, account_id: Optional[str]) -> AsyncIterator[None]:
+        """Hold a slot of the agent, of its account and of the process, taken in that order."""
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(self._keyed_slot(self._agent_slots, agent_id, self.per_agent_concurrency))
+            if account_id:
+                await stack.enter_async_context(
+                    self._keyed_slot(self._account_slots, account_id, self.per_account_concurrency))
+            await stack.enter_async_context(self._slots)
+            self._waiting.discard(message_id)
+            self._running += 1
+            try:
+                yield
+            finally:
+                self._running -= 1
+
+    @asynccontextmanager
+    async def _keyed_slot(self, slots: Dict[str, _Slot], key: str, concurrency: int) -> AsyncIterator[None]:
+        """Hold one of the execution slots of an agent or account, dropping its slots once unused."""
+        slot = slots.get(key)
+        if slot is None:
+            slot = slots[key] = _Slot(concurrency)
+        slot.users += 1
+        try:
+            async with slot.semaphore:
+                yield
+        finally:
+            slot.users -= 1
+            if slot.users == 0:
+                del slots[key]
+
+    async def _ack(self, message_id: str) -> None:
+        try:
+            redis_client = await redis.get_client()
+            await redis_client.xack(STREAM_KEY, CONSUMER_GROUP, message_id)
+        except Exception as e:
+            logger.error(f"Failed to acknowledge trigger event {message_id}: {str(e)}")
+
+    def start(self) -> None:
+        """Start consuming trigger executions in the background."""
+        if self._consumer_task is None:
+            self._consumer_task = asyncio.create_task(self._consume())
+
+    async def stop(self) -> None:
+        """Stop reading new executions and wait for the running ones."""
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            try:
+                await self._consumer_task
+            except asyncio.CancelledError:
+                pass
+            self._consumer_task = None
+        if self._tasks:
+            # Executions still running after this are claimed by another consumer
+            await asyncio.wait(self._tasks, timeout=STOP_TIMEOUT)
+
+
+_queue: Optional[TriggerEventQueue] = None
+
+
+def get_trigger_event_queue(db: Optional[DBConnection] = None) -> TriggerEventQueue:
+    """Get the process-wide trigger event queue."""
+    global _queue
+    if _queue is None:
+        _queue = TriggerEventQueue(
+            db or DBConnection(),
+            concurrency=config.TRIGGER_QUEUE_CONCURRENCY,
+            per_agent_concurrency=config.TRIGGER_QUEUE_PER_AGENT_CONCURRENCY,
+            per_account_concurrency=config.TRIGGER_QUEUE_PER_ACCOUNT_CONCURRENCY,
+        )
+    return _queue
@@ -4,9 +4,53 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timezone
 
 from .core import TriggerResult, TriggerEvent
+from services import redis
 from services.supabase import DBConnection
 from utils.logger import logger
 from agent.run_agent import get_stream_context, run_agent_run_stream
+from agent.config_resolver import get_agent_config_resolver
+from sandbox.pool import get_sandbox_pool
+
+EXECUTION_PROGRESS_TTL = 3600 * 24
+
+
+class ExecutionProgress:
+    """Results of the steps of a trigger execution that completed.
+
+    Kept in Redis by event ID, so a retry of the execution resumes after its last
+    completed step instead of creating another project, sandbox and thread.
+    """
+
+    def __init__(self, event_id: str, steps: Dict[str, str]):
+        self.event_id = event_id
+        self.steps = steps
+
+    @staticmethod
+    def _key(event_id: str) -> str:
+        return f"trigger_execution:{event_id}"
+
+    @classmethod
+    async def load(cls, event_id: str) -> "ExecutionProgress":
+        try:
+            redis_client = await redis.get_client()
+            steps = await redis_client.hgetall(cls._key(event_id))
+        except Exception as e:
+            logger.warning(f"Failed to load the progress of trigger execution {event_id}: {str(e)}")
+            steps = {}
+        return cls(event_id, steps or {})
+
+    def get(self, step: str) -> Optional[str]:
+        return self.steps.get(step)
+
+    async def save(self, **results: str) -> None:
+        """Record the results of completed steps."""
+        self.steps.update(results)
+        try:
+            redis_client = await redis.get_client()
+            await redis_client.hset(self._key(self.event_id), mapping=results)
+            await redis_client.expire(self._key(self.event_id), EXECUTION_PROGRESS_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to save the progress of trigger execution {self.event_id}: {str(e)}")
 
 class TriggerExecutor:
     def __init__(self, db_connection: DBConnection):
@@ -73,37 +117,51 @@ class WorkflowTriggerExecutor:
             if not agent_config:
                 raise ValueError(f"Agent {agent_id} not found")
             
-            thread_id, project_id = await self._create_workflow_thread(
-                agent_id=agent_id,
-                workflow_id=workflow_id,
-                agent_config=agent_config,
-                workflow_config=workflow_config,
-                trigger_event=trigger_event
-            )
+            # Steps that completed in an earlier attempt are skipped
+            progress = await ExecutionProgress.load(trigger_event.event_id)
             
-            execution_id = await self._create_workflow_execution(
-                workflow_id=workflow_id,
-                agent_id=agent_id,
-                thread_id=thread_id,
-                workflow_input=workflow_input,
-                trigger_event=trigger_event
-            )
+            if not progress.get('thread_id'):
+                await self._create_workflow_thread(
+                    agent_id=agent_id,
+                    workflow_id=workflow_id,
+                    agent_config=agent_config,
+                    workflow_config=workflow_config,
+                    trigger_event=trigger_event,
+                    progress=progress
+                )
+            thread_id, project_id = progress.get('thread_id'), progress.get('project_id')
             
-            await self._create_workflow_message(
-                thread_id=thread_id,
-                workflow_config=workflow_config,
-                workflow_input=workflow_input,
-                trigger_data=trigger_result.execution_variables
-            )
+            execution_id = progress.get('execution_id')
+            if not execution_id:
+                execution_id = await self._create_workflow_execution(
+                    workflow_id=workflow_id,
+                    agent_id=agent_id,
+                    thread_id=thread_id,
+                    workflow_input=workflow_input,
+                    trigger_event=trigger_event
+                )
+                await progress.save(execution_id=execution_id)
             
-            agent_run_id = await self._start_workflow_execution(
-                thread_id=thread_id,
-                project_id=project_id,
-                agent_config=agent_config,
-                workflow_config=workflow_config,
-                workflow_input=workflow_input,
-                execution_id=execution_id
-            )
+            if not progress.get('message_created'):
+                await self._create_workflow_message(
+                    thread_id=thread_id,
+                    workflow_config=workflow_config,
+                    workflow_input=workflow_input,
+                    trigger_data=trigger_result.execution_variables
+                )
+                await progress.save(message_created='1')
+            
+            agent_run_id = progress.get('agent_run_id')
+            if not agent_run_id:
+                agent_run_id = await self._start_workflow_execution(
+                    thread_id=thread_id,
+                    project_id=project_id,
+                    agent_config=agent_config,
+                    workflow_config=workflow_config,
+                    workflow_input=workflow_input,
+                    execution_id=execution_id
+                )
+                await progress.save(agent_run_id=agent_run_id)
             
             return {
                 "success": True,
@@ -127,34 +185,7 @@ class WorkflowTriggerExecutor:
         return result.data[0] if result.data else None
     
     async def _get_agent_config(self, agent_id: str) -> Optional[Dict[str, Any]]:
-        client = await self.db.client
-        
-        result = await client.table('agents').select(
-            '*, agent_versions!current_version_id(*)'
-        ).eq('agent_id', agent_id).execute()
-        
-        if not result.data:
-            return None
-        
-        agent_data = result.data[0]
-        
-        # Use version data if available
-        if agent_data.get('agent_versions'):
-            version_data = agent_data['agent_versions']
-            return {
-                'agent_id': agent_data['agent_id'],
-                'name': agent_data['name'],
-                'description': agent_data.get('description'),
-                'system_prompt': version_data['system_prompt'],
-                'configured_mcps': version_data.get('configured_mcps', []),
-                'custom_mcps': version_data.get('custom_mcps', []),
-                'agentpress_tools': version_data.get('agentpress_tools', {}),
-                'account_id': agent_data['account_id'],
-                'current_version_id': agent_data.get('current_version_id'),
-                'version_name': version_data.get('version_name', 'v1')
-            }
-        
-        return agent_data
+        return await get_agent_config_resolver().get_agent_config(agent_id)
     
     async def _create_workflow_thread(
         self,
@@ -162,59 +193,45 @@ class WorkflowTriggerExecutor:
         workflow_id: str,
         agent_config: Dict[str, Any],
         workflow_config: Dict[str, Any],
-        trigger_event: TriggerEvent
+        trigger_event: TriggerEvent,
+        progress: ExecutionProgress
     ) -> tuple[str, str]:
-        """Create a new thread and project for workflow execution."""
-        from sandbox.sandbox import create_sandbox
-        
+        """Create a new thread and project for workflow execution, or only the thread if the project exists."""
         thread_id = str(uuid.uuid4())
-        project_id = str(uuid.uuid4())
+        project_id = progress.get('project_id')
         client = await self.db.client
         
-        project_data = {
-            "project_id": project_id,
-            "account_id": agent_config['account_id'],
-            "name": f"Workflow: {workflow_config.get('name', 'Unknown Workflow')}",
-            "description": f"Auto-created project for workflow execution from {trigger_event.trigger_type}"
-        }
-        
-        await client.table('projects').insert(project_data).execute()
-        logger.info(f"Created workflow project {project_id} for workflow {workflow_id}")
-        
-        try:
-            sandbox_pass = str(uuid.uuid4())
-            sandbox = await create_sandbox(sandbox_pass, project_id)
-            sandbox_id = sandbox.id
-            logger.info(f"Created sandbox {sandbox_id} for workflow project {project_id}")
-
-            vnc_link = await sandbox.get_preview_link(6080)
-            website_link = await sandbox.get_preview_link(8080)
-            vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-            website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-            token = None
-            if hasattr(vnc_link, 'token'):
-                token = vnc_link.token
-            elif "token='" in str(vnc_link):
-                token = str(vnc_link).split("token='")[1].split("'")[0]
-
-            sandbox_data = {
-                "id": sandbox_id,
-                "pass": sandbox_pass,
-                "vnc_preview": vnc_url,
-                "sandbox_url": website_url,
-                "token": token
+        if not project_id:
+            project_id = str(uuid.uuid4())
+            project_data = {
+                "project_id": project_id,
+                "account_id": agent_config['account_id'],
+                "name": f"Workflow: {workflow_config.get('name', 'Unknown Workflow')}",
+                "description": f"Auto-created project for workflow execution from {trigger_event.trigger_type}"
             }
             
-            await client.table('projects').update({
-                'sandbox': sandbox_data
-            }).eq('project_id', project_id).execute()
+            await client.table('projects').insert(project_data).execute()
+            logger.info(f"Created workflow project {project_id} for workflow {workflow_id}")
             
-            logger.info(f"Updated workflow project {project_id} with sandbox {sandbox_id}")
+            try:
+                sandbox = await get_sandbox_pool().acquire(project_id)
+                sandbox_id = sandbox.id
+                logger.info(f"Got sandbox {sandbox_id} for workflow project {project_id}")
+
+                sandbox_data = sandbox.to_project_sandbox()
+                
+                await client.table('projects').update({
+                    'sandbox': sandbox_data
+                }).eq('project_id', project_id).execute()
+                
+                logger.info(f"Updated workflow project {project_id} with sandbox {sandbox_id}")
+                
+            except Exception as e:
+                logger.error(f"Failed to create sandbox for workflow project {project_id}: {e}")
+                await client.table('projects').delete().eq('project_id', project_id).execute()
+                raise Exception(f"Failed to create sandbox for workflow execution: {str(e)}")
             
-        except Exception as e:
-            logger.error(f"Failed to create sandbox for workflow project {project_id}: {e}")
-            await client.table('projects').delete().eq('project_id', project_id).execute()
-            raise Exception(f"Failed to create sandbox for workflow execution: {str(e)}")
+            await progress.save(project_id=project_id)
         
         thread_data = {
             "thread_id": thread_id,
@@ -237,6 +254,7 @@ class WorkflowTriggerExecutor:
         
         await client.table('threads').insert(thread_data).execute()
         logger.info(f"Created workflow thread {thread_id} for workflow {workflow_id}")
+        await progress.save(thread_id=thread_id)
         
         return thread_id, project_id
     
@@ -510,28 +528,39 @@ class AgentTriggerExecutor:
             if not agent_config:
                 raise ValueError(f"Agent {agent_id} not found")
             
+            # Steps that completed in an earlier attempt are skipped
+            progress = await ExecutionProgress.load(trigger_event.event_id)
+            
             # Create a new thread and project for this trigger execution
-            thread_id, project_id = await self._create_trigger_thread(
-                agent_id=agent_id,
-                agent_config=agent_config,
-                trigger_event=trigger_event,
-                trigger_result=trigger_result
-            )
+            if not progress.get('thread_id'):
+                await self._create_trigger_thread(
+                    agent_id=agent_id,
+                    agent_config=agent_config,
+                    trigger_event=trigger_event,
+                    trigger_result=trigger_result,
+                    progress=progress
+                )
+            thread_id, project_id = progress.get('thread_id'), progress.get('project_id')
             
             # Create initial message with the trigger prompt
-            await self._create_initial_message(
-                thread_id=thread_id,
-                prompt=trigger_result.agent_prompt,
-                trigger_data=trigger_result.execution_variables
-            )
+            if not progress.get('message_created'):
+                await self._create_initial_message(
+                    thread_id=thread_id,
+                    prompt=trigger_result.agent_prompt,
+                    trigger_data=trigger_result.execution_variables
+                )
+                await progress.save(message_created='1')
             
             # Start agent execution in background
-            agent_run_id = await self._start_agent_execution(
-                thread_id=thread_id,
-                project_id=project_id,
-                agent_config=agent_config,
-                trigger_variables=trigger_result.execution_variables
-            )
+            agent_run_id = progress.get('agent_run_id')
+            if not agent_run_id:
+                agent_run_id = await self._start_agent_execution(
+                    thread_id=thread_id,
+                    project_id=project_id,
+                    agent_config=agent_config,
+                    trigger_variables=trigger_result.execution_variables
+                )
+                await progress.save(agent_run_id=agent_run_id)
             
             return {
                 "success": True,
@@ -549,96 +578,54 @@ class AgentTriggerExecutor:
             }
     
     async def _get_agent_config(self, agent_id: str) -> Optional[Dict[str, Any]]:
-        """Get agent configuration from database."""
-        client = await self.db.client
-        
-        # Get agent with current version
-        result = await client.table('agents').select(
-            '*, agent_versions!current_version_id(*)'
-        ).eq('agent_id', agent_id).execute()
-        
-        if not result.data:
-            return None
-        
-        agent_data = result.data[0]
-        
-        # Use version data if available
-        if agent_data.get('agent_versions'):
-            version_data = agent_data['agent_versions']
-            return {
-                'agent_id': agent_data['agent_id'],
-                'name': agent_data['name'],
-                'description': agent_data.get('description'),
-                'system_prompt': version_data['system_prompt'],
-                'configured_mcps': version_data.get('configured_mcps', []),
-                'custom_mcps': version_data.get('custom_mcps', []),
-                'agentpress_tools': version_data.get('agentpress_tools', {}),
-                'account_id': agent_data['account_id'],
-                'current_version_id': agent_data.get('current_version_id'),
-                'version_name': version_data.get('version_name', 'v1')
-            }
-        
-        return agent_data
+        """Get agent configuration from the shared agent config cache."""
+        return await get_agent_config_resolver().get_agent_config(agent_id)
     
     async def _create_trigger_thread(
         self,
         agent_id: str,
         agent_config: Dict[str, Any],
         trigger_event: TriggerEvent,
-        trigger_result: TriggerResult
+        trigger_result: TriggerResult,
+        progress: ExecutionProgress
     ) -> tuple[str, str]:
-        """Create a new thread and project for trigger execution."""
+        """Create a new thread and project for trigger execution, or only the thread if the project exists."""
         import uuid
-        from sandbox.sandbox import create_sandbox
-        
         thread_id = str(uuid.uuid4())
-        project_id = str(uuid.uuid4())
+        project_id = progress.get('project_id')
         client = await self.db.client
         
-        project_data = {
-            "project_id": project_id,
-            "account_id": agent_config['account_id'],
-            "name": f"Trigger Execution - {agent_config.get('name', 'Agent')}",
-            "description": f"Auto-created project for trigger execution from {trigger_event.trigger_type}"
-        }
-        
-        await client.table('projects').insert(project_data).execute()
-        logger.info(f"Created trigger project {project_id} for agent {agent_id}")
-        
-        try:
-            sandbox_pass = str(uuid.uuid4())
-            sandbox = await create_sandbox(sandbox_pass, project_id)
-            sandbox_id = sandbox.id
-            logger.info(f"Created sandbox {sandbox_id} for trigger project {project_id}")
-
-            vnc_link = await sandbox.get_preview_link(6080)
-            website_link = await sandbox.get_preview_link(8080)
-            vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-            website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-            token = None
-            if hasattr(vnc_link, 'token'):
-                token = vnc_link.token
-            elif "token='" in str(vnc_link):
-                token = str(vnc_link).split("token='")[1].split("'")[0]
-
-            sandbox_data = {
-                "id": sandbox_id,
-                "pass": sandbox_pass,
-                "vnc_preview": vnc_url,
-                "sandbox_url": website_url,
-                "token": token
+        if not project_id:
+            project_id = str(uuid.uuid4())
+            project_data = {
+                "project_id": project_id,
+                "account_id": agent_config['account_id'],
+                "name": f"Trigger Execution - {agent_config.get('name', 'Agent')}",
+                "description": f"Auto-created project for trigger execution from {trigger_event.trigger_type}"
             }
             
-            await client.table('projects').update({
-                'sandbox': sandbox_data
-            }).eq('project_id', project_id).execute()
+            await client.table('projects').insert(project_data).execute()
+            logger.info(f"Created trigger project {project_id} for agent {agent_id}")
             
-            logger.info(f"Updated trigger project {project_id} with sandbox {sandbox_id}")
+            try:
+                sandbox = await get_sandbox_pool().acquire(project_id)
+                sandbox_id = sandbox.id
+                logger.info(f"Got sandbox {sandbox_id} for trigger project {project_id}")
+
+                sandbox_data = sandbox.to_project_sandbox()
+                
+                await client.table('projects').update({
+                    'sandbox': sandbox_data
+                }).eq('project_id', project_id).execute()
+                
+                logger.info(f"Updated trigger project {project_id} with sandbox {sandbox_id}")
+                
+            except Exception as e:
+                logger.error(f"Failed to create sandbox for trigger project {project_id}: {e}")
+                await client.table('projects').delete().eq('project_id', project_id).execute()
+                raise Exception(f"Failed to create sandbox for trigger execution: {str(e)}")
             
-        except Exception as e:
-            logger.error(f"Failed to create sandbox for trigger project {project_id}: {e}")
-            await client.table('projects').delete().eq('project_id', project_id).execute()
-            raise Exception(f"Failed to create sandbox for trigger execution: {str(e)}")
+            await progress.save(project_id=project_id)
         
         thread_data = {
             "thread_id": thread_id,
@@ -659,6 +646,7 @@ class AgentTriggerExecutor:
         
         await client.table('threads').insert(thread_data).execute()
         logger.info(f"Created trigger thread {thread_id} for agent {agent_id}")
+        await progress.save(thread_id=thread_id)
         
         return thread_id, project_id
     
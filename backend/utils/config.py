@@ -205,7 +205,11 @@ class Configuration:
     
     # Search and other API keys
     TAVILY_API_KEY: str
+    TAVILY_URL: Optional[str] = "https://api.tavily.com"
     RAPID_API_KEY: str
+    RAPID_API_BASE_URL: Optional[str] = None  # Overrides the RapidAPI hosts, e.g. for a local mock
+    RAPID_API_RATE_LIMIT: float = 5.0  # Requests per second per RapidAPI host
+    RAPID_API_CACHE_TTL: int = 900
     CLOUDFLARE_API_TOKEN: Optional[str] = None
     FIRECRAWL_API_KEY: str
     FIRECRAWL_URL: Optional[str] = "https://api.firecrawl.dev"
@@ -228,9 +232,44 @@ class Configuration:
     LANGFUSE_PUBLIC_KEY: Optional[str] = None
     LANGFUSE_SECRET_KEY: Optional[str] = None
     LANGFUSE_HOST: str = "https://cloud.langfuse.com"
+    TRACE_EVENT_BUDGET: int = 200  # Trace events sent per run, the rest are only counted
+    TRACE_MAX_PAYLOAD_CHARS: int = 2000  # Longer trace payloads are replaced by a hash and a preview
 
     # Admin API key for server-side operations
     ADMIN_API_KEY: Optional[str] = None
+
+    # Thread message cache configuration
+    THREAD_MESSAGE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    THREAD_MESSAGE_CACHE_TTL: int = 3600
+    THREAD_MESSAGE_CACHE_REDIS: bool = False
+
+    # Context compression worker pool configuration (0 compresses on a thread)
+    CONTEXT_COMPRESSION_WORKERS: int = 2
+    CONTEXT_COMPRESSION_TIMEOUT: int = 30
+
+    # Agent config cache configuration
+    AGENT_CONFIG_CACHE_MAX_ENTRIES: int = 1024
+    AGENT_CONFIG_CACHE_TTL: int = 300
+
+    # Warm sandbox pool configuration (0 disables the pool)
+    SANDBOX_POOL_SIZE: int = 0
+    SANDBOX_POOL_MAX_IDLE: int = 600  # Below the 15 minute sandbox auto-stop interval
+
+    # Trigger event queue configuration
+    TRIGGER_QUEUE_CONCURRENCY: int = 20
+    TRIGGER_QUEUE_PER_AGENT_CONCURRENCY: int = 2
+    TRIGGER_QUEUE_PER_ACCOUNT_CONCURRENCY: int = 5
+
+    # MCP session pool configuration
+    MCP_SESSION_POOL_MAX_PER_SERVER: int = 4
+    MCP_SESSION_POOL_IDLE_TTL: int = 300
+    MCP_SCHEMA_CACHE_TTL: int = 3600 * 24
+
+    # Web scraping configuration
+    SCRAPE_CONCURRENCY: int = 10
+    SCRAPE_PER_HOST_CONCURRENCY: int = 2
+    SCRAPE_CACHE_TTL: int = 3600
+    WEB_SEARCH_CACHE_TTL: int = 3600
     
     @property
     def STRIPE_PRODUCT_ID(self) -> str:
@@ -275,6 +314,11 @@ class Configuration:
                         setattr(self, key, int(env_val))
                     except ValueError:
                         logger.warning(f"Invalid value for {key}: {env_val}, using default")
+                elif expected_type == float:
+                    try:
+                        setattr(self, key, float(env_val))
+                    except ValueError:
+                        logger.warning(f"Invalid value for {key}: {env_val}, using default")
                 elif expected_type == EnvMode:
                     # Already handled for ENV_MODE
                     pass
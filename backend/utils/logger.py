@@ -1,6 +1,33 @@
-import structlog, logging, os
+"""
+Structured logging.
+
+Log calls only filter, sample and timestamp the event on the calling thread. The event
+is then handed to a background thread through a bounded queue, which renders and writes
+it, so logging never blocks the event loop on rendering or on a slow stdout. When the
+queue is full, events are dropped and counted instead of blocking; the writer logs how
+many were dropped.
+
+Sampling keeps a fraction of events whose message starts with a configured prefix (see
+SAMPLE_RATES and the LOGGING_SAMPLE_RATES env var, a JSON object of prefix to rate),
+or of a single call with sample_rate=. Expensive fields can be wrapped in Lazy, which
+is only computed, on the writer thread, for events that are written.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import structlog
 
 ENV_MODE = os.getenv("ENV_MODE", "LOCAL")
+IS_LOCAL = ENV_MODE.lower() in ("local", "staging")
 
 # Compatibility with Python 3.10
 def get_logging_level(level_name: str) -> int:
@@ -16,17 +43,140 @@ def get_logging_level(level_name: str) -> int:
     }
     return level_mapping.get(level_name.upper(), logging.DEBUG)
 
-LOGGING_LEVEL = get_logging_level(os.getenv("LOGGING_LEVEL", "DEBUG"))
+LOGGING_LEVEL = get_logging_level(os.getenv("LOGGING_LEVEL", "DEBUG" if IS_LOCAL else "INFO"))
+# File, function and line of each call; costs a stack inspection per event
+LOGGING_CALLSITE = os.getenv("LOGGING_CALLSITE", "true" if IS_LOCAL else "false").lower() == "true"
+LOGGING_QUEUE_SIZE = int(os.getenv("LOGGING_QUEUE_SIZE", "10000"))
+DROP_REPORT_INTERVAL = 5
 
-renderer = [structlog.processors.JSONRenderer()]
-if ENV_MODE.lower() == "local".lower() or ENV_MODE.lower() == "staging".lower():
-    renderer = [structlog.dev.ConsoleRenderer()]
+# Share of events kept, by message prefix. Meant for messages logged per chunk or per call on hot paths.
+SAMPLE_RATES: Dict[str, float] = {
+    "XML tool call limit reached": 0.01,
+    **json.loads(os.getenv("LOGGING_SAMPLE_RATES", "{}")),
+}
 
-structlog.configure(
-    processors=[
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.dict_tracebacks,
+
+class Lazy:
+    """Log field computed only if the event is written, e.g. config=Lazy(lambda: summarize(config)).
+
+    The function runs on the writer thread, so it must only read data that is not
+    changed afterwards.
+    """
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+
+    def __call__(self) -> Any:
+        return self.fn()
+
+
+def _sample(_, __, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    rate = event_dict.pop("sample_rate", None)
+    if rate is None and SAMPLE_RATES:
+        event = event_dict.get("event")
+        if isinstance(event, str):
+            for prefix, prefix_rate in SAMPLE_RATES.items():
+                if event.startswith(prefix):
+                    rate = prefix_rate
+                    break
+    if rate is not None and random.random() >= rate:
+        raise structlog.DropEvent
+    return event_dict
+
+
+class _QueueWriter:
+    """Renders and writes events on a background thread."""
+
+    def __init__(self, renderer: Callable, maxsize: int):
+        self.renderer = renderer
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, logger, method_name: str, event_dict: Dict[str, Any]):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait((logger, method_name, event_dict))
+        except queue.Full:
+            self.dropped += 1
+        raise structlog.DropEvent
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child gets a fresh queue, the parent's writer thread does not exist in it
+            if self._pid is not None:
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        last_report = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=DROP_REPORT_INTERVAL)
+            except queue.Empty:
+                item = None
+            if item is False:
+                break
+            if item is not None:
+                self._write(*item)
+                # Write whatever else is queued before flushing
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is False:
+                        sys.stdout.flush()
+                        return
+                    self._write(*item)
+                sys.stdout.flush()
+
+            if self.dropped and time.monotonic() - last_report >= DROP_REPORT_INTERVAL:
+                dropped, self.dropped = self.dropped, 0
+                last_report = time.monotonic()
+                self._write(None, "warning", {
+                    "event": f"Dropped {dropped} log events, the log queue was full",
+                    "level": "warning",
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                })
+                sys.stdout.flush()
+
+    def _write(self, logger, method_name: str, event_dict: Dict[str, Any]) -> None:
+        try:
+            for key, value in event_dict.items():
+                if isinstance(value, Lazy):
+                    event_dict[key] = value()
+            line = self.renderer(logger, method_name, event_dict)
+        except Exception as e:
+            line = f"Failed to render log event {event_dict.get('event')!r}: {e}"
+        sys.stdout.write(line + "\n")
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Write the queued events and stop the writer thread."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(False, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+renderer = structlog.dev.ConsoleRenderer() if IS_LOCAL else structlog.processors.JSONRenderer()
+log_writer = _QueueWriter(renderer, LOGGING_QUEUE_SIZE)
+atexit.register(log_writer.flush)
+
+callsite_processors = []
+if LOGGING_CALLSITE:
+    callsite_processors = [
         structlog.processors.CallsiteParameterAdder(
             {
                 structlog.processors.CallsiteParameter.FILENAME,
@@ -34,9 +184,19 @@ structlog.configure(
                 structlog.processors.CallsiteParameter.LINENO,
             }
         ),
+    ]
+
+structlog.configure(
+    processors=[
+        _sample,
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.PositionalArgumentsFormatter(),
+        # Tracebacks have to be taken on the thread that logs them
+        structlog.processors.dict_tracebacks,
+        *callsite_processors,
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.contextvars.merge_contextvars,
-        *renderer,
+        log_writer,
     ],
     cache_logger_on_first_use=True,
     wrapper_class=structlog.make_filtering_bound_logger(LOGGING_LEVEL),
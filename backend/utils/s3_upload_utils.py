@@ -8,36 +8,33 @@ from datetime import datetime
 from utils.logger import logger
 from services.supabase import DBConnection
 
-async def upload_base64_image(base64_data: str, bucket_name: str = "browser-screenshots") -> str:
-    """Upload a base64 encoded image to Supabase storage and return the URL.
+def _new_image_filename(extension: str) -> str:
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    return f"image_{timestamp}_{unique_id}.{extension}"
+
+async def upload_image_bytes(image_data: bytes, content_type: str = "image/png", bucket_name: str = "browser-screenshots") -> str:
+    """Upload raw image bytes to Supabase storage and return the URL.
     
     Args:
-        base64_data (str): Base64 encoded image data (with or without data URL prefix)
+        image_data (bytes): The image
+        content_type (str): MIME type of the image
         bucket_name (str): Name of the storage bucket to upload to
         
     Returns:
         str: Public URL of the uploaded image
     """
     try:
-        # Remove data URL prefix if present
-        if base64_data.startswith('data:'):
-            base64_data = base64_data.split(',')[1]
-        
-        # Decode base64 data
-        image_data = base64.b64decode(base64_data)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"image_{timestamp}_{unique_id}.png"
+        extension = "jpg" if content_type == "image/jpeg" else content_type.split('/')[-1]
+        filename = _new_image_filename(extension)
         
         # Upload to Supabase storage
         db = DBConnection()
         client = await db.client
-        storage_response = await client.storage.from_(bucket_name).upload(
+        await client.storage.from_(bucket_name).upload(
             filename,
             image_data,
-            {"content-type": "image/png"}
+            {"content-type": content_type}
         )
         
         # Get public URL
@@ -47,5 +44,47 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         return public_url
         
     except Exception as e:
-        logger.error(f"Error uploading base64 image: {e}")
-        raise RuntimeError(f"Failed to upload image: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Error uploading image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
+
+async def upload_base64_image(base64_data: str, bucket_name: str = "browser-screenshots") -> str:
+    """Upload a base64 encoded image to Supabase storage and return the URL.
+    
+    Args:
+        base64_data (str): Base64 encoded image data (with or without data URL prefix)
+        bucket_name (str): Name of the storage bucket to upload to
+        
+    Returns:
+        str: Public URL of the uploaded image
+    """
+    # Remove data URL prefix if present
+    if base64_data.startswith('data:'):
+        base64_data = base64_data.split(',')[1]
+    
+    try:
+        image_data = base64.b64decode(base64_data)
+    except Exception as e:
+        logger.error(f"Error decoding base64 image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
+    return await upload_image_bytes(image_data, "image/png", bucket_name)
+
+async def create_image_upload_url(content_type: str = "image/jpeg", bucket_name: str = "browser-screenshots") -> tuple[str, str]:
+    """Create a signed url a sandbox can upload an image to without storage credentials.
+    
+    Args:
+        content_type (str): MIME type of the image that will be uploaded
+        bucket_name (str): Name of the storage bucket to upload to
+        
+    Returns:
+        tuple[str, str]: (signed upload URL, public URL the image will have)
+    """
+    extension = "jpg" if content_type == "image/jpeg" else content_type.split('/')[-1]
+    filename = _new_image_filename(extension)
+    
+    db = DBConnection()
+    client = await db.client
+    bucket = client.storage.from_(bucket_name)
+    signed = await bucket.create_signed_upload_url(filename)
+    upload_url = signed.get("signed_url") or signed.get("signedUrl")
+    public_url = await bucket.get_public_url(filename)
+    return upload_url, public_url